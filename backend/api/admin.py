@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Campaign, CampaignAdSet, AdsetStatus
+from .models import Campaign, CampaignAdSet, AdsetStatus, GeoCpcStats
 # Register your models here.
 
 
@@ -9,6 +9,8 @@ admin.site.register(CampaignAdSet)
 
 admin.site.register(AdsetStatus)
 
+admin.site.register(GeoCpcStats)
+
 admin.site.site_header = "Ads Recomendations Admin"
 admin.site.site_title = "My Custom Admin Portal"
 admin.site.index_title = "Welcome to My Dashboard"
\ No newline at end of file
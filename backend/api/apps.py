@@ -5,6 +5,8 @@ class ApiConfig(AppConfig):
     name = "api"
 
     def ready(self):
+        from api import signals  # noqa: F401
+
         # Import scheduler so it starts when Django starts
         try:
             from api.utills import scheduler
@@ -0,0 +1,220 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from api.utills.pipeline import (
+    today_amsterdam,
+    parse_date_range,
+    build_report_payload,
+    daily_report_payload,
+    fetch_report_async,
+    new_run_id,
+    save_raw_report,
+    clean_report,
+    aggregate_date_range,
+    run_live_inference,
+    register_new_adsets,
+    load_status_map,
+    enrich_results,
+    enrich_model_path,
+    group_processed_data,
+    build_summary,
+    campaign_body,
+)
+from api.utills.singleflight import flight_key, coalesce_async
+from api.utills.result_cache import result_key, status_generation, get_result, put_result
+from api.utills.incremental import get_state, keep_state, state_results
+from api.utills.query import CampaignQuery, QueryParamError
+from api.utills.metrics import metrics_view, stage
+
+
+# Clustering/enrichment is CPU bound; it runs on this bounded pool so the event
+# loop only ever waits on the tracker and the database.
+pipeline_executor = ThreadPoolExecutor(
+    max_workers=settings.PIPELINE_EXECUTOR_WORKERS,
+    thread_name_prefix='pipeline',
+)
+
+
+def json_response(body, status_code=status.HTTP_200_OK):
+    with stage('render') as s:
+        response = JsonResponse(body, status=status_code, encoder=JSONEncoder)
+        s.bytes = len(response.content)
+    return response
+
+
+async def run_in_pipeline(func, *args):
+    loop = asyncio.get_running_loop()
+    # run_in_executor does not propagate contextvars (metrics view label)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(pipeline_executor, partial(context.run, func, *args))
+
+
+async def authenticate(request):
+    """
+    JWT authentication for plain async Django views (DRF's APIView is sync only).
+    Returns an error message, or None once ``request.user`` is set.
+    """
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return str(e.detail.get('detail', e.detail) if isinstance(e.detail, dict) else e.detail)
+    if result is None:
+        return "Authentication credentials were not provided."
+    request.user = result[0]
+    return None
+
+
+def enrich_groups(query, data, model_path=None):
+    output = group_processed_data(data)
+    final_results, pagination = enrich_results(query, output, model_path=model_path)
+    return final_results, build_summary(data), pagination
+
+
+def build_daily_state(rows, fingerprint, run_id, model_path):
+    df = clean_report(rows)
+    return keep_state(fingerprint, run_live_inference(df, 'preprocess_data', run_id, model_path), model_path)
+
+
+def build_date_range_results(rows, query, run_id, model_path):
+    df = aggregate_date_range(clean_report(rows, dedupe=False))
+    data = run_live_inference(df, 'preprocess_data_time_range', run_id, model_path)
+    return enrich_groups(query, data, model_path)
+
+
+class AsyncStageMetricsMixin:
+    """Async counterpart of StageMetricsMixin (labels stages, times render)."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        with metrics_view(type(self).__name__):
+            return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncPredictCampaignsDailyView(AsyncStageMetricsMixin, View):
+    """
+    Async variant of PredictCampaignsDailyView for the ASGI entry point. The
+    tracker call and the AdsetStatus lookup run concurrently and the worker is
+    free to serve other requests while they are in flight. Identical requests
+    in flight at the same time share one run.
+    """
+
+    async def build(self, day, query):
+        # Read before the statuses, so a change in between misses next time
+        generation = await sync_to_async(status_generation)()
+        # One model version for the whole response, even across a hot-swap
+        model_path = enrich_model_path()
+        payload = await sync_to_async(daily_report_payload)(day)
+
+        data, status_map = await asyncio.gather(
+            fetch_report_async(payload),
+            sync_to_async(load_status_map)(),
+        )
+        rows = data.get('rows', [])
+        if not rows:
+            return {'success': True, 'data': [], 'summary': {}}
+
+        key = result_key('prediction-daily', day, day, query.key(), data['fingerprint'], generation, model_path)
+        body = await sync_to_async(get_result)(key, view=type(self).__name__)
+        if body is not None:
+            return body
+
+        state = get_state(data['fingerprint'], model_path)
+        if state is None:
+            run_id = new_run_id()
+            save_raw_report(data, run_id)
+
+            await sync_to_async(register_new_adsets)(rows)
+            state = await run_in_pipeline(build_daily_state, rows, data['fingerprint'], run_id, model_path)
+
+        # Adsets registered just now are created active
+        for row in rows:
+            if row.get('sub_id_2'):
+                status_map.setdefault(row['sub_id_2'], 'active')
+
+        result = await run_in_pipeline(state_results, state, status_map, query)
+        body = campaign_body(*result)
+        await sync_to_async(put_result)(key, body)
+        return body
+
+    async def get(self, request):
+        error = await authenticate(request)
+        if error:
+            return json_response({'detail': error}, status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            query = CampaignQuery(request.GET)
+        except QueryParamError as e:
+            return json_response({'success': False, 'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            now_amsterdam = today_amsterdam()
+            key = flight_key('prediction-daily', now_amsterdam, now_amsterdam, query.key())
+            body = await coalesce_async(key, lambda: self.build(now_amsterdam, query), view=type(self).__name__)
+            return json_response(body)
+
+        except httpx.HTTPError as e:
+            return json_response({'success': False, 'error': f'API request failed: {str(e)}'}, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        except Exception as e:
+            return json_response({'success': False, 'error': str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncPredictDateRangeView(AsyncStageMetricsMixin, View):
+    """Async variant of PredictDateRangeView for the ASGI entry point."""
+
+    async def build(self, start_date, end_date, query):
+        model_path = enrich_model_path()
+        data = await fetch_report_async(build_report_payload(start_date, end_date))
+        rows = data.get('rows', [])
+        if not rows:
+            return {'success': True, 'data': [], 'summary': {}}
+
+        key = result_key('predict-date-range', start_date, end_date, query.key(), data['fingerprint'], model_path=model_path)
+        body = await sync_to_async(get_result)(key, view=type(self).__name__)
+        if body is not None:
+            return body
+
+        run_id = new_run_id()
+        save_raw_report(data, run_id)
+
+        result = await run_in_pipeline(build_date_range_results, rows, query, run_id, model_path)
+        body = campaign_body(*result)
+        await sync_to_async(put_result)(key, body)
+        return body
+
+    async def get(self, request):
+        error = await authenticate(request)
+        if error:
+            return json_response({'detail': error}, status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            query = CampaignQuery(request.GET)
+        except QueryParamError as e:
+            return json_response({'success': False, 'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start_date, end_date = parse_date_range(request.GET)
+        except ValueError:
+            return json_response({"success": False, "error": "Invalid date format. Use YYYY-MM-DD."}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            key = flight_key('predict-date-range', start_date, end_date, query.key())
+            body = await coalesce_async(key, lambda: self.build(start_date, end_date, query), view=type(self).__name__)
+            return json_response(body)
+
+        except httpx.HTTPError as e:
+            return json_response({'success': False, 'error': f'API request failed: {str(e)}'}, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        except Exception as e:
+            return json_response({'success': False, 'error': str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
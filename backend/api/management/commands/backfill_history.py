@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utills.history import HISTORY_STORES, fold_finished_day
+from api.utills.pipeline import finished_day
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold finished tracker days into the per-geo CPC reference (GeoCpcStats) "
+        "and the per-adset trends (AdsetTrend), oldest day first. Days a store "
+        "already holds are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help="Finished days to fold in, counting back from yesterday")
+        parser.add_argument('--stores', default=','.join(HISTORY_STORES),
+                            help=f"Comma separated stores ({', '.join(HISTORY_STORES)})")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError("--days must be >= 1")
+        stores = [store.strip() for store in options['stores'].split(',') if store.strip()]
+        unknown = set(stores) - set(HISTORY_STORES)
+        if unknown:
+            raise CommandError(f"Unknown store(s): {', '.join(sorted(unknown))}")
+        last = finished_day()
+        for offset in range(options['days'] - 1, -1, -1):
+            day = last - timedelta(days=offset)
+            updated = fold_finished_day(day, stores)
+            counts = ', '.join(f"{store} {count}" for store, count in updated.items()) or 'nothing to do'
+            self.stdout.write(f"{day:%Y-%m-%d}: {counts}")
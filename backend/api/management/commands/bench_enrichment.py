@@ -0,0 +1,136 @@
+import json
+import os
+import pickle
+import platform
+import statistics
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.bench_pipeline import git_commit, parse_size
+from api.utills.combine_inference import enrich_campaign_data
+from api.utills.enrich_pool import EnrichmentPool, encode_shard, enrich_campaigns
+from api.utills.live_inference import infer_frame
+from api.utills.pipeline import clean_report, enrich_model_path, group_processed_data
+from api.utills.schema import to_records
+from api.utills.synthetic import synthetic_report
+
+
+def without_ids(campaigns):
+    # group_processed_data() gives every campaign a fresh uuid
+    return [{key: value for key, value in campaign.items() if key != 'id'} for campaign in campaigns]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the enrichment of every campaign of a synthetic report in "
+        "this process and on enrichment pools of 1..N processes, and write "
+        "the timings to a JSON file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', default='20k', help="Report rows, k/m suffixes allowed")
+        parser.add_argument('--processes', help="Comma separated pool sizes (default: 1..cpu count)")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per pool size; min and median are reported")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Results file (default: benchmarks/enrichment-<timestamp>.json)")
+
+    def handle(self, *args, **options):
+        model_path = enrich_model_path()
+        if not os.path.exists(model_path):
+            raise CommandError(f"Model bundle not found: {model_path}")
+        if options['processes']:
+            process_counts = [int(n) for n in options['processes'].split(',') if n.strip()]
+        else:
+            process_counts = list(range(1, (os.cpu_count() or 1) + 1))
+        if not process_counts or min(process_counts) < 1:
+            raise CommandError("--processes must be >= 1")
+
+        n_rows = parse_size(options['size'])
+        groups = group_processed_data(to_records(infer_frame(
+            clean_report(synthetic_report(n_rows, seed=options['seed'])['rows']), model_path,
+        )))
+        adsets = sum(len(group['adset']) for group in groups)
+        payload = encode_shard(groups)
+        self.stdout.write(
+            f"{n_rows:,} rows: {len(groups):,} campaigns, {adsets:,} adsets; payload "
+            f"{len(payload[0]) + len(pickle.dumps(payload[1:])):,} bytes "
+            f"(pickled dicts {len(pickle.dumps(groups)):,})"
+        )
+
+        def timed(enrich):
+            runs = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                enriched = enrich()
+                runs.append(time.perf_counter() - started)
+            return runs, enriched
+
+        inline_runs, expected = timed(lambda: [enrich_campaign_data(group, model_path=model_path) for group in groups])
+        inline = statistics.median(inline_runs)
+        results = [{'processes': 0, 'mode': 'inline', **self.timing(inline_runs, inline)}]
+        self.print_result(results[-1])
+
+        for processes in process_counts:
+            pool = EnrichmentPool(processes, model_path)
+            try:
+                # Start the workers (and load the model) outside the timings
+                started = time.perf_counter()
+                enrich_campaigns(groups[:processes], model_path, pool=pool, min_adsets=0)
+                startup = time.perf_counter() - started
+                runs, enriched = timed(lambda: enrich_campaigns(groups, model_path, pool=pool, min_adsets=0))
+            finally:
+                pool.close()
+            results.append({
+                'processes': processes,
+                'mode': 'pool',
+                'startup_seconds': round(startup, 3),
+                **self.timing(runs, inline),
+                'matches_inline': without_ids(enriched) == without_ids(expected),
+            })
+            self.print_result(results[-1])
+
+        output = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'rows': n_rows,
+            'campaigns': len(groups),
+            'adsets': adsets,
+            'repeat': options['repeat'],
+            'seed': options['seed'],
+            'model': os.path.basename(model_path),
+            'results': results,
+        }
+        path = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"enrichment-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(output, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {path}"))
+
+    @staticmethod
+    def timing(runs, inline):
+        median = statistics.median(runs)
+        return {
+            'min': round(min(runs), 6),
+            'median': round(median, 6),
+            'runs': [round(value, 6) for value in runs],
+            'speedup': round(inline / median, 2) if median else None,
+        }
+
+    def print_result(self, result):
+        name = 'in process' if result['mode'] == 'inline' else f"{result['processes']} process(es)"
+        line = f"  {name:<14} median {result['median']:>9.3f}s  min {result['min']:>9.3f}s  {result['speedup']:.2f}x"
+        if result['mode'] == 'pool':
+            line += f"  (startup {result['startup_seconds']:.2f}s)"
+            if not result['matches_inline']:
+                line += "  RESULTS DIFFER"
+        self.stdout.write(line)
@@ -0,0 +1,267 @@
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sklearn
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from api.utills.combine_inference import enrich_campaign_data
+from api.utills.live_inference import DBSCANCampaignInference
+from api.utills.metrics import collect_stages
+from api.utills.pipeline import (
+    clean_report,
+    save_raw_report,
+    register_new_adsets,
+    enrich_model_path,
+    group_processed_data,
+    build_summary,
+)
+from api.utills.schema import to_records
+from api.utills.snapshots import new_run_id, write_snapshot
+from api.utills.synthetic import synthetic_report
+
+
+STAGES = ['clean', 'geo', 'inference', 'cpc_level', 'grouping', 'enrichment', 'persistence', 'render']
+# A stage this much slower (median) than in --compare is flagged
+REGRESSION_RATIO = 1.2
+
+
+def parse_size(value):
+    value = value.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    if multiplier > 1:
+        value = value[:-1]
+    try:
+        return int(float(value) * multiplier)
+    except ValueError:
+        raise CommandError(f"Invalid size '{value}'")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def frame_mb(df):
+    return round(df.memory_usage(deep=True).sum() / 2 ** 20, 1)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every prediction pipeline stage on synthetic tracker reports "
+        "and write the timings to a JSON file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1k,10k,100k',
+                            help="Comma separated row counts, k/m suffixes allowed (e.g. 1k,10k,100k,1m)")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per size; min and median are reported")
+        parser.add_argument('--skip', default='', help="Comma separated stages to skip (e.g. enrichment for 1m)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Results file (default: benchmarks/pipeline-<timestamp>.json)")
+        parser.add_argument('--compare', help="Earlier results file to compare the medians against")
+
+    def handle(self, *args, **options):
+        sizes = [parse_size(size) for size in options['sizes'].split(',') if size.strip()]
+        skip = {name.strip() for name in options['skip'].split(',') if name.strip()}
+        unknown = skip - set(STAGES)
+        if unknown:
+            raise CommandError(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+        if not os.path.exists(enrich_model_path()):
+            raise CommandError(f"Model bundle not found: {enrich_model_path()}")
+
+        results = []
+        for n_rows in sizes:
+            started = time.perf_counter()
+            report = synthetic_report(n_rows, seed=options['seed'])
+            generate_seconds = time.perf_counter() - started
+
+            runs = []
+            for _ in range(options['repeat']):
+                runs.append(self.run_once(report, skip))
+
+            result = self.summarize(n_rows, generate_seconds, runs)
+            results.append(result)
+            self.print_result(result)
+
+        output = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'sklearn': sklearn.__version__,
+            },
+            'repeat': options['repeat'],
+            'seed': options['seed'],
+            'skipped': sorted(skip),
+            'results': results,
+        }
+
+        path = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"pipeline-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(output, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {path}"))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def run_once(self, report, skip):
+        """One pass over the pipeline; returns {stage: seconds} and row counts."""
+        timings = dict.fromkeys(STAGES, 0.0)
+        counts = {}
+
+        @contextmanager
+        def timed(name):
+            started = time.perf_counter()
+            yield
+            timings[name] += time.perf_counter() - started
+
+        rows = report['rows']
+        with collect_stages() as stages:
+            df = clean_report(rows)
+            counts['clean_rows'] = len(df)
+            counts['report_mb'] = frame_mb(df)
+
+            if 'inference' not in skip:
+                # DBSCANCampaignInference.run_inference() split so add_cpc_level
+                # is timed on its own; the JSON round trip mirrors main()
+                inference = DBSCANCampaignInference(enrich_model_path())
+                with timed('inference'):
+                    df_processed, X = inference.build_features(df.copy())
+                    labels, recommendations = inference.assign_clusters(df_processed, X)
+                    df_result = inference.generate_recommendations(df_processed, labels, recommendations)
+                if 'cpc_level' not in skip:
+                    with timed('cpc_level'):
+                        df_result = inference.add_cpc_level(df_result, cpc_col='cpc', geo_col='geo')
+                counts['result_mb'] = frame_mb(df_result)
+                with timed('inference'):
+                    data = to_records(df_result)
+            else:
+                data = to_records(df.assign(conversion_rate=0.0, priority=99))
+
+            output = group_processed_data(data) if 'grouping' not in skip else []
+            counts['campaigns'] = len(output)
+
+            enriched = output
+            if 'enrichment' not in skip:
+                model_path = enrich_model_path()
+                with timed('enrichment'):
+                    enriched = [enrich_campaign_data(group, model_path=model_path) for group in output]
+
+        for name, seconds, _, _ in stages:
+            if name in timings:
+                timings[name] += seconds
+
+        if 'persistence' not in skip:
+            with timed('persistence'):
+                self.persist(report, df_result if 'inference' not in skip else df)
+
+        if 'render' not in skip:
+            with timed('render'):
+                body = JSONRenderer().render({'success': True, 'data': enriched, 'summary': build_summary(data)})
+            counts['response_bytes'] = len(body)
+
+        for name in skip:
+            timings.pop(name, None)
+        return {'stages': timings, 'counts': counts}
+
+    @staticmethod
+    def persist(report, df_result):
+        # The writes a live request makes (raw report and result snapshots),
+        # into a scratch directory and waited for; the AdsetStatus inserts are
+        # rolled back
+        with tempfile.TemporaryDirectory() as tmp, override_settings(SNAPSHOT_DIR=tmp):
+            run_id = new_run_id()
+            pending = [
+                save_raw_report(report, run_id),
+                write_snapshot('result', run_id, df_result),
+            ]
+            with transaction.atomic():
+                register_new_adsets(report['rows'])
+                transaction.set_rollback(True)
+            for future in pending:
+                future.result()
+
+    @staticmethod
+    def summarize(n_rows, generate_seconds, runs):
+        stages = {}
+        for name in runs[0]['stages']:
+            values = [run['stages'][name] for run in runs]
+            stages[name] = {
+                'min': round(min(values), 6),
+                'median': round(statistics.median(values), 6),
+                'runs': [round(value, 6) for value in values],
+            }
+        totals = [sum(run['stages'].values()) for run in runs]
+        return {
+            'rows': n_rows,
+            **runs[0]['counts'],
+            'generate_seconds': round(generate_seconds, 6),
+            'stages': stages,
+            'total': {'min': round(min(totals), 6), 'median': round(statistics.median(totals), 6)},
+            'peak_rss_mb': peak_rss_mb(),
+            'rows_per_second': round(n_rows / statistics.median(totals), 1) if min(totals) > 0 else None,
+        }
+
+    def print_result(self, result):
+        self.stdout.write(f"\n{result['rows']:,} rows ({result.get('campaigns', 0):,} campaigns), "
+                          f"peak RSS {result['peak_rss_mb']} MB")
+        if 'report_mb' in result:
+            self.stdout.write(f"  report frame {result['report_mb']} MB, inference result {result.get('result_mb', '-')} MB")
+        for name, timing in result['stages'].items():
+            self.stdout.write(f"  {name:<12} median {timing['median']:>10.4f}s  min {timing['min']:>10.4f}s")
+        self.stdout.write(f"  {'total':<12} median {result['total']['median']:>10.4f}s")
+
+    def compare(self, path, results):
+        with open(path) as f:
+            previous = {result['rows']: result for result in json.load(f)['results']}
+
+        self.stdout.write(f"\nCompared with {path} (median, new/old):")
+        regressions = 0
+        for result in results:
+            old = previous.get(result['rows'])
+            if old is None:
+                continue
+            for name, timing in result['stages'].items():
+                old_timing = old['stages'].get(name)
+                if not old_timing or not old_timing['median']:
+                    continue
+                ratio = timing['median'] / old_timing['median']
+                line = f"  {result['rows']:>9,} {name:<12} {ratio:6.2f}x"
+                if ratio > REGRESSION_RATIO:
+                    regressions += 1
+                    self.stdout.write(self.style.WARNING(line + "  slower"))
+                else:
+                    self.stdout.write(line)
+        if regressions:
+            self.stdout.write(self.style.WARNING(f"{regressions} stage(s) more than {REGRESSION_RATIO}x slower"))
@@ -0,0 +1,252 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.bench_pipeline import git_commit
+
+
+ENDPOINTS = {
+    'prediction-daily': ('GET', '/api/prediction-daily/'),
+    'predict-date-range': ('GET', '/api/predict-date-range/'),
+    'update-adset-status': ('POST', '/api/update-adset-status/'),
+}
+DEFAULT_MIX = 'prediction-daily=5,predict-date-range=3,update-adset-status=2'
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise CommandError(f"Unknown endpoint '{name}' (choose from {', '.join(ENDPOINTS)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight in '{part}'")
+    return mix
+
+
+def process_rss_mb(pid):
+    """RSS of ``pid`` and its children (gunicorn workers), from /proc."""
+    total_kb = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return round(total_kb / 1024, 1)
+
+
+def latency_stats(samples, elapsed):
+    latencies = np.array([sample[1] for sample in samples]) * 1000 if samples else np.zeros(0)
+    errors = sum(1 for sample in samples if not sample[2])
+    stats = {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0,
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0,
+    }
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        stats.update({
+            'latency_ms': {
+                'mean': round(float(latencies.mean()), 1),
+                'p50': round(float(p50), 1),
+                'p95': round(float(p95), 1),
+                'p99': round(float(p99), 1),
+                'max': round(float(latencies.max()), 1),
+            }
+        })
+    return stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the prediction endpoints of a running server at a fixed concurrency "
+        "and report throughput, latency percentiles, error rate and server RSS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--username', default=os.getenv('LOADTEST_USERNAME'))
+        parser.add_argument('--password', default=os.getenv('LOADTEST_PASSWORD'))
+        parser.add_argument('--concurrency', type=int, default=10, help="Simulated dashboard users")
+        parser.add_argument('--duration', type=float, default=60, help="Seconds to run")
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Endpoint weights (default {DEFAULT_MIX})")
+        parser.add_argument('--days', type=int, default=7, help="Range used for predict-date-range")
+        parser.add_argument('--timeout', type=float, default=120)
+        parser.add_argument('--server-pid', type=int, help="Sample RSS of this process and its children")
+        parser.add_argument('--sample-interval', type=float, default=1.0)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Artifact path (default: benchmarks/loadtest-<timestamp>.json)")
+
+    def handle(self, *args, **options):
+        if not options['username'] or not options['password']:
+            raise CommandError("--username/--password (or LOADTEST_USERNAME/LOADTEST_PASSWORD) are required")
+        mix = parse_mix(options['mix'])
+        base_url = options['base_url'].rstrip('/')
+        end_day = date.today()
+        range_params = {
+            'start_date': (end_day - timedelta(days=options['days'] - 1)).isoformat(),
+            'end_date': end_day.isoformat(),
+        }
+
+        tokens = [self.obtain_token(base_url, options) for _ in range(options['concurrency'])]
+        # Active adsets from a prediction-daily response; update-adset-status
+        # re-posts them as active, which leaves the data unchanged
+        known_adsets = self.warm_up(base_url, tokens[0], options['timeout'])
+
+        samples = []
+        samples_lock = threading.Lock()
+        timeline = []
+        stop = threading.Event()
+        started = time.perf_counter()
+        deadline = started + options['duration']
+
+        def worker(index):
+            rng = random.Random(options['seed'] + index)
+            session = requests.Session()
+            session.headers['Authorization'] = f"Bearer {tokens[index]}"
+            names, weights = list(mix), list(mix.values())
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                method, path = ENDPOINTS[name]
+                kwargs = {'timeout': options['timeout']}
+                if name == 'predict-date-range':
+                    kwargs['params'] = range_params
+                elif name == 'update-adset-status':
+                    if not known_adsets:
+                        continue
+                    kwargs['json'] = {'adset_id': rng.choice(known_adsets), 'is_active': True}
+
+                request_started = time.perf_counter()
+                try:
+                    response = session.request(method, base_url + path, **kwargs)
+                    ok = response.status_code < 400
+                except requests.RequestException:
+                    ok = False
+                finished = time.perf_counter()
+                with samples_lock:
+                    samples.append((name, finished - request_started, ok, finished - started))
+
+        def sampler():
+            while not stop.is_set():
+                with samples_lock:
+                    completed = len(samples)
+                    errors = sum(1 for sample in samples if not sample[2])
+                point = {
+                    't': round(time.perf_counter() - started, 2),
+                    'completed': completed,
+                    'errors': errors,
+                }
+                if options['server_pid']:
+                    point['server_rss_mb'] = process_rss_mb(options['server_pid'])
+                timeline.append(point)
+                stop.wait(options['sample_interval'])
+
+        sampler_thread = threading.Thread(target=sampler, daemon=True)
+        sampler_thread.start()
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(options['concurrency'])]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        sampler_thread.join()
+
+        by_endpoint = defaultdict(list)
+        for sample in samples:
+            by_endpoint[sample[0]].append(sample)
+
+        rss = [point['server_rss_mb'] for point in timeline if 'server_rss_mb' in point]
+        artifact = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'config': {
+                'base_url': base_url,
+                'concurrency': options['concurrency'],
+                'duration': options['duration'],
+                'mix': mix,
+                'range': range_params,
+                'seed': options['seed'],
+            },
+            'elapsed_seconds': round(elapsed, 2),
+            'overall': latency_stats(samples, elapsed),
+            'endpoints': {name: latency_stats(items, elapsed) for name, items in sorted(by_endpoint.items())},
+            'server_rss_mb': {'start': rss[0], 'peak': max(rss), 'end': rss[-1]} if rss else None,
+            'timeline': timeline,
+        }
+
+        path = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(artifact, f, indent=2)
+
+        self.print_report(artifact)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {path}"))
+
+    @staticmethod
+    def obtain_token(base_url, options):
+        response = requests.post(
+            f"{base_url}/auth/token/",
+            json={'username': options['username'], 'password': options['password']},
+            timeout=options['timeout'],
+        )
+        if response.status_code != 200:
+            raise CommandError(f"auth/token/ returned {response.status_code}: {response.text[:200]}")
+        return response.json()['access']
+
+    def warm_up(self, base_url, token, timeout):
+        response = requests.get(
+            base_url + ENDPOINTS['prediction-daily'][1],
+            headers={'Authorization': f"Bearer {token}"},
+            timeout=timeout,
+        )
+        if response.status_code >= 400:
+            raise CommandError(f"Warm-up request failed with {response.status_code}: {response.text[:200]}")
+        return self.adset_ids(response)
+
+    @staticmethod
+    def adset_ids(response):
+        try:
+            campaigns = response.json().get('data', [])
+        except ValueError:
+            return []
+        return [adset['sub_id_2'] for campaign in campaigns for adset in campaign.get('adset', []) if adset.get('sub_id_2')]
+
+    def print_report(self, artifact):
+        def line(name, stats):
+            latency = stats.get('latency_ms', {})
+            return (f"  {name:<22} {stats['requests']:>7} req  {stats['throughput_rps']:>8.2f} rps  "
+                    f"p50 {latency.get('p50', 0):>8.1f}  p95 {latency.get('p95', 0):>8.1f}  "
+                    f"p99 {latency.get('p99', 0):>8.1f} ms  errors {stats['error_rate']:.2%}")
+
+        self.stdout.write(f"{artifact['config']['concurrency']} users for {artifact['elapsed_seconds']}s")
+        for name, stats in artifact['endpoints'].items():
+            self.stdout.write(line(name, stats))
+        self.stdout.write(line('overall', artifact['overall']))
+        if artifact['server_rss_mb']:
+            rss = artifact['server_rss_mb']
+            self.stdout.write(f"  server RSS {rss['start']} MB -> peak {rss['peak']} MB, end {rss['end']} MB")
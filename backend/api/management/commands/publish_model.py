@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utills.model_store import ModelStoreError, current_version, list_versions, publish
+
+
+class Command(BaseCommand):
+    help = (
+        "Make a stored model version the one every worker serves. The bundle is "
+        "warmed up here first; workers swap to it within MODEL_CHECK_INTERVAL. "
+        "Publishing an older version rolls back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('version', nargs='?', help="Version to serve (default: the newest stored one)")
+        parser.add_argument('--list', action='store_true', help="List the stored versions and exit")
+
+    def handle(self, *args, **options):
+        versions = list_versions()
+        current = current_version()
+        if options['list']:
+            for version in versions:
+                self.stdout.write(f"{'*' if version == current else ' '} {version}")
+            if current not in versions:
+                self.stdout.write(f"* {current}")
+            return
+
+        version = options['version'] or (versions[-1] if versions else None)
+        if version is None:
+            raise CommandError("No stored model versions; run `manage.py train_model` first")
+        try:
+            seconds = publish(version)
+        except ModelStoreError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Serving {version} (was {current}); warmup took {seconds:.2f}s"))
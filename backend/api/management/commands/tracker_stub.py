@@ -0,0 +1,257 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utills.synthetic import synthetic_report
+
+
+REPORT_PATH = '/admin_api/v1/report/build'
+STATUS_PATH = '/api/adset/status/'
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _numeric(compare):
+    def build(expression):
+        bound = _number(expression)
+        return lambda value: bound is not None and _number(value) is not None and compare(_number(value), bound)
+    return build
+
+
+def _in_list(negate):
+    def build(expression):
+        members = {str(e) for e in expression or []}
+        return lambda value: (str(value) in members) != negate
+    return build
+
+
+def _regexp(expression):
+    pattern = re.compile(expression)
+    return lambda value: pattern.search(str(value or '')) is not None
+
+
+# Report filter operators: each builds a predicate from the expression
+FILTER_OPERATORS = {
+    'EQUALS': lambda expression: lambda value: str(value) == str(expression),
+    'NOT_EQUAL': lambda expression: lambda value: str(value) != str(expression),
+    'IN_LIST': _in_list(negate=False),
+    'NOT_IN_LIST': _in_list(negate=True),
+    'CONTAINS': lambda expression: lambda value: str(expression).lower() in str(value or '').lower(),
+    'MATCH_REGEXP': _regexp,
+    'GREATER_THAN': _numeric(lambda value, bound: value > bound),
+    'LESS_THAN': _numeric(lambda value, bound: value < bound),
+    'EQUALS_OR_GREATER_THAN': _numeric(lambda value, bound: value >= bound),
+    'EQUALS_OR_LESS_THAN': _numeric(lambda value, bound: value <= bound),
+}
+
+
+def filter_rows(rows, filters):
+    """
+    Rows matching every ``{'name', 'operator', 'expression'}`` filter of a
+    report payload. Raises ValueError for an operator the stub does not know.
+    """
+    checks = []
+    for spec in filters:
+        build = FILTER_OPERATORS.get(spec.get('operator'))
+        if build is None:
+            raise ValueError(f"Unsupported filter operator {spec.get('operator')!r}")
+        checks.append((spec.get('name'), build(spec.get('expression'))))
+    if not checks:
+        return rows
+    return [row for row in rows if all(matches(row.get(name)) for name, matches in checks)]
+
+
+def load_rows(path):
+    """Rows from a recorded tracker body ({'rows': [...]}) or a bare list of rows."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    rows = data.get('rows', []) if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        raise CommandError(f"{path} has no list of rows")
+    return rows
+
+
+class StubConfig:
+    def __init__(self, rows, latency, jitter, error_rate, throttle_rate, paused_share, api_key, seed):
+        self.rows = rows
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.paused_share = paused_share
+        self.api_key = api_key
+        self.random = random.Random(seed)
+        self.requests = 0
+        # Filtered row lists by filter JSON, so paging does not re-filter
+        self.filtered = {}
+        self.filtered_lock = threading.Lock()
+
+    def rows_for(self, filters):
+        key = json.dumps(filters, sort_keys=True)
+        with self.filtered_lock:
+            rows = self.filtered.get(key)
+        if rows is None:
+            rows = filter_rows(self.rows, filters)
+            with self.filtered_lock:
+                if len(self.filtered) >= 16:
+                    self.filtered.clear()
+                self.filtered[key] = rows
+        return rows
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Serves ``POST /admin_api/v1/report/build`` (payload filters, then
+    limit/offset paging over the configured rows) and
+    ``GET /api/adset/status/<id>`` like the live APIs.
+    """
+
+    config = None
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != REPORT_PATH:
+            return self.send_json(404, {'error': 'Not found'})
+        if not self.admit(check_key=True):
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self.send_json(400, {'error': 'Invalid JSON'})
+
+        try:
+            rows = self.config.rows_for(payload.get('filters') or [])
+        except (ValueError, re.error) as e:
+            return self.send_json(400, {'error': str(e)})
+        offset = int(payload.get('offset') or 0)
+        limit = int(payload.get('limit') or len(rows))
+        self.send_json(200, {
+            'rows': rows[offset:offset + limit],
+            'total': len(rows),
+            'meta': {'body': 0, 'count': 0},
+        })
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if not path.startswith(STATUS_PATH):
+            return self.send_json(404, {'error': 'Not found'})
+        if not self.admit(check_key=False):
+            return
+
+        adset_id = path[len(STATUS_PATH):].strip('/')
+        # Stable per adset so repeated scheduler runs agree
+        paused = (zlib.crc32(adset_id.encode()) % 10000) / 10000 < self.config.paused_share
+        self.send_json(200, {'adset_id': adset_id, 'status': 'PAUSED' if paused else 'ACTIVE'})
+
+    def admit(self, check_key):
+        """Apply latency and fault injection; False when an error was sent."""
+        config = self.config
+        config.requests += 1
+        delay = config.latency + config.random.uniform(-config.jitter, config.jitter)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        if check_key and config.api_key and self.headers.get('Api-Key') != config.api_key:
+            self.send_json(401, {'error': 'Invalid Api-Key'})
+            return False
+        roll = config.random.random()
+        if roll < config.throttle_rate:
+            self.send_json(429, {'error': 'Too Many Requests'}, {'Retry-After': '1'})
+            return False
+        if roll < config.throttle_rate + config.error_rate:
+            self.send_json(500, {'error': 'Injected failure'})
+            return False
+        return True
+
+    def send_json(self, code, body, headers=None):
+        content = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the tracker report API and the adset status API. "
+        "Point the app at it with TRACKER_BASE_URL=http://<host>:<port>/admin_api/v1 "
+        "and ADSET_STATUS_API_BASE=http://<host>:<port>/api/adset/status/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--source', action='append',
+                            help="Recorded rows to replay (repeatable); default api_response.json")
+        parser.add_argument('--rows', type=int, help="Serve a synthetic report of this many rows instead")
+        parser.add_argument('--days', type=int, default=1, help="Days covered by the synthetic report")
+        parser.add_argument('--latency', type=float, default=0, help="Added latency per request (ms)")
+        parser.add_argument('--jitter', type=float, default=0, help="+/- random latency (ms)")
+        parser.add_argument('--error-rate', type=float, default=0, help="Share of requests answered with 500")
+        parser.add_argument('--throttle-rate', type=float, default=0, help="Share of requests answered with 429")
+        parser.add_argument('--paused-share', type=float, default=0.1, help="Share of adsets reported PAUSED")
+        parser.add_argument('--api-key', help="Require this Api-Key header on report requests")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--verbose', action='store_true', help="Log every request")
+
+    def handle(self, *args, **options):
+        if options['rows']:
+            rows = synthetic_report(options['rows'], days=options['days'], seed=options['seed'])['rows']
+            source = f"synthetic ({options['rows']:,} rows, {options['days']} day(s))"
+        else:
+            paths = options['source'] or [os.path.join(settings.BASE_DIR, 'api_response.json')]
+            rows = []
+            for path in paths:
+                if not os.path.exists(path):
+                    raise CommandError(f"Source not found: {path}")
+                rows.extend(load_rows(path))
+            source = ', '.join(paths)
+
+        StubHandler.config = StubConfig(
+            rows=rows,
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'],
+            paused_share=options['paused_share'],
+            api_key=options['api_key'],
+            seed=options['seed'],
+        )
+
+        server = ThreadingHTTPServer((options['host'], options['port']), StubHandler)
+        server.daemon_threads = True
+        server.verbose = options['verbose']
+        base = f"http://{options['host']}:{server.server_port}"
+        self.stdout.write(f"Serving {len(rows):,} rows from {source}")
+        self.stdout.write(f"  TRACKER_BASE_URL={base}/admin_api/v1")
+        self.stdout.write(f"  ADSET_STATUS_API_BASE={base}{STATUS_PATH}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stopped after {StubHandler.config.requests:,} requests")
@@ -0,0 +1,202 @@
+import json
+import multiprocessing
+import os
+import platform
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.bench_pipeline import git_commit, parse_size, peak_rss_mb
+from api.utills.model_store import ModelStoreError, bundle_path, current_version, publish
+from api.utills.synthetic import synthetic_history
+from api.utills.training import (
+    DEFAULT_FEATURES, GRAPH_BLOCK_EDGES, STRATA, TRAINING_SOURCES, adset_history_chunks, new_model_version,
+    snapshot_history_chunks, train_bundle, write_bundle,
+)
+from api.utills.warmup import load_bundle
+
+
+def parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as f:
+        return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024, 1)
+
+
+def benchmark_size(n_rows, chunk_size, train_kwargs):
+    """One benchmark run on synthetic history; runs in a fresh (forked) process."""
+    baseline = current_rss_mb()
+    started = time.perf_counter()
+    _, stats = train_bundle(lambda: synthetic_history(n_rows, chunk_size, seed=train_kwargs['seed']), **train_kwargs)
+    return {
+        'rows': n_rows,
+        'seconds': round(time.perf_counter() - started, 3),
+        'stage_seconds': stats['seconds'],
+        'baseline_rss_mb': baseline,
+        'peak_rss_mb': peak_rss_mb(),
+        'training_rows': stats['training_rows'],
+        'sample_rows': stats['sample_rows'],
+        'graph_edges': stats['graph_edges'],
+        'clusters': stats['clusters'],
+        'noise_share': stats['noise_share'],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Train a model bundle from the stored adset history (CampaignAdSet rows "
+        "or the raw report snapshots) and write it as a new version to MODEL_DIR. "
+        "With --benchmark, time and measure training on synthetic histories instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=TRAINING_SOURCES, default='adsets',
+                            help="adsets: CampaignAdSet rows, snapshots: latest raw report snapshot of every day")
+        parser.add_argument('--since', help="First day (YYYY-MM-DD) of the training window")
+        parser.add_argument('--until', help="Last day (YYYY-MM-DD) of the training window")
+        parser.add_argument('--chunk-size', type=int, default=50_000, help="Rows read and preprocessed at a time")
+        parser.add_argument('--sample', type=int, default=20_000,
+                            help="Rows sampled for the DBSCAN fit (the scaler sees every row); without "
+                                 "--scalable DBSCAN memory grows quickly with it")
+        parser.add_argument('--stratify', choices=STRATA, help="Sample every geo/day in proportion to its rows")
+        parser.add_argument('--scalable', action='store_true',
+                            help="Fit DBSCAN on a chunked sparse radius-neighbors graph and label every "
+                                 "training row from the core points of the sample")
+        parser.add_argument('--block-edges', type=int, default=GRAPH_BLOCK_EDGES,
+                            help="Neighbor pairs per block of the radius-neighbors graph (--scalable)")
+        parser.add_argument('--n-jobs', type=int, help="Parallel jobs for the neighbor searches (-1: all cores)")
+        parser.add_argument('--eps', type=float, help="Default: the current bundle's eps")
+        parser.add_argument('--min-samples', type=int, help="Default: the current bundle's min_samples")
+        parser.add_argument('--features', help="Comma separated features (default: the current bundle's)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Directory for the bundle (default: MODEL_DIR), or the "
+                                             "results file of --benchmark")
+        parser.add_argument('--publish', action='store_true',
+                            help="Serve the new version once it passed a warmup inference (see publish_model)")
+        parser.add_argument('--benchmark',
+                            help="Comma separated synthetic history sizes (e.g. 100k,1m,5m); reports wall "
+                                 "time and memory per size and writes no bundle")
+
+    def handle(self, *args, **options):
+        since = parse_day(options['since']) if options['since'] else None
+        until = parse_day(options['until']) if options['until'] else None
+        if options['chunk_size'] < 1 or options['sample'] < 1 or options['block_edges'] < 1:
+            raise CommandError("--chunk-size, --sample and --block-edges must be >= 1")
+        if options['publish'] and (options['output'] or options['benchmark']):
+            raise CommandError("--publish needs the bundle in MODEL_DIR (no --output or --benchmark)")
+
+        current_path = bundle_path(current_version())
+        current = load_bundle(current_path) if os.path.exists(current_path) else {}
+        params = current.get('best_params') or {}
+        eps = float(options['eps'] if options['eps'] is not None else params.get('eps', 1.1))
+        min_samples = int(options['min_samples'] if options['min_samples'] is not None else params.get('min_samples', 11))
+        if options['features']:
+            features = [name.strip() for name in options['features'].split(',') if name.strip()]
+        else:
+            features = list(current.get('features') or DEFAULT_FEATURES)
+
+        train_kwargs = {
+            'features': features,
+            'eps': eps,
+            'min_samples': min_samples,
+            'sample_size': options['sample'],
+            'seed': options['seed'],
+            'scalable': options['scalable'],
+            'stratify': options['stratify'],
+            'n_jobs': options['n_jobs'],
+            'block_edges': options['block_edges'],
+        }
+        if options['benchmark']:
+            return self.benchmark(options, train_kwargs)
+
+        # Scalable training reads the history twice
+        source = adset_history_chunks if options['source'] == 'adsets' else snapshot_history_chunks
+        reads = []
+
+        def read():
+            reads.append(source(options['chunk_size'], since=since, until=until))
+            return reads[-1]
+
+        started = time.perf_counter()
+        try:
+            bundle, stats = train_bundle(read, **train_kwargs)
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            for chunks in reads:
+                chunks.close()
+        train_seconds = round(time.perf_counter() - started, 3)
+
+        version = new_model_version()
+        metadata = {
+            'source': options['source'],
+            'since': since,
+            'until': until,
+            'chunk_size': options['chunk_size'],
+            'seed': options['seed'],
+            'n_jobs': options['n_jobs'],
+            **stats,
+            'git_commit': git_commit(),
+            'train_seconds': train_seconds,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        path = write_bundle(bundle, metadata, directory=options['output'], version=version)
+
+        self.stdout.write(
+            f"{stats['training_rows']} of {stats['rows']} rows in {stats['chunks']} chunks, "
+            f"DBSCAN(eps={eps:g}, min_samples={min_samples}) on {stats['sample_rows']} sampled rows: "
+            f"{stats['clusters']} clusters, {stats['noise_share']:.1%} noise"
+        )
+        phases = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in stats['seconds'].items())
+        self.stdout.write(f"Trained in {train_seconds:.2f}s ({phases}), peak RSS {metadata['peak_rss_mb']} MB")
+        self.stdout.write(self.style.SUCCESS(f"Model {version} written to {path}"))
+
+        if options['publish']:
+            try:
+                publish(version)
+            except ModelStoreError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Serving {version}"))
+
+    def benchmark(self, options, train_kwargs):
+        sizes = [parse_size(size) for size in options['benchmark'].split(',') if size.strip()]
+        results = []
+        for n_rows in sizes:
+            # A fresh process per size, so the peak RSS is that size's own
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as pool:
+                result = pool.submit(benchmark_size, n_rows, options['chunk_size'], train_kwargs).result()
+            results.append(result)
+            stages = ', '.join(f"{name} {seconds:.1f}s" for name, seconds in result['stage_seconds'].items())
+            self.stdout.write(
+                f"{n_rows:>9} rows: {result['seconds']:8.1f}s ({stages}), peak RSS {result['peak_rss_mb']} MB "
+                f"(baseline {result['baseline_rss_mb']} MB), {result['clusters']} clusters, "
+                f"{result['noise_share']:.1%} noise"
+            )
+
+        output = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'chunk_size': options['chunk_size'],
+            **train_kwargs,
+            'results': results,
+        }
+        path = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"training-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(output, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {path}"))
@@ -0,0 +1,248 @@
+import cProfile
+import json
+import os
+import pstats
+import time
+import uuid
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from api.utills.diagnostics import collect_results, request_diagnostics
+from api.utills.metrics import collect_stages
+
+
+PROFILE_HEADER = 'X-Profile'
+DIAGNOSTICS_HEADER = 'X-Diagnostics'
+PROFILE_TOP_FUNCTIONS = 25
+
+# cProfile hooks the interpreter, so only one request is profiled at a time;
+# concurrent profile requests still get the stage breakdown.
+_profiler_lock = Lock()
+
+
+def profile_mode(request):
+    """'1' / 'save' when the request asks to be profiled, else None."""
+    value = request.GET.get('profile') or request.headers.get(PROFILE_HEADER)
+    if value in ('1', 'true', 'save'):
+        return value
+    return None
+
+
+def is_staff_request(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        # API clients send a JWT, which only DRF looks at
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except Exception:
+            return False
+        user = result[0] if result else None
+    return bool(user and user.is_staff)
+
+
+def top_functions(profiler, limit=PROFILE_TOP_FUNCTIONS):
+    """The ``limit`` most expensive functions by cumulative time, pstats style."""
+    stats = pstats.Stats(profiler)
+    stats.sort_stats('cumulative')
+    functions = []
+    for func in stats.fcn_list[:limit]:
+        primitive_calls, ncalls, tottime, cumtime, _ = stats.stats[func]
+        filename, line, name = func
+        functions.append({
+            'function': f"{filename}:{line}({name})",
+            'ncalls': ncalls if ncalls == primitive_calls else f"{ncalls}/{primitive_calls}",
+            'tottime': round(tottime, 6),
+            'cumtime': round(cumtime, 6),
+        })
+    return {
+        'total_calls': stats.total_calls,
+        'total_seconds': round(stats.total_tt, 6),
+        'top': functions,
+    }
+
+
+def save_profile(profiler):
+    """
+    Dump the raw profile (``python -m pstats`` / snakeviz) to PROFILE_DIR and
+    keep only the newest PROFILE_KEEP files. Returns the file name.
+    """
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof"
+    profiler.dump_stats(os.path.join(settings.PROFILE_DIR, name))
+
+    saved = sorted(
+        (entry for entry in os.scandir(settings.PROFILE_DIR) if entry.name.endswith('.prof')),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in saved[settings.PROFILE_KEEP:]:
+        try:
+            os.remove(entry.path)
+        except OSError as e:
+            print(f"[ERROR] Could not rotate profile {entry.name}: {e}")
+    return name
+
+
+def summarize_stages(stages):
+    summary = {}
+    for name, seconds, rows, size in stages:
+        entry = summary.setdefault(name, {'seconds': 0.0, 'calls': 0, 'rows': 0, 'bytes': 0})
+        entry['seconds'] += seconds
+        entry['calls'] += 1
+        entry['rows'] += rows or 0
+        entry['bytes'] += size or 0
+    for entry in summary.values():
+        entry['seconds'] = round(entry['seconds'], 6)
+    return summary
+
+
+def add_to_body(response, key, value):
+    """Add ``value`` under ``key`` to a JSON object response body; other bodies are left alone."""
+    if getattr(response, 'streaming', False):
+        return response
+    if not response.get('Content-Type', '').startswith('application/json'):
+        return response
+    try:
+        body = json.loads(response.content)
+    except ValueError:
+        return response
+    if isinstance(body, dict):
+        body[key] = value
+        response.content = json.dumps(body, cls=JSONEncoder).encode()
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+    return response
+
+
+def attach_profile(response, report):
+    """
+    Add the report to a JSON response body under ``profile`` and as a
+    Server-Timing header. Streaming and non-object bodies only get the header.
+    """
+    response['Server-Timing'] = ', '.join(
+        f"{name};dur={entry['seconds'] * 1000:.1f}" for name, entry in report['stages'].items()
+    )
+    return add_to_body(response, 'profile', report)
+
+
+class ProfilingMiddleware:
+    """
+    On-demand profiling of ``/api/`` requests for staff users: ``?profile=1``
+    or ``X-Profile: 1`` adds a ``profile`` block (stage timings and the top
+    cProfile functions) to the JSON response; ``save`` also keeps the raw
+    ``.prof`` in PROFILE_DIR. Requests without the flag only pay for the
+    query-string check.
+
+    Under ASGI the async views hand their CPU work to an executor thread that
+    cProfile does not follow, so only the stage breakdown is reported there.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        mode = self.requested(request)
+        if mode is None or not is_staff_request(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile() if _profiler_lock.acquire(blocking=False) else None
+        started = time.perf_counter()
+        try:
+            with collect_stages() as stages:
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+            report = self.build_report(started, stages, profiler, mode)
+        finally:
+            if profiler is not None:
+                _profiler_lock.release()
+        return attach_profile(response, report)
+
+    async def __acall__(self, request):
+        mode = self.requested(request)
+        if mode is None or not await sync_to_async(is_staff_request)(request):
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        with collect_stages() as stages:
+            response = await self.get_response(request)
+        report = self.build_report(started, stages, None, mode)
+        return attach_profile(response, report)
+
+    @staticmethod
+    def requested(request):
+        if not request.path.startswith('/api/'):
+            return None
+        return profile_mode(request)
+
+    @staticmethod
+    def build_report(started, stages, profiler, mode):
+        report = {
+            'total_seconds': round(time.perf_counter() - started, 6),
+            'stages': summarize_stages(stages),
+            'functions': None,
+            'saved_as': None,
+        }
+        if profiler is not None:
+            report['functions'] = top_functions(profiler)
+            if mode == 'save':
+                report['saved_as'] = save_profile(profiler)
+        return report
+
+
+class DiagnosticsMiddleware:
+    """
+    ``?diagnostics=1`` or ``X-Diagnostics: 1`` on an ``/api/`` request from
+    a staff user adds a ``diagnostics`` block to the JSON response: the
+    recommendation mix, cluster summary and top actions of the inference
+    results it computed (api/utills/diagnostics.py). Nothing is computed for
+    other requests.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.requested(request) or not is_staff_request(request):
+            return self.get_response(request)
+        with collect_results() as kept:
+            response = self.get_response(request)
+        return add_to_body(response, 'diagnostics', request_diagnostics(kept))
+
+    async def __acall__(self, request):
+        if not self.requested(request) or not await sync_to_async(is_staff_request)(request):
+            return await self.get_response(request)
+        with collect_results() as kept:
+            response = await self.get_response(request)
+        return add_to_body(response, 'diagnostics', await sync_to_async(request_diagnostics)(kept))
+
+    @staticmethod
+    def requested(request):
+        if not request.path.startswith('/api/'):
+            return False
+        return (request.GET.get('diagnostics') or request.headers.get(DIAGNOSTICS_HEADER)) in ('1', 'true')
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_pipeline_cache_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoCpcStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geo', models.CharField(max_length=255, unique=True)),
+                ('count', models.BigIntegerField(default=0)),
+                ('mean', models.FloatField(default=0.0)),
+                ('m2', models.FloatField(default=0.0)),
+                ('last_day', models.DateField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_geocpcstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdsetTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('adset_id', models.CharField(max_length=255, unique=True)),
+                ('last_day', models.DateField(blank=True, null=True)),
+                ('days', models.IntegerField(default=0)),
+                ('sum_x', models.FloatField(default=0.0)),
+                ('sum_xx', models.FloatField(default=0.0)),
+                ('sum_cost', models.FloatField(default=0.0)),
+                ('sum_x_cost', models.FloatField(default=0.0)),
+                ('sum_profit', models.FloatField(default=0.0)),
+                ('sum_cr', models.FloatField(default=0.0)),
+                ('sum_x_cr', models.FloatField(default=0.0)),
+                ('points', models.JSONField(default=list)),
+            ],
+        ),
+    ]
@@ -144,5 +144,52 @@ class AdsetStatus(models.Model):
     adset_id = models.CharField(max_length=100, unique=True)  # no duplicates allowed
     is_active = models.BooleanField(default=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save handler tell a status change from a plain re-save
+        instance._loaded_is_active = instance.__dict__.get('is_active')
+        return instance
+
+    def __str__(self):
+        return f"{self.adset_id} - {'Active' if self.is_active else 'Paused'}"
+
+
+class GeoCpcStats(models.Model):
+    # Running CPC count/mean/M2 per geo over every finished tracker day folded
+    # in (api/utills/geo_cpc.py); the reference add_cpc_level() bands against
+    # with CPC_REFERENCE='geo'
+    geo = models.CharField(max_length=255, unique=True)
+    count = models.BigIntegerField(default=0)
+    mean = models.FloatField(default=0.0)
+    m2 = models.FloatField(default=0.0)
+    last_day = models.DateField(blank=True, null=True)
+
+    @property
+    def std(self):
+        # Sample standard deviation, like pandas' std() of a batch
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else None
+
+    def __str__(self):
+        return f"{self.geo}: CPC {self.mean:.4f} (n={self.count})"
+
+
+class AdsetTrend(models.Model):
+    # Running sums over the adset's tracker days of the last ADSET_TREND_DAYS
+    # days (api/utills/trends.py); x is the day number. ``points`` keeps those
+    # days' [x, cost, profit, cr], oldest first, so a day leaving the window
+    # is subtracted again
+    adset_id = models.CharField(max_length=255, unique=True)
+    last_day = models.DateField(blank=True, null=True)
+    days = models.IntegerField(default=0)
+    sum_x = models.FloatField(default=0.0)
+    sum_xx = models.FloatField(default=0.0)
+    sum_cost = models.FloatField(default=0.0)
+    sum_x_cost = models.FloatField(default=0.0)
+    sum_profit = models.FloatField(default=0.0)
+    sum_cr = models.FloatField(default=0.0)
+    sum_x_cr = models.FloatField(default=0.0)
+    points = models.JSONField(default=list)
+
     def __str__(self):
-        return f"{self.adset_id} - {'Active' if self.is_active else 'Paused'}"
\ No newline at end of file
+        return f"AdSet {self.adset_id} | {self.days} day(s) to {self.last_day}"
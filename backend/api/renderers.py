@@ -0,0 +1,33 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def ndjson_line(obj):
+    """Encode one record the same way DRF's JSONRenderer would, plus a newline."""
+    return json.dumps(
+        obj,
+        cls=JSONEncoder,
+        ensure_ascii=not api_settings.UNICODE_JSON,
+        allow_nan=not api_settings.STRICT_JSON,
+        separators=(',', ':'),
+    ) + '\n'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline delimited JSON. Selected with ``?format=ndjson`` or
+    ``Accept: application/x-ndjson``. Views stream campaign records themselves;
+    this renderer only handles plain ``Response`` objects (e.g. errors).
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        records = data if isinstance(data, list) else [data]
+        return ''.join(ndjson_line(r) for r in records).encode(self.charset)
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import AdsetStatus
+from api.utills.result_cache import bump_status_generation
+
+
+@receiver(post_save, sender=AdsetStatus)
+def adset_status_saved(sender, instance, created, **kwargs):
+    """
+    Invalidate the cached prediction responses that filter on adset status
+    (UpdateAdsetStatusAPIView, the scheduler, the admin). Re-saving an
+    unchanged status keeps them.
+    """
+    is_active = sender._meta.get_field('is_active').to_python(instance.is_active)
+    if created or getattr(instance, '_loaded_is_active', None) != is_active:
+        try:
+            bump_status_generation()
+        except Exception as e:
+            print(f"[ERROR] Could not invalidate cached results: {e}")
+    instance._loaded_is_active = is_active
+
+
+@receiver(post_delete, sender=AdsetStatus)
+def adset_status_deleted(sender, instance, **kwargs):
+    try:
+        bump_status_generation()
+    except Exception as e:
+        print(f"[ERROR] Could not invalidate cached results: {e}")
@@ -0,0 +1,150 @@
+import os
+import tempfile
+from unittest import mock
+
+import joblib
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, override_settings
+from sklearn.cluster import DBSCAN
+
+from api.utills.assignment import AssignmentCache, assign_cached, bundle_assigner, entry_size
+from api.utills.metrics import registry
+from api.utills.warmup import load_bundle
+
+
+def counter(name, **labels):
+    _, counters, _ = registry.snapshot()
+    return counters.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def value(i):
+    return i % 3, ('PAUSE', f'reason {i}', '')
+
+
+class AssignmentCacheTests(SimpleTestCase):
+    """The per-process LRU behind CLUSTER_ASSIGNMENT='core'."""
+
+    def key(self, i):
+        return 'dbscan-1.pkl@1', 'rules', bytes([i]) * 16
+
+    def fill(self, cache, n):
+        cache.put_many((self.key(i), value(i)) for i in range(n))
+
+    def cached(self, cache):
+        return [key for key in cache.entries]
+
+    def test_get_counts_hits_and_misses(self):
+        cache = AssignmentCache(10, 10 ** 6)
+        self.fill(cache, 2)
+        hits, misses = counter('pipeline_cluster_cache_lookups_total', result='hit'), \
+            counter('pipeline_cluster_cache_lookups_total', result='miss')
+        self.assertEqual(cache.get_many([self.key(0), self.key(5), self.key(1)]), [value(0), None, value(1)])
+        self.assertEqual(counter('pipeline_cluster_cache_lookups_total', result='hit'), hits + 2)
+        self.assertEqual(counter('pipeline_cluster_cache_lookups_total', result='miss'), misses + 1)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (2, 1, 0.6667))
+
+    def test_least_recently_used_goes_first(self):
+        cache = AssignmentCache(3, 10 ** 6)
+        self.fill(cache, 3)
+        # A hit and a re-put both count as a use
+        cache.get_many([self.key(0)])
+        cache.put_many([(self.key(1), value(1))])
+        cache.put_many([(self.key(3), value(3))])
+        self.assertEqual(self.cached(cache), [self.key(0), self.key(1), self.key(3)])
+        self.assertEqual(cache.get_many([self.key(2)]), [None])
+
+    def test_entry_limit(self):
+        cache = AssignmentCache(4, 10 ** 6)
+        evicted = counter('pipeline_cluster_cache_evictions_total', reason='entries')
+        self.fill(cache, 10)
+        self.assertEqual(self.cached(cache), [self.key(i) for i in range(6, 10)])
+        self.assertEqual(cache.stats()['evictions'], {'entries': 6})
+        self.assertEqual(counter('pipeline_cluster_cache_evictions_total', reason='entries'), evicted + 6)
+
+    def test_byte_limit(self):
+        size = entry_size(self.key(0), value(0))
+        cache = AssignmentCache(100, 3 * size + size // 2)
+        evicted = counter('pipeline_cluster_cache_evictions_total', reason='memory')
+        self.fill(cache, 5)
+        self.assertEqual(self.cached(cache), [self.key(i) for i in range(2, 5)])
+        self.assertEqual(cache.bytes, sum(entry_size(self.key(i), value(i)) for i in range(2, 5)))
+        self.assertLessEqual(cache.bytes, cache.max_bytes)
+        self.assertEqual(cache.stats()['evictions'], {'memory': 2})
+        self.assertEqual(counter('pipeline_cluster_cache_evictions_total', reason='memory'), evicted + 2)
+
+    def test_replacing_an_entry_keeps_the_byte_count(self):
+        cache = AssignmentCache(10, 10 ** 6)
+        self.fill(cache, 3)
+        before = cache.bytes
+        cache.put_many([(self.key(1), value(1))])
+        self.assertEqual(cache.bytes, before)
+        self.assertEqual(len(cache.entries), 3)
+
+
+@override_settings(CLUSTER_ASSIGNMENT='core')
+class AssignCachedTests(SimpleTestCase):
+    """assign_cached() only labels rows it has not seen for the same bundle file and rules."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'dbscan-test.pkl')
+        self.write_bundle(core_labels=[0, 1], mtime=1_000_000)
+        cache = mock.patch('api.utills.assignment._cache', [AssignmentCache(100, 10 ** 6)])
+        cache.start()
+        self.addCleanup(cache.stop)
+
+        self.X = np.array([[0.0, 0.0], [5.0, 5.0], [0.1, 0.0], [9.0, 9.0]])
+        self.rule_inputs = pd.DataFrame({'roi_confirmed': [10.0, -50.0, 10.0, 0.0], 'cost': [1.0, 20.0, 1.0, 0.0]})
+        self.recommended = []
+
+    def write_bundle(self, core_labels, mtime):
+        bundle = {
+            'dbscan': DBSCAN(eps=0.5),
+            'core_points': np.array([[0.0, 0.0], [5.0, 5.0]]),
+            'core_labels': np.array(core_labels),
+        }
+        joblib.dump(bundle, self.path)
+        os.utime(self.path, (mtime, mtime))
+
+    def recommend(self, df):
+        self.recommended.append(len(df))
+        return [('PAUSE' if roi < 0 else 'MONITOR', f'cluster {cluster}') for roi, cluster in zip(df['roi_confirmed'], df['cluster'])]
+
+    def assign(self, X=None, rules='rules-1'):
+        assigner = bundle_assigner(self.path, load_bundle(self.path))
+        return assign_cached(assigner, rules, self.X if X is None else X, self.rule_inputs, self.recommend)
+
+    def assert_same_assignment(self, assignment, expected):
+        np.testing.assert_array_equal(assignment[0], expected[0])
+        self.assertEqual(assignment[1], expected[1])
+
+    def test_second_call_is_served_from_the_cache(self):
+        labels, fields = self.assign()
+        np.testing.assert_array_equal(labels, [0, 1, 0, -1])
+        self.assertEqual(fields[1], ('PAUSE', 'cluster 1'))
+        self.assert_same_assignment(self.assign(), (labels, fields))
+        self.assertEqual(self.recommended, [4])
+
+    def test_changed_rows_and_rules_miss(self):
+        self.assign()
+        X = self.X.copy()
+        X[3] = [5.0, 5.1]
+        labels, _ = self.assign(X)
+        self.assertEqual(labels[3], 1)
+        self.assertEqual(self.recommended, [4, 1])
+        self.assign(X, rules='rules-2')
+        self.assertEqual(self.recommended, [4, 1, 4])
+
+    def test_bundle_replaced_in_place_invalidates(self):
+        self.assign()
+        # Same path, new clusters: the mtime is part of the model key
+        self.write_bundle(core_labels=[1, 0], mtime=2_000_000)
+        relabeled, fields = self.assign()
+        self.assertEqual(self.recommended, [4, 4])
+        np.testing.assert_array_equal(relabeled, [1, 0, 1, -1])
+        self.assertEqual(fields[0], ('MONITOR', 'cluster 1'))
+        self.assert_same_assignment(self.assign(), (relabeled, fields))
+        self.assertEqual(self.recommended, [4, 4])
@@ -0,0 +1,60 @@
+import gc
+import weakref
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from api.utills import diagnostics
+from api.utills.diagnostics import DIAGNOSTIC_COLUMNS, build_report, collect_results, keep_result, latest_report
+
+
+def result_frame(n=50):
+    rng = np.random.default_rng(48)
+    return pd.DataFrame({
+        'sub_id_6': [f'Campaign {i % 5} - US - test' for i in range(n)],
+        'sub_id_3': [str(100 + i % 5) for i in range(n)],
+        'sub_id_2': [str(1000 + i) for i in range(n)],
+        'recommendation': rng.choice(['PAUSE', 'MONITOR', 'INCREASE_BUDGET'], n),
+        'cluster': rng.integers(-1, 3, n),
+        'priority': rng.integers(1, 5, n),
+        'roi_confirmed': rng.normal(0, 50, n),
+        'cost': rng.uniform(0, 100, n),
+        'revenue': rng.uniform(0, 100, n),
+        # Columns the report never reads
+        'lp_ctr': rng.uniform(0, 1, n),
+        'reason': ['x' * 200] * n,
+    })
+
+
+class KeepResultTests(SimpleTestCase):
+    """Only the columns the report reads outlive the request that produced a result."""
+
+    def setUp(self):
+        saved = dict(diagnostics._latest)
+        self.addCleanup(diagnostics._latest.update, saved)
+
+    def test_keeps_only_the_diagnostic_columns(self):
+        df = result_frame()
+        expected = build_report(diagnostics.KeptResult('run-1', 'test', df))
+        keep_result(df, 'test', 'run-1')
+        kept = diagnostics._latest['result']
+        self.assertEqual(list(kept.frame.columns), list(DIAGNOSTIC_COLUMNS))
+        self.assertEqual(latest_report(), expected)
+
+    def test_full_frame_is_released(self):
+        df = result_frame()
+        with collect_results() as kept:
+            keep_result(df, 'test', 'run-1')
+        released = weakref.ref(df)
+        del df
+        gc.collect()
+        self.assertIsNone(released())
+        self.assertEqual(len(kept[0].frame), 50)
+
+    def test_missing_columns_are_skipped(self):
+        df = result_frame().drop(columns=['cluster', 'revenue'])
+        keep_result(df, 'test')
+        report = latest_report()
+        self.assertEqual(report['adsets'], 50)
+        self.assertEqual(report['clusters'], [])
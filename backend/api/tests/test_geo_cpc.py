@@ -0,0 +1,118 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from django.test import TestCase, override_settings
+
+from api.models import GeoCpcStats
+from api.utills import geo_cpc
+from api.utills.geo_cpc import cpc_bands, cpc_levels, fold_day
+
+FIRST_DAY = date(2026, 10, 15)
+
+
+def label_cpc(df, cpc_col='cpc', geo_col='geo'):
+    """add_cpc_level() as it was before cpc_levels(): merge, z-score and a per-row label."""
+    geo_stats = df.groupby(geo_col)[cpc_col].agg(['mean', 'std']).rename(columns={'mean': 'mean_cpc', 'std': 'std_cpc'})
+    df = df.merge(geo_stats, left_on=geo_col, right_index=True, how='left')
+    df['std_cpc'] = df['std_cpc'].replace(0, 1e-6)
+    z_score = (df[cpc_col] - df['mean_cpc']) / df['std_cpc']
+
+    def label(z):
+        if pd.isna(z):
+            return 'INSUFFICIENT_DATA'
+        elif z < -1:
+            return 'LOW'
+        elif z > 1:
+            return 'HIGH'
+        return 'STANDARD'
+
+    return z_score.apply(label).tolist()
+
+
+def day_frame(rng, sizes):
+    geos, cpcs = [], []
+    for geo, (n, mean) in sizes.items():
+        geos += [geo] * n
+        cpcs += list(np.round(rng.gamma(4.0, mean / 4.0, n), 4))
+    return pd.DataFrame({'geo': geos, 'cpc': cpcs})
+
+
+class FoldDayTests(TestCase):
+    """GeoCpcStats holds the count/mean/M2 of every folded day, merged with Chan's update."""
+
+    def setUp(self):
+        rng = np.random.default_rng(47)
+        self.days = [
+            day_frame(rng, {'US': (40, 0.8), 'DE': (25, 0.5), 'FR': (1, 0.4)}),
+            day_frame(rng, {'US': (60, 0.9), 'DE': (5, 0.6)}),
+            day_frame(rng, {'US': (10, 0.7), 'DE': (30, 0.5), 'FR': (3, 0.3)}),
+        ]
+
+    def fold_all(self):
+        for offset, df in enumerate(self.days):
+            fold_day(df, FIRST_DAY + timedelta(days=offset))
+
+    def stored(self):
+        return {s.geo: (s.count, s.mean, s.m2, s.last_day) for s in GeoCpcStats.objects.all()}
+
+    def test_merge_equals_moments_of_all_days(self):
+        self.fold_all()
+        history = pd.concat(self.days)
+        stored = self.stored()
+        self.assertEqual(set(stored), {'US', 'DE', 'FR'})
+        for geo, cpcs in history.groupby('geo')['cpc']:
+            count, mean, m2, last_day = stored[geo]
+            self.assertEqual(count, len(cpcs))
+            self.assertAlmostEqual(mean, cpcs.mean(), places=10)
+            self.assertAlmostEqual(m2, cpcs.var(ddof=1) * (len(cpcs) - 1), places=9)
+        self.assertEqual(stored['US'][3], FIRST_DAY + timedelta(days=2))
+
+    def test_refolding_a_day_changes_nothing(self):
+        self.fold_all()
+        before = self.stored()
+        self.assertEqual(fold_day(self.days[1], FIRST_DAY + timedelta(days=1)), 0)
+        self.assertEqual(fold_day(self.days[2], FIRST_DAY + timedelta(days=2)), 0)
+        self.assertEqual(self.stored(), before)
+
+
+class CpcLevelsTests(TestCase):
+    """The CPC bands against the batch, and against GeoCpcStats with CPC_REFERENCE='geo'."""
+
+    def setUp(self):
+        geo_cpc._reference.update(loaded_at=None, stats=None)
+        self.addCleanup(geo_cpc._reference.update, loaded_at=None, stats=None)
+        rng = np.random.default_rng(470)
+        df = day_frame(rng, {'US': (30, 0.8), 'DE': (12, 0.5), 'FR': (1, 0.4)})
+        # All-equal CPCs (std 0) and a missing CPC
+        same = pd.DataFrame({'geo': ['IT'] * 4 + ['US'], 'cpc': [0.3] * 4 + [np.nan]})
+        self.df = pd.concat([df, same], ignore_index=True).sample(frac=1, random_state=47).reset_index(drop=True)
+
+    @override_settings(CPC_REFERENCE='batch')
+    def test_batch_reproduces_label_cpc(self):
+        levels = cpc_levels(self.df['cpc'], self.df['geo'])
+        self.assertEqual(list(levels), label_cpc(self.df))
+        self.assertEqual(set(levels[self.df['geo'] == 'FR']), {'INSUFFICIENT_DATA'})
+        self.assertEqual(levels[self.df['cpc'].isna().to_numpy()].tolist(), ['INSUFFICIENT_DATA'])
+        self.assertEqual(set(levels[self.df['geo'] == 'IT']), {'STANDARD'})
+
+    @override_settings(CPC_REFERENCE='batch')
+    def test_batch_with_categorical_geo(self):
+        df = self.df.assign(geo=self.df['geo'].astype('category'))
+        self.assertEqual(list(cpc_levels(df['cpc'], df['geo'])), label_cpc(self.df))
+
+    @override_settings(CPC_REFERENCE='geo', CPC_REFERENCE_MIN_COUNT=30)
+    def test_geos_under_the_minimum_use_the_batch(self):
+        GeoCpcStats.objects.create(geo='US', count=500, mean=1.5, m2=499 * 0.04, last_day=FIRST_DAY)
+        GeoCpcStats.objects.create(geo='DE', count=29, mean=5.0, m2=28 * 1.0, last_day=FIRST_DAY)
+        levels = cpc_levels(self.df['cpc'], self.df['geo'])
+        with override_settings(CPC_REFERENCE='batch'):
+            batch = cpc_levels(self.df['cpc'], self.df['geo'])
+
+        us = (self.df['geo'] == 'US').to_numpy()
+        expected_us = cpc_bands(((self.df['cpc'][us] - 1.5) / 0.2).to_numpy())
+        self.assertEqual(levels[us].tolist(), expected_us.tolist())
+        # Nearly every US CPC is far below the reference mean
+        self.assertNotEqual(levels[us].tolist(), batch[us].tolist())
+        # DE has too few reference rows; FR and IT have none
+        self.assertEqual(levels[~us].tolist(), batch[~us].tolist())
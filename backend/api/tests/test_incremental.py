@@ -0,0 +1,90 @@
+import os
+import random
+import tempfile
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from api.tests.test_report_output import load_fixture
+from api.utills.incremental import CampaignState, state_results
+from api.utills.pipeline import (
+    build_summary, clean_report, enrich_results, group_processed_data, keep_active, run_live_inference,
+)
+from api.utills.query import CampaignQuery
+
+
+def without_ids(campaigns):
+    return [{k: v for k, v in campaign.items() if k != 'id'} for campaign in campaigns]
+
+
+class IncrementalStateTests(SimpleTestCase):
+    """
+    The daily view patches one CampaignState per report as statuses change;
+    its output must stay what a full keep_active/group/enrich/summary pass
+    over the same rows returns.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.settings = override_settings(MODEL_DIR=cls.tmp.name, SNAPSHOT_DIR=os.path.join(cls.tmp.name, 'snapshots'))
+        cls.settings.enable()
+        cls.model_path = os.path.join(settings.MEDIA_ROOT, 'dbscan_model_bundle_latest.pkl')
+        report = load_fixture('tracker_report.json')
+        rows = [row for row in report['rows'] if row['day'] == '2026-10-18']
+        cls.rows = run_live_inference(clean_report(rows), 'preprocess_data', '20261018T120000-00000000', cls.model_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def full_rebuild(self, status_map, query):
+        data = keep_active([dict(row) for row in self.rows], status_map)
+        final_results, pagination = enrich_results(query, group_processed_data(data), model_path=self.model_path)
+        return final_results, build_summary(data), pagination
+
+    def assert_same(self, incremental, full):
+        results, summary, pagination = incremental
+        expected_results, expected_summary, expected_pagination = full
+        self.assertEqual(without_ids(results), without_ids(expected_results))
+        # priority_distribution included
+        self.assertEqual(summary, expected_summary)
+        self.assertEqual(pagination, expected_pagination)
+
+    def test_status_changes_match_full_rebuild(self):
+        adset_ids = sorted({row['sub_id_2'] for row in self.rows})
+        status_map = {adset_id: 'active' for adset_id in adset_ids}
+        state = CampaignState(self.rows, self.model_path)
+        query = CampaignQuery({})
+        self.assert_same(state_results(state, status_map, query), self.full_rebuild(status_map, query))
+
+        changes = random.Random(39)
+        for _ in range(8):
+            status_map = dict(status_map)
+            for adset_id in changes.sample(adset_ids, 10):
+                status_map[adset_id] = 'paused' if status_map.get(adset_id) == 'active' else 'active'
+            # Adsets missing from the status table are 'unknown' and left out
+            status_map.pop(changes.choice(adset_ids), None)
+            self.assert_same(state_results(state, status_map, query), self.full_rebuild(status_map, query))
+
+    def test_query_over_patched_state(self):
+        adset_ids = sorted({row['sub_id_2'] for row in self.rows})
+        state = CampaignState(self.rows, self.model_path)
+        status_map = {adset_id: 'active' for adset_id in adset_ids}
+        state_results(state, status_map, CampaignQuery({}))
+
+        status_map.update({adset_id: 'paused' for adset_id in adset_ids[::3]})
+        query = CampaignQuery({'ordering': '-total_cost', 'page': '2', 'page_size': '10', 'recommendation': 'PAUSE,INCREASE_BUDGET'})
+        self.assert_same(state_results(state, status_map, query), self.full_rebuild(status_map, query))
+
+    def test_everything_paused_gives_empty_summary(self):
+        state = CampaignState(self.rows, self.model_path)
+        adset_ids = {row['sub_id_2'] for row in self.rows}
+        state_results(state, {adset_id: 'active' for adset_id in adset_ids}, CampaignQuery({}))
+        results, summary, _ = state_results(state, {adset_id: 'paused' for adset_id in adset_ids}, CampaignQuery({}))
+        self.assertEqual(results, [])
+        self.assertEqual(summary, {})
+        self.assertEqual(summary, build_summary([]))
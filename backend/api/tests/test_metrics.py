@@ -0,0 +1,53 @@
+import os
+import pickle
+import tempfile
+
+from django.test import SimpleTestCase
+
+from api.utills.metrics import MetricsRegistry, merge_snapshots, parse_snapshot_name, snapshot_name
+
+# No process has this pid (above the default pid_max)
+EXITED_PID = 4_000_000
+
+
+class MergeSnapshotsTests(SimpleTestCase):
+    """With METRICS_DIR every worker writes a snapshot; a scrape sums them."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def write(self, pid, started, requests, gauge=1):
+        counters = {('requests_total', (('view', 'daily'),)): requests}
+        gauges = {('cache_entries', ()): gauge}
+        with open(os.path.join(self.dir, snapshot_name(pid, started)), 'wb') as f:
+            pickle.dump(({}, counters, gauges), f)
+
+    def test_snapshot_names(self):
+        self.assertEqual(parse_snapshot_name(snapshot_name(123, 456)), (123, 456))
+        # Written before the start time was part of the name
+        self.assertEqual(parse_snapshot_name('metrics-123.pkl'), (123, 0))
+        self.assertIsNone(parse_snapshot_name('metrics-123-456.pkl.tmp'))
+        self.assertIsNone(parse_snapshot_name('other.pkl'))
+
+    def test_reused_pid_keeps_the_exited_process_counters(self):
+        pid = os.getpid()
+        self.write(pid, 100, requests=7, gauge=3)
+        # A later process with the same pid
+        self.write(pid, 200, requests=2, gauge=5)
+        self.write(EXITED_PID, 100, requests=1, gauge=9)
+        _, counters, gauges = merge_snapshots(self.dir)
+        self.assertEqual(counters, {('requests_total', (('view', 'daily'),)): 10})
+        # Gauges of the live process only
+        self.assertEqual(gauges, {('cache_entries', (('pid', str(pid)),)): 5})
+
+    def test_registry_writes_under_its_start_time(self):
+        registry = MetricsRegistry()
+        registry.inc('requests_total', {'view': 'daily'})
+        registry.write_snapshot(self.dir)
+        registry.inc('requests_total', {'view': 'daily'})
+        registry.write_snapshot(self.dir)
+        self.assertEqual(os.listdir(self.dir), [snapshot_name(os.getpid(), registry._started)])
+        _, counters, _ = merge_snapshots(self.dir)
+        self.assertEqual(counters, {('requests_total', (('view', 'daily'),)): 2})
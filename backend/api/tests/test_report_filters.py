@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.test import TestCase, override_settings
+
+from api.models import AdsetStatus
+from api.utills.pipeline import daily_report_payload, load_paused_adsets
+
+
+def excluded(payload):
+    for report_filter in payload.get('filters', []):
+        if report_filter['operator'] == 'NOT_IN_LIST':
+            return report_filter['expression']
+    return None
+
+
+class PausedAdsetFilterTests(TestCase):
+    """Known-paused adsets are only pushed into the tracker report when asked for, and only a bounded list."""
+
+    def setUp(self):
+        AdsetStatus.objects.bulk_create(
+            [AdsetStatus(adset_id=str(1000 + i), is_active=i % 2 == 0) for i in range(10)]
+        )
+
+    def payload(self):
+        return daily_report_payload(date(2026, 10, 19))
+
+    def test_no_exclusion_by_default(self):
+        self.assertIsNone(excluded(self.payload()))
+
+    @override_settings(TRACKER_EXCLUDE_PAUSED=True, TRACKER_EXCLUDE_PAUSED_MAX=5)
+    def test_paused_adsets_excluded(self):
+        self.assertEqual(excluded(self.payload()), ['1001', '1003', '1005', '1007', '1009'])
+
+    @override_settings(TRACKER_EXCLUDE_PAUSED=True, TRACKER_EXCLUDE_PAUSED_MAX=4)
+    def test_no_exclusion_above_the_cap(self):
+        self.assertIsNone(excluded(self.payload()))
+
+    def test_load_paused_adsets_limit(self):
+        self.assertEqual(len(load_paused_adsets()), 5)
+        self.assertEqual(len(load_paused_adsets(5)), 5)
+        self.assertEqual(load_paused_adsets(4), set())
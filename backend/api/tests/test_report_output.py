@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.utills import incremental
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+class TrackerResponse:
+    status_code = 200
+
+    def __init__(self, data):
+        self.data = data
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+class ReportViewTestCase(TestCase):
+    """Prediction views over tracker_report.json, served by the bundle in media/."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        # No MODEL_DIR/CURRENT: the bundle in media/ is served, as originally
+        settings = override_settings(MODEL_DIR=tmp.name, SNAPSHOT_DIR=os.path.join(tmp.name, 'snapshots'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        env = mock.patch.dict(os.environ, {'API_KEY': 'test'})
+        env.start()
+        self.addCleanup(env.stop)
+        # A state or response kept by an earlier test refers to AdsetStatus
+        # rows its transaction rolled back
+        incremental._states.clear()
+        caches[django_settings.RESULT_CACHE].clear()
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='baseline'))
+        self.report = load_fixture('tracker_report.json')
+        self.expected = load_fixture('baseline_responses.json')
+
+
+class BaselineOutputTests(ReportViewTestCase):
+    """
+    The prediction views return what the original implementation returned
+    for a fixed two-day tracker report: baseline_responses.json was recorded
+    from it (campaign ids removed), tracker_report.json is the report.
+    """
+
+    def get(self, url, report):
+        with mock.patch('requests.post', return_value=TrackerResponse(report)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        body = response.json()
+        for campaign in body['data']:
+            campaign.pop('id')
+        return body
+
+    def assert_same_output(self, body, expected):
+        self.assertEqual(body['summary'], expected['summary'])
+        self.assertEqual(len(body['data']), len(expected['data']))
+        for campaign, expected_campaign in zip(body['data'], expected['data']):
+            adsets = {adset['sub_id_2']: adset for adset in campaign.pop('adset')}
+            expected_adsets = {adset['sub_id_2']: adset for adset in expected_campaign['adset']}
+            self.assertEqual(campaign, {k: v for k, v in expected_campaign.items() if k != 'adset'})
+            self.assertEqual(list(adsets), list(expected_adsets))
+            for adset_id, adset in adsets.items():
+                # Exact float equality: sums and ratios are computed in float64
+                self.assertEqual(adset, expected_adsets[adset_id], adset_id)
+
+    def test_date_range_matches_baseline(self):
+        body = self.get('/api/predict-date-range/?start_date=2026-10-17&end_date=2026-10-18', self.report)
+        self.assert_same_output(body, self.expected['date_range'])
+
+    def test_daily_matches_baseline(self):
+        report = {'rows': [row for row in self.report['rows'] if row['day'] == '2026-10-18']}
+        body = self.get('/api/prediction-daily/', report)
+        self.assert_same_output(body, self.expected['daily'])
+
+
+class ModelPathTests(ReportViewTestCase):
+    """The date range view resolves the bundle once and hands it down; nothing below it looks it up again."""
+
+    def get_resolved(self, url):
+        model_path = os.path.join(django_settings.MEDIA_ROOT, 'dbscan_model_bundle_latest.pkl')
+        resolved = mock.patch('api.views.enrich_model_path', return_value=model_path)
+        again = mock.patch('api.utills.pipeline.enrich_model_path', side_effect=AssertionError('resolved twice'))
+        with resolved as view_lookup, again, mock.patch('requests.post', return_value=TrackerResponse(self.report)):
+            response = self.client.get(url)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(view_lookup.call_count, 1)
+        self.assertEqual(response.status_code, 200, content[:500])
+        return content
+
+    def test_json(self):
+        body = json.loads(self.get_resolved('/api/predict-date-range/?start_date=2026-10-17&end_date=2026-10-18'))
+        self.assertTrue(body['success'], body)
+        self.assertEqual(len(body['data']), len(self.expected['date_range']['data']))
+
+    def test_ndjson(self):
+        content = self.get_resolved('/api/predict-date-range/?start_date=2026-10-17&end_date=2026-10-18&format=ndjson')
+        records = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(records[-1], {'type': 'summary', 'success': True, 'summary': self.expected['date_range']['summary']})
+        self.assertEqual(len(records) - 1, len(self.expected['date_range']['data']))
+
+
+class TrackerFilterTests(ReportViewTestCase):
+    """Geo and campaign filters are applied after inference, so the batch DBSCAN and the CPC bands see is the same."""
+
+    def test_query_filters_stay_out_of_the_tracker_request(self):
+        report = {'rows': [row for row in self.report['rows'] if row['day'] == '2026-10-18']}
+        with mock.patch('requests.post', return_value=TrackerResponse(report)) as post:
+            full = self.client.get('/api/prediction-daily/').json()
+            campaign = full['data'][0]
+            filtered = self.client.get(f"/api/prediction-daily/?campaign_id={campaign['sub_id_3']}&geo={campaign['geo']}").json()
+        self.assertEqual(post.call_count, 2)
+        for call in post.call_args_list:
+            self.assertEqual(call.kwargs['json']['filters'], [])
+
+        # The same adsets with the same clusters and CPC bands as unfiltered
+        adsets = {adset['sub_id_2']: adset for adset in campaign['adset']}
+        for adset in filtered['data'][0]['adset']:
+            self.assertEqual(adset, adsets[adset['sub_id_2']])
@@ -0,0 +1,101 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase
+
+from api.models import AdsetStatus
+from api.utills.pipeline import register_new_adsets
+from api.utills.result_cache import (
+    STATUS_GENERATION_KEY, bump_status_generation, get_result, put_result, result_key, status_generation,
+)
+
+
+class StatusGenerationTests(TestCase):
+    """Cached responses that filter on AdsetStatus are keyed by the status generation (api/signals.py)."""
+
+    def setUp(self):
+        AdsetStatus.objects.create(adset_id='1001', is_active=True)
+
+    def key(self, generation):
+        day = date(2026, 10, 19)
+        return result_key('prediction-daily', day, day, (), 'fingerprint', generation, model_path='dbscan-test.pkl')
+
+    def test_created_row_bumps_generation(self):
+        before = status_generation()
+        AdsetStatus.objects.create(adset_id='1002', is_active=True)
+        self.assertEqual(status_generation(), before + 1)
+
+    def test_status_flip_bumps_generation(self):
+        before = status_generation()
+        adset = AdsetStatus.objects.get(adset_id='1001')
+        adset.is_active = False
+        adset.save()
+        self.assertEqual(status_generation(), before + 1)
+        # And back, on the same instance
+        adset.is_active = True
+        adset.save()
+        self.assertEqual(status_generation(), before + 2)
+
+    def test_unchanged_save_keeps_generation(self):
+        before = status_generation()
+        adset = AdsetStatus.objects.get(adset_id='1001')
+        adset.save()
+        adset.is_active = True
+        adset.save()
+        # The API view assigns the posted value as is
+        adset.is_active = 1
+        adset.save()
+        self.assertEqual(status_generation(), before)
+
+    def test_delete_bumps_generation(self):
+        before = status_generation()
+        AdsetStatus.objects.get(adset_id='1001').delete()
+        self.assertEqual(status_generation(), before + 1)
+
+    def test_stale_key_misses_after_bump(self):
+        stale = self.key(status_generation())
+        put_result(stale, {'success': True, 'data': []})
+        self.assertIsNotNone(get_result(stale))
+
+        adset = AdsetStatus.objects.get(adset_id='1001')
+        adset.is_active = False
+        adset.save()
+
+        fresh = self.key(status_generation())
+        self.assertNotEqual(fresh, stale)
+        self.assertIsNone(get_result(fresh))
+
+    def test_bulk_create_sends_no_signal(self):
+        before = status_generation()
+        AdsetStatus.objects.bulk_create([AdsetStatus(adset_id='1003', is_active=True)])
+        self.assertEqual(status_generation(), before)
+
+    def test_register_new_adsets_bumps_generation_for_new_adsets_only(self):
+        before = status_generation()
+        register_new_adsets([{'sub_id_2': '1001'}, {'sub_id_2': '1004'}, {'sub_id_2': None}])
+        self.assertEqual(status_generation(), before + 1)
+        self.assertTrue(AdsetStatus.objects.get(adset_id='1004').is_active)
+
+        register_new_adsets([{'sub_id_2': '1001'}, {'sub_id_2': '1004'}])
+        self.assertEqual(status_generation(), before + 1)
+
+    def test_culled_generation_never_repeats(self):
+        cache = caches[settings.SINGLEFLIGHT_CACHE]
+        seen = set()
+        for cull_before_bump in (False, True):
+            cache.delete(STATUS_GENERATION_KEY)
+            seen.add(status_generation())
+            stale = self.key(status_generation())
+            put_result(stale, {'success': True, 'data': []})
+            for _ in range(3):
+                bump_status_generation()
+                seen.add(status_generation())
+            if cull_before_bump:
+                cache.delete(STATUS_GENERATION_KEY)
+                bump_status_generation()
+            else:
+                cache.delete(STATUS_GENERATION_KEY)
+            generation = status_generation()
+            self.assertNotIn(generation, seen)
+            self.assertIsNone(get_result(self.key(generation)))
@@ -0,0 +1,35 @@
+import tempfile
+import threading
+from unittest import mock
+
+import pandas as pd
+from django.test import SimpleTestCase, override_settings
+
+from api.utills import snapshots
+from api.utills.metrics import registry
+
+
+class SnapshotQueueTests(SimpleTestCase):
+
+    def dropped(self):
+        return registry._counters.get(('pipeline_snapshots_dropped_total', (('kind', 'result'),)), 0)
+
+    def test_full_queue_drops_and_counts(self):
+        release = threading.Event()
+        blocking_write = lambda *args: release.wait(5)
+        frame = pd.DataFrame({'cost': [1.0]})
+        before = self.dropped()
+        with tempfile.TemporaryDirectory() as tmp, override_settings(SNAPSHOT_DIR=tmp), \
+                mock.patch.object(snapshots, '_write_snapshot', side_effect=blocking_write):
+            queued = [snapshots.write_snapshot('result', f'20261019T000000-{i:08x}', frame)
+                      for i in range(snapshots.settings.SNAPSHOT_QUEUE_SIZE)]
+            dropped = snapshots.write_snapshot('result', '20261019T000000-ffffffff', frame)
+            self.assertTrue(dropped.done())
+            self.assertIsNone(dropped.result())
+            self.assertEqual(self.dropped(), before + 1)
+            release.set()
+            for future in queued:
+                future.result(timeout=5)
+            # The slots are free again once the writes finished
+            self.assertTrue(snapshots.write_snapshot('result', '20261019T000000-eeeeeeee', frame).result(timeout=5))
+        self.assertEqual(self.dropped(), before + 1)
@@ -0,0 +1,76 @@
+import numpy as np
+from django.test import SimpleTestCase
+from sklearn.cluster import DBSCAN
+from sklearn.datasets import make_blobs
+from sklearn.neighbors import KDTree
+
+from api.utills.training import fit_dbscan
+
+
+class FitDBSCANTests(SimpleTestCase):
+    """
+    fit_dbscan() against sklearn's DBSCAN: the same core points, the same
+    noise and the same clusters of core points (numbered differently). A
+    border point may get the label of any cluster with a core point within
+    eps, so only that is checked for border points.
+    """
+
+    eps = 0.3
+    min_samples = 8
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = np.random.default_rng(43)
+        X, _ = make_blobs(2000, centers=6, cluster_std=0.6, random_state=43)
+        # Scattered noise, and repeated rows that fit_dbscan() collapses into weights
+        X = np.vstack([X, rng.uniform(-12, 12, (200, 2)), np.repeat(X[:5], 20, axis=0)])
+        cls.X = np.round(X, 1)
+        cls.reference = DBSCAN(eps=cls.eps, min_samples=cls.min_samples).fit(cls.X)
+        cls.reference_core = np.zeros(len(cls.X), dtype=bool)
+        cls.reference_core[cls.reference.core_sample_indices_] = True
+
+    def fit(self, **kwargs):
+        labels, core, core_labels, _ = fit_dbscan(self.X, self.eps, self.min_samples, **kwargs)
+        is_core = (self.X[:, None, :] == core[None, :, :]).all(axis=2).any(axis=1)
+        return labels, is_core, core, core_labels
+
+    def assert_matches_sklearn(self, labels, is_core):
+        expected = self.reference.labels_
+        np.testing.assert_array_equal(is_core, self.reference_core)
+        np.testing.assert_array_equal(labels == -1, expected == -1)
+
+        # Core clusters correspond one to one
+        pairs = set(zip(labels[is_core].tolist(), expected[is_core].tolist()))
+        self.assertEqual(len(pairs), len(set(expected[is_core].tolist())))
+        self.assertEqual(len(pairs), len({label for label, _ in pairs}))
+        to_reference = dict(pairs)
+
+        tree = KDTree(self.X)
+        border = np.flatnonzero(~is_core & (labels != -1))
+        for i, neighbors in zip(border, tree.query_radius(self.X[border], self.eps)):
+            reachable = set(expected[neighbors[self.reference_core[neighbors]]].tolist())
+            self.assertIn(to_reference[labels[i]], reachable)
+
+    def test_matches_sklearn_on_core_and_noise(self):
+        labels, is_core, core, core_labels = self.fit()
+        self.assert_matches_sklearn(labels, is_core)
+        self.assertEqual(len(core), len(core_labels))
+
+    def test_small_blocks_give_the_same_labels(self):
+        labels, is_core, _, _ = self.fit()
+        blocked, blocked_core, _, _ = self.fit(block_edges=500)
+        self.assert_matches_sklearn(blocked, blocked_core)
+        np.testing.assert_array_equal(blocked, labels)
+
+    def test_border_point_between_two_clusters(self):
+        # Two dense runs of points with one point within eps of both ends but
+        # with too few neighbors to be core itself
+        left = np.column_stack([np.linspace(0, 1, 11), np.zeros(11)])
+        right = left + [1.5, 0]
+        X = np.vstack([left, right, [[1.25, 0]]])
+        labels, core, _, _ = fit_dbscan(X, 0.3, 4)
+        expected = DBSCAN(eps=0.3, min_samples=4).fit(X)
+        self.assertEqual(len(core), len(expected.core_sample_indices_))
+        self.assertNotEqual(labels[0], labels[11])
+        self.assertIn(labels[-1], (labels[0], labels[11]))
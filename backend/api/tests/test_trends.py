@@ -0,0 +1,141 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from django.test import TestCase, override_settings
+
+from api.models import AdsetTrend
+from api.utills import trends
+from api.utills.trends import EPOCH, TREND_FEATURES, fold_day, join_trends, last_day_rois, trend_frame
+
+FIRST_DAY = date(2026, 10, 1)
+HISTORY_DAYS = 12
+WINDOW = 7
+
+
+def history(seed=49):
+    """Per day, the report rows of four adsets; adset 1003 skips some days."""
+    rng = np.random.default_rng(seed)
+    days = []
+    for offset in range(HISTORY_DAYS):
+        rows = []
+        for adset in ('1001', '1002', '1003', '1004'):
+            if adset == '1003' and offset % 3 == 1:
+                continue
+            cost = float(np.round(rng.uniform(5, 50), 2))
+            rows.append({
+                'sub_id_2': adset,
+                'cost': cost,
+                'profit': float(np.round(rng.normal(0, 10), 2)),
+                'clicks': int(rng.integers(10, 200)),
+                'conversions': int(rng.integers(0, 10)),
+            })
+        days.append((FIRST_DAY + timedelta(days=offset), pd.DataFrame(rows)))
+    return days
+
+
+@override_settings(ADSET_TREND_DAYS=WINDOW)
+class FoldDayTests(TestCase):
+    """AdsetTrend's running sums against a regression over the adset's days in the window."""
+
+    def setUp(self):
+        trends._trends.update(loaded_at=None, frame=None)
+        self.addCleanup(trends._trends.update, loaded_at=None, frame=None)
+        self.history = history()
+
+    def fold(self, days):
+        for day, df in days:
+            fold_day(df, day)
+        trends._trends.update(loaded_at=None, frame=None)
+
+    def window_points(self, adset_id, last_day):
+        """(x, cost, profit, cr) of the adset's days in the window ending on last_day."""
+        points = []
+        for day, df in self.history:
+            if not last_day - timedelta(days=WINDOW - 1) <= day <= last_day:
+                continue
+            row = df[df['sub_id_2'] == adset_id]
+            if row.empty:
+                continue
+            row = row.iloc[0]
+            cr = row['conversions'] * 100 / row['clicks']
+            points.append(((day - EPOCH).days, row['cost'], row['profit'], cr))
+        return np.array(points)
+
+    def stored(self):
+        return {
+            trend.adset_id: (trend.days, trend.last_day, trend.points, trend.sum_x, trend.sum_cost, trend.sum_x_cr)
+            for trend in AdsetTrend.objects.all()
+        }
+
+    def test_features_match_polyfit_over_the_window(self):
+        self.fold(self.history)
+        last_day = self.history[-1][0]
+        frame = trend_frame()
+        for adset_id in ('1001', '1002', '1003', '1004'):
+            x, cost, profit, cr = self.window_points(adset_id, last_day).T
+            self.assertEqual(AdsetTrend.objects.get(adset_id=adset_id).days, len(x))
+            features = frame.loc[adset_id]
+            self.assertAlmostEqual(features['spend_slope'], np.polyfit(x, cost, 1)[0], places=8)
+            self.assertAlmostEqual(features['cr_slope'], np.polyfit(x, cr, 1)[0], places=8)
+            self.assertAlmostEqual(features['rolling_roi'], profit.sum() / cost.sum() * 100, places=8)
+            self.assertAlmostEqual(features['roi_day2'], profit[-1] / cost[-1] * 100, places=8)
+        # 1003 skipped the day before the last one
+        self.assertTrue(np.isnan(frame.loc['1003', 'roi_day1']))
+        x, cost, profit, _ = self.window_points('1001', last_day).T
+        self.assertAlmostEqual(frame.loc['1001', 'roi_day1'], profit[-2] / cost[-2] * 100, places=8)
+
+    def test_refolding_a_day_is_a_no_op(self):
+        self.fold(self.history)
+        before = self.stored()
+        for day, df in self.history[-3:]:
+            self.assertEqual(fold_day(df, day), 0)
+        self.assertEqual(self.stored(), before)
+
+    def test_day_leaving_the_window_is_subtracted(self):
+        self.fold(self.history[:WINDOW])
+        first_x = (FIRST_DAY - EPOCH).days
+        trend = AdsetTrend.objects.get(adset_id='1001')
+        self.assertEqual(trend.points[0][0], first_x)
+
+        self.fold(self.history[WINDOW:WINDOW + 1])
+        trend = AdsetTrend.objects.get(adset_id='1001')
+        self.assertEqual(trend.days, WINDOW)
+        self.assertEqual(trend.points[0][0], first_x + 1)
+        x, cost, _, cr = self.window_points('1001', self.history[WINDOW][0]).T
+        self.assertAlmostEqual(trend.sum_x, x.sum(), places=6)
+        self.assertAlmostEqual(trend.sum_cost, cost.sum(), places=6)
+        self.assertAlmostEqual(trend.sum_x_cr, (x * cr).sum(), places=4)
+
+    def test_silent_adset_keeps_its_days_until_reported_again(self):
+        self.fold(self.history[:WINDOW])
+        # Three days later, with only 1002 reported
+        for day, df in self.history[WINDOW:WINDOW + 3]:
+            fold_day(df[df['sub_id_2'] == '1002'], day)
+        self.assertEqual(AdsetTrend.objects.get(adset_id='1001').days, WINDOW)
+        self.assertEqual(AdsetTrend.objects.get(adset_id='1002').days, WINDOW)
+
+        day, df = self.history[WINDOW + 3]
+        fold_day(df, day)
+        self.assertEqual(AdsetTrend.objects.get(adset_id='1001').days, WINDOW - 3)
+
+    def test_adsets_without_a_trend_join_as_nan(self):
+        self.fold(self.history)
+        df = pd.DataFrame({'sub_id_2': ['1001', '9999', '1004']})
+        join_trends(df)
+        for col in TREND_FEATURES:
+            self.assertTrue(np.isnan(df.loc[1, col]))
+        self.assertFalse(np.isnan(df.loc[0, 'spend_slope']))
+
+    def test_join_without_any_trend(self):
+        df = pd.DataFrame({'sub_id_2': ['1001']})
+        join_trends(df)
+        self.assertTrue(df[list(TREND_FEATURES)].isna().all(axis=None))
+
+    def test_last_day_rois(self):
+        self.assertTrue(all(np.isnan(value) for value in last_day_rois([])))
+        day1, day2 = last_day_rois([[10, 20.0, 5.0, 1.0], [11, 0.0, -3.0, 0.0]])
+        self.assertEqual((day1, day2), (25.0, 0.0))
+        day1, day2 = last_day_rois([[10, 20.0, 5.0, 1.0], [12, 10.0, 5.0, 0.0]])
+        self.assertTrue(np.isnan(day1))
+        self.assertEqual(day2, 50.0)
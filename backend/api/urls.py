@@ -5,8 +5,11 @@ from .views import (
     PredictCampaignsUpdateView,
     PredictCampaignsDailyView,
     PredictDateRangeView,
-    UpdateAdsetStatusAPIView
+    UpdateAdsetStatusAPIView,
+    ReadinessView,
+    ModelVersionView,
 ) 
+from .async_views import AsyncPredictCampaignsDailyView, AsyncPredictDateRangeView
 
 urlpatterns = [
     path('prediction-run/', PredictCampaignsView.as_view(), name='predict-campaigns'),
@@ -15,4 +18,8 @@ urlpatterns = [
     path('prediction-daily/', PredictCampaignsDailyView.as_view(), name='daily-predict-campaigns'),
     path('predict-date-range/', PredictDateRangeView.as_view(), name='predict-date-range'),
     path('update-adset-status/', UpdateAdsetStatusAPIView.as_view(), name='update-adset-status'),
+    path('ready/', ReadinessView.as_view(), name='ready'),
+    path('model-version/', ModelVersionView.as_view(), name='model-version'),
+    path('async/prediction-daily/', AsyncPredictCampaignsDailyView.as_view(), name='daily-predict-campaigns-async'),
+    path('async/predict-date-range/', AsyncPredictDateRangeView.as_view(), name='predict-date-range-async'),
 ]
\ No newline at end of file
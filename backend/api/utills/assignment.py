@@ -0,0 +1,203 @@
+import os
+import sys
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+from django.conf import settings
+from sklearn.neighbors import NearestNeighbors
+
+from api.utills.metrics import registry
+
+
+# Inference refits DBSCAN on every batch ('refit'): an adset's cluster then
+# depends on every other row of the batch, and even the cluster numbers
+# change with the row order, so a label can never be reused for an unchanged
+# adset. With CLUSTER_ASSIGNMENT='core' every adset is labeled inductively
+# from the core points of the trained bundle instead (the cluster of the
+# nearest core point within eps, as DBSCAN labels border points). The label
+# and the recommendation then only depend on the model version and the
+# adset's own values, and are cached per adset in a per-process LRU keyed by
+# (model, rules, fingerprint of the scaled features and rule inputs), so a
+# poll only computes the adsets that changed since the last one.
+CLUSTER_ASSIGNMENTS = ('refit', 'core')
+# dict slot, OrderedDict links and the (value, size) pair of an entry
+ENTRY_OVERHEAD = 200
+
+registry.describe('pipeline_cluster_cache_lookups_total', 'counter', 'Cluster assignment cache lookups by outcome (hit/miss).')
+registry.describe('pipeline_cluster_cache_evictions_total', 'counter', 'Cluster assignment cache evictions by the bound that was hit.')
+registry.describe('pipeline_cluster_cache_hit_ratio', 'gauge', 'Share of adsets whose cluster and recommendation came from the cache.')
+registry.describe('pipeline_cluster_cache_entries', 'gauge', 'Entries held by the cluster assignment cache of this process.')
+registry.describe('pipeline_cluster_cache_bytes', 'gauge', 'Approximate memory used by the cluster assignment cache.')
+
+_assigners = OrderedDict()
+_assigners_lock = threading.Lock()
+_cache = []
+_cache_lock = threading.Lock()
+
+
+class CoreAssigner:
+    """Labels points like DBSCAN labels border points: the cluster of the nearest core point within eps."""
+
+    def __init__(self, core, core_labels, eps, n_jobs=None):
+        self.core_labels = core_labels
+        self.eps = eps
+        self.model = None
+        self.nn = NearestNeighbors(n_neighbors=1, n_jobs=n_jobs).fit(core) if len(core) else None
+
+    def predict(self, X):
+        if self.nn is None:
+            return np.full(len(X), -1)
+        distances, indices = self.nn.kneighbors(X)
+        return np.where(distances[:, 0] <= self.eps, self.core_labels[indices[:, 0]], -1)
+
+
+def bundle_core(bundle):
+    """(core points, core labels) of a bundle, None when it has none."""
+    if 'core_points' in bundle:
+        return bundle['core_points'], bundle['core_labels']
+    # Bundles saved with the DBSCAN fitted on the training data
+    dbscan = bundle['dbscan']
+    if getattr(dbscan, 'components_', None) is not None and hasattr(dbscan, 'labels_'):
+        return dbscan.components_, dbscan.labels_[dbscan.core_sample_indices_]
+    return None
+
+
+def bundle_assigner(model_path, bundle):
+    """
+    The CoreAssigner of a loaded bundle (built once per bundle), or None when
+    inference refits per batch or the bundle has no core points.
+    """
+    if settings.CLUSTER_ASSIGNMENT != 'core':
+        return None
+    with _assigners_lock:
+        cached = _assigners.get(model_path)
+        if cached is not None and cached[0] is bundle:
+            return cached[1]
+        core = bundle_core(bundle)
+        if core is None:
+            print(f"[WARNING] {os.path.basename(model_path)} has no core points, clustering per batch")
+            assigner = None
+        else:
+            assigner = CoreAssigner(core[0], np.asarray(core[1]), bundle['dbscan'].eps)
+            # Cache key of the model: a bundle replaced in place gets a new mtime
+            assigner.model = f"{os.path.basename(model_path)}@{os.path.getmtime(model_path)}"
+        _assigners[model_path] = (bundle, assigner)
+        _assigners.move_to_end(model_path)
+        # The served bundle and the one in-flight requests may still use
+        while len(_assigners) > 2:
+            _assigners.popitem(last=False)
+    return assigner
+
+
+def entry_size(key, value):
+    label, fields = value
+    return (
+        ENTRY_OVERHEAD + sys.getsizeof(key) + sys.getsizeof(key[-1]) + sys.getsizeof(value)
+        + sys.getsizeof(fields) + sum(sys.getsizeof(field) for field in fields)
+    )
+
+
+class AssignmentCache:
+    """LRU of (model, rules, fingerprint) -> (label, recommendation fields), bounded by entries and bytes."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.bytes = 0
+        self.hits = self.misses = 0
+        self.evictions = Counter()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        values = []
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    values.append(None)
+                else:
+                    self.entries.move_to_end(key)
+                    values.append(entry[0])
+            hits = sum(value is not None for value in values)
+            self.hits += hits
+            self.misses += len(values) - hits
+        registry.inc('pipeline_cluster_cache_lookups_total', {'result': 'hit'}, hits)
+        registry.inc('pipeline_cluster_cache_lookups_total', {'result': 'miss'}, len(values) - hits)
+        return values
+
+    def put_many(self, items):
+        evicted = Counter()
+        with self.lock:
+            for key, value in items:
+                size = entry_size(key, value)
+                old = self.entries.pop(key, None)
+                if old is not None:
+                    self.bytes -= old[1]
+                self.entries[key] = (value, size)
+                self.bytes += size
+            while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, (_, size) = self.entries.popitem(last=False)
+                self.bytes -= size
+                evicted['entries' if len(self.entries) >= self.max_entries else 'memory'] += 1
+            self.evictions.update(evicted)
+        for reason, count in evicted.items():
+            registry.inc('pipeline_cluster_cache_evictions_total', {'reason': reason}, count)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': dict(self.evictions),
+            }
+
+
+def assignment_cache():
+    if not _cache:
+        with _cache_lock:
+            if not _cache:
+                _cache.append(AssignmentCache(settings.CLUSTER_CACHE_MAX_ENTRIES, settings.CLUSTER_CACHE_MAX_BYTES))
+    return _cache[0]
+
+
+def fingerprints(X, rule_inputs):
+    """One bytes key per row: the scaled features and the rule inputs, exactly."""
+    values = np.ascontiguousarray(np.column_stack([X, rule_inputs]), dtype=np.float64)
+    return values.view(np.dtype((np.void, values.shape[1] * 8))).ravel().tolist()
+
+
+def assign_cached(assigner, rules, X, rule_inputs, recommend):
+    """
+    Cluster label and recommendation fields of every row of X. ``rule_inputs``
+    (roi_confirmed, cost) are what ``recommend(rule_inputs + cluster)`` reads;
+    only rows not cached for this (model, rules) are labeled and recommended.
+    Returns (labels, fields).
+    """
+    keys = [(assigner.model, rules, fp) for fp in fingerprints(X, rule_inputs.to_numpy(dtype=np.float64))]
+    cache = assignment_cache()
+    values = cache.get_many(keys)
+    misses = [i for i, value in enumerate(values) if value is None]
+    if misses:
+        labels = assigner.predict(X[misses])
+        fields = recommend(rule_inputs.iloc[misses].assign(cluster=labels))
+        computed = [(int(label), tuple(row)) for label, row in zip(labels, fields)]
+        for i, value in zip(misses, computed):
+            values[i] = value
+        cache.put_many((keys[i], value) for i, value in zip(misses, computed))
+    return np.array([value[0] for value in values], dtype=np.int64), [value[1] for value in values]
+
+
+def collect_cluster_cache_metrics():
+    stats = assignment_cache().stats()
+    registry.set('pipeline_cluster_cache_hit_ratio', {}, stats['hit_ratio'])
+    registry.set('pipeline_cluster_cache_entries', {}, stats['entries'])
+    registry.set('pipeline_cluster_cache_bytes', {}, stats['bytes'])
+
+
+registry.register_collector(collect_cluster_cache_metrics)
@@ -3,9 +3,15 @@ import json
 import pandas as pd
 import numpy as np
 import joblib
+from sklearn.base import clone
 from datetime import datetime
 import warnings
 from django.conf import settings
+from api.utills.assignment import assign_cached, bundle_assigner
+from api.utills.features import FeatureBuilder, prepare_report
+from api.utills.model_store import active_model_path
+from api.utills.warmup import load_bundle
+from api.utills.schema import apply_report_schema, output_frame, to_exact_records
 from collections import defaultdict
 
 warnings.filterwarnings('ignore')
@@ -14,7 +20,7 @@ warnings.filterwarnings('ignore')
 class DBSCANCampaignInference:
     def __init__(self, model_path=None):
         if model_path is None:
-            model_path = os.path.join(settings.MEDIA_ROOT, 'dbscan_model_bundle_latest.pkl')
+            model_path = active_model_path()
 
         self.model_path = model_path
         self.model_bundle = None
@@ -26,45 +32,62 @@ class DBSCANCampaignInference:
     def load_model(self):
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Model file not found: {self.model_path}")
-        self.model_bundle = joblib.load(self.model_path)
+        self.model_bundle = load_bundle(self.model_path)
         self.scaler = self.model_bundle['scaler']
-        self.dbscan = self.model_bundle['dbscan']
+        # predict_clusters() refits DBSCAN on every batch, so work on a copy
+        # instead of mutating the bundle shared by the whole process
+        self.dbscan = clone(self.model_bundle['dbscan'])
         self.features = self.model_bundle['features']
+        self.builder = FeatureBuilder(self.features, self.scaler)
+        self.assigner = bundle_assigner(self.model_path, self.model_bundle)
 
-    def preprocess_data(self, df):
-        numeric_cols = ['cost', 'revenue', 'profit', 'clicks', 'campaign_unique_clicks',
-                        'conversions', 'roi_confirmed', 'lp_clicks', 'cr', 'lp_ctr']
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        df = df.fillna(0)
-        if 'revenue' in df.columns and 'cost' in df.columns:
-            df['revenue_to_cost_ratio'] = df['revenue'] / (df['cost'] + 1e-6)
-        if 'conversions' in df.columns and 'clicks' in df.columns:
-            df['conversion_rate'] = df['conversions'] / (df['clicks'] + 1e-6)
-        if 'profit' in df.columns and 'cost' in df.columns:
-            df['profit_margin'] = df['profit'] / (df['cost'] + 1e-6)
-        return df
-
-    def extract_features(self, df):
-        feature_data = {}
-        for feature in self.features:
-            if feature in df.columns:
-                feature_data[feature] = df[feature]
-            else:
-                feature_data[feature] = np.zeros(len(df))
-        X = pd.DataFrame(feature_data)
-        return X
+    def build_features(self, df):
+        """The typed adset frame with the derived ratio columns, and its scaled feature matrix."""
+        df = prepare_report(df)
+        X, ratios = self.builder.build(df)
+        for name, values in ratios.items():
+            df[name] = values
+        return df, X
 
-    def predict_clusters(self, X):
-        X_scaled = self.scaler.transform(X)
+    def predict_clusters(self, X_scaled):
         labels = self.dbscan.fit_predict(X_scaled)
         return labels
 
-    def generate_recommendations(self, df, labels):
-        df_result = df.copy()
+    def generate_recommendations(self, df, labels, recommendations=None):
+        # build_features() already returned a frame of our own
+        df_result = df
         df_result['cluster'] = labels
+        if recommendations is None:
+            recommendations = self.recommend(self.rule_inputs(df_result).assign(cluster=labels))
+        df_result['recommendation'] = [r[0] for r in recommendations]
+        df_result['reason'] = [r[1] for r in recommendations]
+        df_result['suggestion'] = [r[2] for r in recommendations]
+        df_result['budget_change_pct'] = [r[3] if r[3] is not None else 0 for r in recommendations]
+        df_result['raw_budget_change_pct'] = df_result['budget_change_pct']
+
+        priority_map = {
+            'PAUSE': 1,
+            'INCREASE_BUDGET': 2,
+            'REDUCE_BUDGET': 3,
+            'OPTIMIZE': 4,
+            'RESTRUCTURE': 5,
+            'KEEP_RUNNING': 6,
+            'MONITOR_CLOSELY': 7,
+            'REVIEW': 8
+        }
+        df_result['priority'] = df_result['recommendation'].map(priority_map).fillna(99)
+        apply_report_schema(df_result)
+        df_result = df_result.sort_values(['priority', 'roi_confirmed'], ascending=[True, False])
+        return df_result
 
+    @staticmethod
+    def rule_inputs(df):
+        return pd.DataFrame({
+            col: df[col].to_numpy(dtype=np.float64) for col in ('roi_confirmed', 'cost') if col in df.columns
+        }, index=df.index)
+
+    def recommend(self, rule_inputs):
+        """The recommendation fields of every row of ``rule_inputs`` (roi_confirmed, cost, cluster)."""
         def get_recommendation(row):
             cluster = row['cluster']
             roi = row.get('roi_confirmed', 0)
@@ -104,36 +127,27 @@ class DBSCANCampaignInference:
                     return "RESTRUCTURE", f"Low spend with poor ROI {roi:.1f}%", "Restructure campaign from scratch", 0
             return "REVIEW", "Unknown cluster", "Manual review required", 0
 
-        recommendations = df_result.apply(get_recommendation, axis=1)
-        df_result['recommendation'] = [r[0] for r in recommendations]
-        df_result['reason'] = [r[1] for r in recommendations]
-        df_result['suggestion'] = [r[2] for r in recommendations]
-        df_result['budget_change_pct'] = [r[3] if r[3] is not None else 0 for r in recommendations]
-        df_result['raw_budget_change_pct'] = df_result['budget_change_pct']
-
-        priority_map = {
-            'PAUSE': 1,
-            'INCREASE_BUDGET': 2,
-            'REDUCE_BUDGET': 3,
-            'OPTIMIZE': 4,
-            'RESTRUCTURE': 5,
-            'KEEP_RUNNING': 6,
-            'MONITOR_CLOSELY': 7,
-            'REVIEW': 8
-        }
-        df_result['priority'] = df_result['recommendation'].map(priority_map).fillna(99)
-        df_result = df_result.sort_values(['priority', 'roi_confirmed'], ascending=[True, False])
-        return df_result
+        if rule_inputs.empty:
+            return []
+        return list(rule_inputs.apply(get_recommendation, axis=1))
 
-    def analyze_recommendations(self, df_result):
-        pass
+    def assign_clusters(self, df, X):
+        """
+        Labels of the rows of X, with their recommendation fields when they
+        come from the cluster assignment cache (api/utills/assignment.py);
+        None for the fields means generate_recommendations() computes them.
+        """
+        if self.assigner is None:
+            return self.predict_clusters(X), None
+        return assign_cached(self.assigner, 'combine', X, self.rule_inputs(df), self.recommend)
 
     def save_results(self, df_result, output_prefix='inference_results'):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        df_output = output_frame(df_result)
         csv_path = f"{output_prefix}.csv"
-        df_result.to_csv(csv_path, index=False)
+        df_output.to_csv(csv_path, index=False)
         json_path = f"{output_prefix}.json"
-        df_result.to_json(json_path, orient='records', indent=2)
+        df_output.to_json(json_path, orient='records', indent=2)
         return csv_path, json_path
 
     def run_inference(self, data_source, save_results=True):
@@ -143,11 +157,9 @@ class DBSCANCampaignInference:
             df = pd.DataFrame(data_source)
         else:
             raise ValueError("data_source should be dict with 'adset' key or list of adsets")
-        df_processed = self.preprocess_data(df)
-        X = self.extract_features(df_processed)
-        labels = self.predict_clusters(X)
-        df_result = self.generate_recommendations(df_processed, labels)
-        self.analyze_recommendations(df_result)
+        df_processed, X = self.build_features(df)
+        labels, recommendations = self.assign_clusters(df_processed, X)
+        df_result = self.generate_recommendations(df_processed, labels, recommendations)
         if save_results:
             self.save_results(df_result)
         return df_result
@@ -167,7 +179,7 @@ def enrich_campaign_data(input_data, model_path=None):
     # Run DBSCAN inference
     inference = DBSCANCampaignInference(model_path=model_path)
     df_result = inference.run_inference(all_adsets, save_results=False)
-    adsets_with_recs = df_result.to_dict(orient='records')
+    adsets_with_recs = to_exact_records(df_result)
 
     # Filter budgeted adsets (>= $5 spend)
     budgeted_adsets = [a for a in adsets_with_recs if a.get('cost', 0) >= 5]
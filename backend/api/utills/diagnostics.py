@@ -0,0 +1,153 @@
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+
+from api.utills.metrics import registry
+
+
+# What analyze_recommendations() used to compute (and throw away) on every
+# inference: the recommendation mix, a per-cluster summary and the top
+# actions. run_live_inference() now only keeps the DIAGNOSTIC_COLUMNS of the
+# latest result of the process (a copy of those columns, so the full result
+# frame is not held past its request); the report is built from them when a
+# staff request asks for it (?diagnostics=1, api/middleware.py) or /metrics
+# is scraped, once per result.
+DIAGNOSTIC_COLUMNS = (
+    'recommendation', 'cluster', 'priority', 'roi_confirmed', 'cost', 'revenue',
+    'sub_id_6', 'sub_id_3', 'sub_id_2',
+)
+TOP_ACTIONS = 10
+# Priorities of PAUSE and INCREASE_BUDGET
+TOP_ACTION_PRIORITY = 2
+
+registry.describe('pipeline_recommendation_adsets', 'gauge', 'Adsets per recommendation in the latest inference result.')
+registry.describe('pipeline_cluster_adsets', 'gauge', 'Adsets per cluster in the latest inference result.')
+registry.describe('pipeline_cluster_roi_mean', 'gauge', 'Mean confirmed ROI per cluster in the latest inference result.')
+
+# Per-request list of the results kept while it ran; set by the middleware
+result_listener = ContextVar('diagnostics_listener', default=None)
+
+_latest = {'result': None, 'report': None}
+_latest_lock = Lock()
+_gauge_labels = set()
+
+
+class KeptResult:
+    __slots__ = ('run_id', 'source', 'frame')
+
+    def __init__(self, run_id, source, frame):
+        self.run_id = run_id
+        self.source = source
+        self.frame = frame
+
+
+def keep_result(df_result, source, run_id=None):
+    """Keep the DIAGNOSTIC_COLUMNS of an inference result for a later report."""
+    frame = df_result[[col for col in DIAGNOSTIC_COLUMNS if col in df_result.columns]]
+    kept = KeptResult(run_id, source, frame)
+    with _latest_lock:
+        _latest['result'] = kept
+        _latest['report'] = None
+    listener = result_listener.get()
+    if listener is not None:
+        listener.append(kept)
+
+
+def build_report(kept, top=TOP_ACTIONS):
+    """Recommendation mix, cluster summary and top actions of a kept result."""
+    df = kept.frame
+    report = {'run_id': kept.run_id, 'source': kept.source, 'adsets': len(df)}
+    if df.empty or 'recommendation' not in df.columns:
+        return {**report, 'recommendations': {}, 'clusters': [], 'top_actions': []}
+
+    counts = df['recommendation'].value_counts(sort=True)
+    counts = counts[counts > 0]
+    report['recommendations'] = {
+        str(name): {'adsets': int(count), 'share': round(float(count) / len(df), 4)}
+        for name, count in counts.items()
+    }
+
+    clusters = []
+    if 'cluster' in df.columns:
+        aggregations = {'adsets': ('cluster', 'size')}
+        for name, col, func in (('roi_mean', 'roi_confirmed', 'mean'), ('cost', 'cost', 'sum'), ('revenue', 'revenue', 'sum')):
+            if col in df.columns:
+                aggregations[name] = (col, func)
+        summary = df.groupby('cluster', observed=True).agg(**aggregations).round(2)
+        clusters = summary.reset_index().to_dict(orient='records')
+    report['clusters'] = clusters
+
+    actions = df
+    if 'priority' in df.columns:
+        actions = df[df['priority'] <= TOP_ACTION_PRIORITY]
+    fields = {'sub_id_6': 'campaign', 'sub_id_3': 'campaign_id', 'sub_id_2': 'adset_id',
+              'recommendation': 'recommendation', 'roi_confirmed': 'roi_confirmed', 'cost': 'cost'}
+    fields = {col: name for col, name in fields.items() if col in df.columns}
+    top_actions = actions.head(top)[list(fields)].rename(columns=fields)
+    for col in ('roi_confirmed', 'cost'):
+        if col in top_actions.columns:
+            top_actions[col] = top_actions[col].round(2)
+    report['top_actions'] = json.loads(top_actions.to_json(orient='records'))
+    return report
+
+
+def latest_report():
+    """build_report() of the latest kept result (built once per result), None before the first."""
+    with _latest_lock:
+        kept, report = _latest['result'], _latest['report']
+    if kept is None or report is not None:
+        return report
+    report = build_report(kept)
+    with _latest_lock:
+        if _latest['result'] is kept:
+            _latest['report'] = report
+    return report
+
+
+def request_diagnostics(kept_results):
+    """
+    The ``diagnostics`` block of a response: reports of the results this
+    request computed, or of the latest one of the process when it was
+    served from a cache.
+    """
+    if kept_results:
+        return {'scope': 'request', 'results': [build_report(kept) for kept in kept_results]}
+    report = latest_report()
+    return {'scope': 'latest', 'results': [report] if report is not None else []}
+
+
+@contextmanager
+def collect_results():
+    """Collect the results kept inside the block (including executor threads)."""
+    kept = []
+    token = result_listener.set(kept)
+    try:
+        yield kept
+    finally:
+        result_listener.reset(token)
+
+
+def collect_diagnostics_metrics():
+    report = latest_report()
+    if report is None:
+        return
+    labels = set()
+    for name, entry in report['recommendations'].items():
+        labels.add(('pipeline_recommendation_adsets', 'recommendation', name))
+        registry.set('pipeline_recommendation_adsets', {'recommendation': name}, entry['adsets'])
+    for entry in report['clusters']:
+        cluster = str(entry['cluster'])
+        labels.add(('pipeline_cluster_adsets', 'cluster', cluster))
+        registry.set('pipeline_cluster_adsets', {'cluster': cluster}, entry['adsets'])
+        if 'roi_mean' in entry:
+            labels.add(('pipeline_cluster_roi_mean', 'cluster', cluster))
+            registry.set('pipeline_cluster_roi_mean', {'cluster': cluster}, entry['roi_mean'])
+    # Recommendations and clusters gone from the latest result read 0
+    for name, label, value in _gauge_labels - labels:
+        registry.set(name, {label: value}, 0)
+    _gauge_labels.update(labels)
+
+
+registry.register_collector(collect_diagnostics_metrics)
@@ -0,0 +1,165 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pyarrow as pa
+from django.conf import settings
+
+from api.utills.metrics import registry
+
+
+# enrich_campaign_data() is CPU bound pandas/sklearn work per campaign. For
+# large reports the campaigns are split into contiguous shards (balanced by
+# adset count) and enriched on a persistent process pool whose workers load
+# the served model bundle once, in their initializer. A shard travels as one
+# Arrow IPC stream of its adset rows plus the campaign fields, not as pickled
+# dicts; the enriched campaigns come back in order. Small reports, a pool
+# that failed and ENRICH_PROCESSES < 2 stay in this process.
+SHARDS_PER_PROCESS = 4
+IPC_OPTIONS = pa.ipc.IpcWriteOptions(compression='lz4' if pa.Codec.is_available('lz4') else None)
+
+registry.describe('pipeline_enrich_batches_total', 'counter', 'Enrichment batches by where they ran (pool/inline).')
+
+_pool = []
+_pool_lock = threading.Lock()
+_worker = {'model_path': None}
+
+
+def encode_shard(groups):
+    """(Arrow IPC bytes of every adset row, campaign fields without 'adset', row offsets) of ``groups``."""
+    rows = [row for group in groups for row in group['adset']]
+    # Table.from_pylist() would only keep the keys of the first row
+    columns = {}
+    for col in dict.fromkeys(key for row in rows for key in row):
+        values = pa.array([row.get(col) for row in rows])
+        # Sub ids, geo and the recommendation texts repeat across rows
+        columns[col] = values.dictionary_encode() if pa.types.is_string(values.type) else values
+    table = pa.table(columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=IPC_OPTIONS) as writer:
+        writer.write_table(table)
+    campaigns = [{key: value for key, value in group.items() if key != 'adset'} for group in groups]
+    offsets = np.cumsum([0] + [len(group['adset']) for group in groups]).tolist()
+    return sink.getvalue().to_pybytes(), campaigns, offsets
+
+
+def decode_shard(payload, campaigns, offsets):
+    table = pa.ipc.open_stream(payload).read_all()
+    return [
+        {**campaign, 'adset': table.slice(start, stop - start).to_pylist()}
+        for campaign, start, stop in zip(campaigns, offsets, offsets[1:])
+    ]
+
+
+def _init_worker(model_path):
+    import django
+    django.setup()
+    from api.utills.combine_inference import DBSCANCampaignInference
+    if model_path and os.path.exists(model_path):
+        # Loads the bundle (and its FeatureBuilder/assigner) before the first shard
+        DBSCANCampaignInference(model_path)
+        _worker['model_path'] = model_path
+
+
+def _enrich_shard(model_path, payload, campaigns, offsets):
+    from api.utills.combine_inference import enrich_campaign_data
+    from api.utills.warmup import evict_bundles
+    if model_path != _worker['model_path']:
+        # A model hot-swap: drop the previous version's bundle
+        evict_bundles(keep={model_path})
+        _worker['model_path'] = model_path
+    return [
+        enrich_campaign_data(group, model_path=model_path)
+        for group in decode_shard(payload, campaigns, offsets)
+    ]
+
+
+def shard(groups, n_shards):
+    """Split ``groups`` into at most ``n_shards`` contiguous runs of about equal adset counts."""
+    sizes = np.array([len(group['adset']) for group in groups])
+    if not len(sizes):
+        return []
+    bounds = np.cumsum(sizes) * n_shards // max(int(sizes.sum()), 1)
+    cuts = np.flatnonzero(np.diff(np.minimum(bounds, n_shards - 1))) + 1
+    return [groups[start:stop] for start, stop in zip([0, *cuts], [*cuts, len(groups)])]
+
+
+class EnrichmentPool:
+    """A persistent process pool enriching campaign shards with ``model_path`` preloaded."""
+
+    def __init__(self, processes, model_path=None):
+        from api.utills.model_store import active_model_path
+        self.processes = processes
+        # forkserver: never fork a gunicorn worker that runs request threads
+        self.executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('forkserver'),
+            initializer=_init_worker,
+            initargs=(model_path or active_model_path(),),
+        )
+
+    def map(self, groups, model_path):
+        futures = [
+            self.executor.submit(_enrich_shard, model_path, *encode_shard(part))
+            for part in shard(groups, self.processes * SHARDS_PER_PROCESS)
+        ]
+        return [campaign for future in futures for campaign in future.result()]
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def enrichment_pool():
+    """The process-wide EnrichmentPool (started on first use), None when ENRICH_PROCESSES < 2."""
+    if settings.ENRICH_PROCESSES < 2:
+        return None
+    if not _pool:
+        with _pool_lock:
+            if not _pool:
+                _pool.append(EnrichmentPool(settings.ENRICH_PROCESSES))
+    return _pool[0]
+
+
+def discard_pool(pool):
+    with _pool_lock:
+        if _pool and _pool[0] is pool:
+            _pool.clear()
+    pool.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def enrich_campaigns(groups, model_path, pool=None, min_adsets=None):
+    """
+    enrich_campaign_data() of every group, in order: on the enrichment pool
+    when the groups hold at least ``min_adsets`` (ENRICH_PARALLEL_MIN_ADSETS)
+    adsets, in this process otherwise or when the pool fails.
+    """
+    from api.utills.combine_inference import enrich_campaign_data
+    min_adsets = settings.ENRICH_PARALLEL_MIN_ADSETS if min_adsets is None else min_adsets
+    # Groups without an adset list (e.g. grouped by day) pass through unchanged
+    parallel = [i for i, group in enumerate(groups) if group.get('adset')]
+    if parallel and sum(len(groups[i]['adset']) for i in parallel) >= min_adsets:
+        pool = pool or enrichment_pool()
+    else:
+        pool = None
+    if pool is not None:
+        try:
+            enriched = pool.map([groups[i] for i in parallel], model_path)
+        except BrokenProcessPool as e:
+            print(f"[ERROR] Enrichment pool broken, enriching in process: {e}")
+            discard_pool(pool)
+        except Exception as e:
+            print(f"[ERROR] Enrichment pool failed, enriching in process: {e}")
+        else:
+            registry.inc('pipeline_enrich_batches_total', {'mode': 'pool'})
+            results = [None] * len(groups)
+            for i, campaign in zip(parallel, enriched):
+                results[i] = campaign
+            return [
+                campaign if campaign is not None else enrich_campaign_data(group, model_path=model_path)
+                for group, campaign in zip(groups, results)
+            ]
+    registry.inc('pipeline_enrich_batches_total', {'mode': 'inline'})
+    return [enrich_campaign_data(group, model_path=model_path) for group in groups]
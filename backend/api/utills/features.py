@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+from sklearn.preprocessing import StandardScaler
+
+from api.utills.schema import FLOAT_COLUMNS, INT_COLUMNS, apply_report_schema, fill_missing
+
+
+# Tracker columns coerced to numbers before the schema is applied (the raw
+# JSON of the enrichment step may carry them as strings)
+NUMERIC_COLUMNS = [
+    'cost', 'revenue', 'profit', 'clicks', 'campaign_unique_clicks',
+    'conversions', 'roi_confirmed', 'lp_clicks', 'cr', 'lp_ctr',
+]
+# Derived ratio -> (numerator, denominator), float64 like the columns they come from
+RATIOS = {
+    'revenue_to_cost_ratio': ('revenue', 'cost'),
+    'conversion_rate': ('conversions', 'clicks'),
+    'profit_margin': ('profit', 'cost'),
+}
+_FLOAT_DTYPES = (np.float64, np.float32, np.float16)
+
+
+def prepare_report(df):
+    """Numeric coercion, report schema and missing values as 0: the typed frame the results are built from."""
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns and not is_numeric_dtype(df[col].dtype):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return fill_missing(apply_report_schema(df))
+
+
+def report_column(df, col):
+    """
+    ``df[col]`` as a numpy array with the values prepare_report() would give
+    it, without touching the frame (no copy for an already typed column).
+    """
+    series = df[col]
+    if col in FLOAT_COLUMNS:
+        if series.dtype != np.float64:
+            series = pd.to_numeric(series, errors='coerce').astype(np.float64)
+    elif col in INT_COLUMNS:
+        if series.dtype != np.int32:
+            return pd.to_numeric(series, errors='coerce').fillna(0).to_numpy(dtype=np.int32)
+    elif not is_numeric_dtype(series.dtype):
+        series = pd.to_numeric(series, errors='coerce')
+    if series.hasnans:
+        series = series.fillna(0)
+    return series.to_numpy()
+
+
+def missing_features(df, features):
+    """Features that are neither columns of ``df`` nor RATIOS of its columns."""
+    return [
+        feature for feature in features
+        if feature not in df.columns
+        and not (feature in RATIOS and all(col in df.columns for col in RATIOS[feature]))
+    ]
+
+
+def derive_ratios(df):
+    """
+    The RATIOS whose inputs ``df`` has, as {name: float64 array}. The arrays
+    are row views of one contiguous block.
+    """
+    names = [name for name, cols in RATIOS.items() if all(col in df.columns for col in cols)]
+    block = np.empty((len(names), len(df)), dtype=np.float64)
+    ratios = {}
+    for row, name in zip(block, names):
+        numerator, denominator = (report_column(df, col) for col in RATIOS[name])
+        np.divide(numerator, denominator + 1e-6, out=row)
+        ratios[name] = row
+    return ratios
+
+
+class FeatureBuilder:
+    """
+    Feature matrix of a model bundle straight from the report columns: every
+    feature is written once into a preallocated C-contiguous array in bundle
+    order and centered/scaled in place, with no intermediate frames. Built
+    once per bundle; ``scaler=None`` gives the unscaled features (training).
+    """
+
+    def __init__(self, features, scaler=None):
+        self.features = list(features)
+        self.scaler = scaler
+        # A StandardScaler is fused into build(); anything else is applied after it
+        self.fused = scaler is None or isinstance(scaler, StandardScaler)
+        self.mean = scaler.mean_ if isinstance(scaler, StandardScaler) and scaler.with_mean else None
+        self.scale = scaler.scale_ if isinstance(scaler, StandardScaler) and scaler.with_std else None
+        self.warned = set()
+
+    def sources(self, df, ratios):
+        columns = []
+        for feature in self.features:
+            if feature in ratios:
+                columns.append(ratios[feature])
+            elif feature in df.columns:
+                columns.append(report_column(df, feature))
+            else:
+                if feature not in self.warned:
+                    self.warned.add(feature)
+                    print(f"[WARNING] Feature '{feature}' not found, using zeros")
+                columns.append(None)
+        return columns
+
+    def build(self, df, dtype=None):
+        """
+        Returns (X, ratios): the (scaled) feature matrix and derive_ratios()
+        of ``df``. ``dtype`` defaults to the one scaler.transform() would
+        compute in (float64 for the report columns); training passes float32
+        to halve its feature buffers.
+        """
+        ratios = derive_ratios(df)
+        columns = self.sources(df, ratios)
+        if dtype is None:
+            dtype = np.result_type(*(np.float64 if col is None else col.dtype for col in columns))
+            if dtype not in _FLOAT_DTYPES:
+                dtype = np.float64
+        X = np.empty((len(df), len(columns)), dtype=dtype)
+        for j, col in enumerate(columns):
+            if col is None:
+                X[:, j] = 0
+            else:
+                X[:, j] = col
+        if not self.fused:
+            return self.scaler.transform(X), ratios
+        if self.mean is not None:
+            X -= self.mean
+        if self.scale is not None:
+            X /= self.scale
+        return X, ratios
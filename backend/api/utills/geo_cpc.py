@@ -0,0 +1,139 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+
+# add_cpc_level() bands every adset's CPC by its z-score against the CPC
+# mean/std of its geo. With CPC_REFERENCE='batch' those come from the rows
+# of the same report, so a small report gets unstable bands (or none, for a
+# geo with one adset). With CPC_REFERENCE='geo' they come from GeoCpcStats:
+# the running count/mean/M2 of every finished tracker day, which the
+# scheduler (api/utills/history.py) folds in once a day with Chan's
+# parallel form of Welford's update. Geos without enough reference rows still use the batch.
+CPC_REFERENCES = ('batch', 'geo')
+# A geo whose CPCs are all equal has std 0
+MIN_STD = 1e-6
+
+_reference = {'loaded_at': None, 'stats': None}
+_reference_lock = threading.Lock()
+
+
+def cpc_bands(z):
+    """LOW/STANDARD/HIGH per z-score (beyond one std), INSUFFICIENT_DATA where it is NaN."""
+    z = np.asarray(z)
+    return np.select(
+        [np.isnan(z), z < -1, z > 1],
+        ['INSUFFICIENT_DATA', 'LOW', 'HIGH'],
+        'STANDARD',
+    ).astype(object)
+
+
+def batch_moments(cpc, geo):
+    """Mean and sample std of the CPCs of each row's geo within the batch."""
+    groups = cpc.groupby(geo, observed=True)
+    return groups.transform('mean'), groups.transform('std')
+
+
+def reference_stats():
+    """
+    GeoCpcStats as a (mean, std) frame indexed by geo, geos with at least
+    CPC_REFERENCE_MIN_COUNT rows only; reloaded every CPC_REFERENCE_REFRESH
+    seconds.
+    """
+    with _reference_lock:
+        loaded_at = _reference['loaded_at']
+        if loaded_at is not None and time.monotonic() - loaded_at < settings.CPC_REFERENCE_REFRESH:
+            return _reference['stats']
+        from api.models import GeoCpcStats
+        try:
+            rows = list(GeoCpcStats.objects.filter(
+                count__gte=max(2, settings.CPC_REFERENCE_MIN_COUNT),
+            ).values_list('geo', 'count', 'mean', 'm2'))
+        except Exception as e:
+            print(f"[ERROR] Loading the geo CPC reference failed: {e}")
+            rows = []
+        stats = pd.DataFrame(rows, columns=['geo', 'count', 'mean', 'm2']).set_index('geo')
+        stats['std'] = np.sqrt(stats['m2'] / (stats['count'] - 1))
+        _reference.update(loaded_at=time.monotonic(), stats=stats[['mean', 'std']])
+        return _reference['stats']
+
+
+def reference_moments(geo):
+    """Reference mean and std (float64) of each row's geo, NaN where there is none."""
+    stats = reference_stats()
+    mean = np.full(len(geo), np.nan)
+    std = np.full(len(geo), np.nan)
+    if len(stats):
+        positions = stats.index.get_indexer(geo)
+        found = positions >= 0
+        mean[found] = stats['mean'].to_numpy()[positions[found]]
+        std[found] = stats['std'].to_numpy()[positions[found]]
+    return mean, std
+
+
+def cpc_levels(cpc, geo):
+    """The CPC band of every row (cpc_bands()) against its geo's CPC mean/std."""
+    if settings.CPC_REFERENCE != 'geo':
+        mean, std = batch_moments(cpc, geo)
+        return cpc_bands(((cpc - mean) / std.replace(0, MIN_STD)).to_numpy())
+
+    mean, std = reference_moments(geo)
+    missing = np.isnan(mean)
+    if missing.any():
+        batch_mean, batch_std = batch_moments(cpc[missing], geo[missing])
+        mean[missing] = batch_mean.to_numpy(dtype=np.float64)
+        std[missing] = batch_std.to_numpy(dtype=np.float64)
+    std[std == 0] = MIN_STD
+    return cpc_bands((cpc.to_numpy(dtype=np.float64) - mean) / std)
+
+
+def day_moments(df, cpc_col='cpc', geo_col='geo'):
+    """(count, mean, M2) of the CPCs of every geo in ``df``."""
+    rows = pd.DataFrame({
+        'geo': df[geo_col].astype(object),
+        'cpc': pd.to_numeric(df[cpc_col], errors='coerce').astype(np.float64),
+    }).dropna()
+    moments = rows.groupby('geo')['cpc'].agg(['count', 'mean', 'var'])
+    moments['m2'] = (moments['var'] * (moments['count'] - 1)).fillna(0.0)
+    return moments[['count', 'mean', 'm2']]
+
+
+def fold_day(df, day, cpc_col='cpc', geo_col='geo'):
+    """
+    Merge the CPCs of one tracker day into GeoCpcStats. A geo already folded
+    up to ``day`` is left alone, so re-running a day never counts it twice.
+    Returns the number of geos updated.
+    """
+    from api.models import GeoCpcStats
+    moments = day_moments(df, cpc_col, geo_col)
+    if moments.empty:
+        return 0
+    with transaction.atomic():
+        existing = GeoCpcStats.objects.select_for_update().in_bulk(list(moments.index), field_name='geo')
+        created, updated = [], []
+        for geo, (count, mean, m2) in zip(moments.index, moments.itertuples(index=False)):
+            stats = existing.get(geo)
+            if stats is None:
+                created.append(GeoCpcStats(geo=geo, count=int(count), mean=mean, m2=m2, last_day=day))
+                continue
+            if stats.last_day is not None and stats.last_day >= day:
+                continue
+            total = stats.count + int(count)
+            delta = mean - stats.mean
+            stats.mean += delta * count / total
+            stats.m2 += m2 + delta * delta * stats.count * count / total
+            stats.count = total
+            stats.last_day = day
+            updated.append(stats)
+        GeoCpcStats.objects.bulk_create(created)
+        GeoCpcStats.objects.bulk_update(updated, ['count', 'mean', 'm2', 'last_day'])
+    return len(created) + len(updated)
+
+
+def geo_cpc_pending(day):
+    """Whether ``day`` (a date) still has to be folded into GeoCpcStats."""
+    from api.models import GeoCpcStats
+    return not GeoCpcStats.objects.filter(last_day__gte=day).exists()
@@ -0,0 +1,41 @@
+from django.conf import settings
+
+from api.utills import geo_cpc, trends
+
+
+# Stores kept up to date one finished tracker day at a time: the per-geo CPC
+# reference (geo_cpc.py) and the per-adset trends (trends.py). The scheduler
+# fetches the day's report once for every enabled store still missing it;
+# each store also skips adsets/geos it already holds for that day.
+HISTORY_STORES = {
+    'geo_cpc': (geo_cpc.geo_cpc_pending, geo_cpc.fold_day),
+    'trends': (trends.trends_pending, trends.fold_day),
+}
+
+
+def enabled_stores():
+    stores = []
+    if settings.CPC_REFERENCE == 'geo':
+        stores.append('geo_cpc')
+    if settings.ADSET_TRENDS:
+        stores.append('trends')
+    return stores
+
+
+def fold_finished_day(day=None, stores=None):
+    """
+    Fold the tracker report of ``day`` (default: the last finished day) into
+    ``stores`` (default: the enabled ones) that do not hold it yet. Returns
+    {store: rows updated}.
+    """
+    from api.utills.pipeline import fetch_day_frame, finished_day
+
+    day = day or finished_day()
+    stores = enabled_stores() if stores is None else stores
+    pending = [store for store in stores if HISTORY_STORES[store][0](day.date())]
+    if not pending:
+        return {}
+    df = fetch_day_frame(day)
+    if df is None:
+        return dict.fromkeys(pending, 0)
+    return {store: HISTORY_STORES[store][1](df, day.date()) for store in pending}
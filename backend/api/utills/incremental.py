@@ -0,0 +1,182 @@
+import threading
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+from api.utills.combine_inference import enrich_campaign_data
+from api.utills.pipeline import group_processed_data, enrich_results
+
+
+# Per-report intermediate results of the daily view, kept in this process so
+# that an adset status change only re-groups and re-enriches the campaigns
+# holding the changed adsets. Inference does not depend on statuses, so the
+# inference rows of a report stay valid until the tracker sends new data or
+# another model version is served.
+_states = OrderedDict()
+_states_lock = threading.Lock()
+
+
+class SummaryTotals:
+    """Running sums behind build_summary(), patched one row at a time."""
+
+    def __init__(self):
+        self.adsets = 0
+        self.cost = self.revenue = self.profit = 0.0
+        self.clicks = self.conversions = 0
+        self.rate_sum = 0.0
+        self.rate_count = 0
+        self.priorities = Counter()
+
+    def add(self, row, sign=1):
+        self.adsets += sign
+        self.cost += sign * (row.get('cost') or 0)
+        self.revenue += sign * (row.get('revenue') or 0)
+        self.profit += sign * (row.get('profit') or 0)
+        self.clicks += sign * (row.get('clicks') or 0)
+        self.conversions += sign * (row.get('conversions') or 0)
+        if row.get('conversion_rate') is not None:
+            self.rate_sum += sign * row['conversion_rate']
+            self.rate_count += sign
+        self.priorities[str(row.get('priority'))] += sign
+
+    def remove(self, row):
+        self.add(row, sign=-1)
+
+    def summary(self):
+        if not self.adsets:
+            return {}
+        total_cost = round(self.cost, 2)
+        total_revenue = round(self.revenue, 2)
+        total_roi = round(((total_revenue - total_cost) / total_cost) * 100, 2) if total_cost > 0 else 0
+        return {
+            "total_adset": self.adsets,
+            "total_cost": total_cost,
+            "total_revenue": total_revenue,
+            "total_profit": round(self.profit, 2),
+            "total_clicks": int(self.clicks),
+            "total_conversions": int(self.conversions),
+            "total_roi": total_roi,
+            "average_conversion_rate": round(self.rate_sum / self.rate_count, 4) if self.rate_count else None,
+            "priority_distribution": {
+                priority: count for priority, count in self.priorities.most_common() if count > 0
+            },
+        }
+
+
+class CampaignState:
+    """
+    Inference rows of one daily report, grouped by campaign (sub_id_6,
+    sub_id_3), with the grouped and enriched campaigns and the summary
+    totals for the statuses applied last. Use under ``lock``.
+    """
+
+    def __init__(self, rows, model_path):
+        self.lock = threading.Lock()
+        self.model_path = model_path
+        self.rows = {}          # campaign key -> [(position, row)], all statuses
+        self.adset_keys = {}    # sub_id_2 -> campaign keys it appears in
+        for position, row in enumerate(rows):
+            key = (row['sub_id_6'], row['sub_id_3'])
+            self.rows.setdefault(key, []).append((position, row))
+            self.adset_keys.setdefault(row.get('sub_id_2'), set()).add(key)
+        self.status_map = None
+        self.campaigns = {}     # campaign key -> grouped campaign of its active rows
+        self.first_active = {}  # campaign key -> position of its first active row
+        self.enriched = {}      # campaign key -> enrich_campaign_data() output
+        self.totals = SummaryTotals()
+
+    @property
+    def adset_ids(self):
+        return {adset_id for adset_id in self.adset_keys if adset_id}
+
+    def apply(self, status_map):
+        """Bring the campaigns and totals up to date with ``status_map``; returns the re-grouped keys."""
+        if self.status_map is None:
+            changed_keys = set(self.rows)
+        else:
+            changed_keys = set()
+            for adset_id, keys in self.adset_keys.items():
+                if self.status_map.get(adset_id, 'unknown') != status_map.get(adset_id, 'unknown'):
+                    changed_keys |= keys
+
+        if changed_keys:
+            self._regroup(changed_keys, status_map)
+        self.status_map = dict(status_map)
+        return changed_keys
+
+    def _regroup(self, keys, status_map):
+        previous = self.status_map or {}
+        active_rows = []
+        for key in keys:
+            self.campaigns.pop(key, None)
+            self.first_active.pop(key, None)
+            self.enriched.pop(key, None)
+            for position, row in self.rows[key]:
+                adset_id = row.get('sub_id_2')
+                was_active = previous.get(adset_id) == 'active'
+                is_active = status_map.get(adset_id) == 'active'
+                if was_active and not is_active:
+                    self.totals.remove(row)
+                elif is_active and not was_active:
+                    self.totals.add(row)
+                if is_active:
+                    self.first_active.setdefault(key, position)
+                    active_rows.append((position, {**row, 'status': 'active'}))
+
+        # Same order as a full group_processed_data() over the active rows
+        active_rows.sort(key=lambda item: item[0])
+        for campaign in group_processed_data([row for _, row in active_rows]):
+            self.campaigns[(campaign['sub_id_6'], campaign['sub_id_3'])] = campaign
+
+    def grouped(self):
+        """Grouped campaigns in the order a full recompute would return them."""
+        keys = sorted(self.campaigns, key=self.first_active.__getitem__)
+        return [self.campaigns[key] for key in keys]
+
+    def enrich(self, enrich_func):
+        """Wrap ``enrich_func`` so each campaign is enriched once per regroup."""
+        def enrich(campaign):
+            key = (campaign['sub_id_6'], campaign['sub_id_3'])
+            enriched = self.enriched.get(key)
+            if enriched is None:
+                enriched = self.enriched[key] = enrich_func(campaign)
+            return enriched
+        return enrich
+
+    def summary(self):
+        return self.totals.summary()
+
+
+def get_state(fingerprint, model_path):
+    key = (fingerprint, model_path)
+    with _states_lock:
+        state = _states.get(key)
+        if state is not None:
+            _states.move_to_end(key)
+        return state
+
+
+def keep_state(fingerprint, rows, model_path):
+    """
+    Start tracking the inference rows of a report made with the ``model_path``
+    bundle; evicts the least recently used.
+    """
+    state = CampaignState(rows, model_path)
+    with _states_lock:
+        _states[(fingerprint, model_path)] = state
+        _states.move_to_end((fingerprint, model_path))
+        while len(_states) > settings.INCREMENTAL_STATES:
+            _states.popitem(last=False)
+    return state
+
+
+def state_results(state, status_map, query):
+    """(final_results, summary, pagination) of the daily view for ``status_map``."""
+    model_path = state.model_path
+    with state.lock:
+        state.apply(status_map)
+        final_results, pagination = enrich_results(
+            query, state.grouped(),
+            enrich=state.enrich(lambda group: enrich_campaign_data(group, model_path=model_path)),
+        )
+        return final_results, state.summary(), pagination
@@ -2,14 +2,22 @@ import os
 import pandas as pd
 import numpy as np
 import joblib
+from sklearn.base import clone
 import json
 from django.conf import settings
+from api.utills.assignment import assign_cached, bundle_assigner
+from api.utills.features import FeatureBuilder, prepare_report
+from api.utills.geo_cpc import cpc_levels
+from api.utills.model_store import active_model_path
+from api.utills.trends import join_trends
+from api.utills.warmup import load_bundle
+from api.utills.schema import apply_report_schema, output_frame, to_records
 from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 class DBSCANCampaignInference:
-    def __init__(self, model_path='dbscan_model_bundle_latest.pkl'):
-        self.model_path = model_path
+    def __init__(self, model_path=None):
+        self.model_path = model_path or active_model_path()
         self.model_bundle = None
         self.scaler = None
         self.dbscan = None
@@ -18,41 +26,68 @@ class DBSCANCampaignInference:
     def load_model(self):
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Model file not found: {self.model_path}")
-        self.model_bundle = joblib.load(self.model_path)
+        self.model_bundle = load_bundle(self.model_path)
         self.scaler = self.model_bundle['scaler']
-        self.dbscan = self.model_bundle['dbscan']
+        # predict_clusters() refits DBSCAN on every batch, so work on a copy
+        # instead of mutating the bundle shared by the whole process
+        self.dbscan = clone(self.model_bundle['dbscan'])
         self.features = self.model_bundle['features']
-    def preprocess_data(self, df):
-        numeric_cols = ['cost', 'revenue', 'profit', 'clicks', 'campaign_unique_clicks',
-                        'conversions', 'roi_confirmed', 'lp_clicks', 'cr', 'lp_ctr']
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        df = df.fillna(0)
-        if 'revenue' in df.columns and 'cost' in df.columns:
-            df['revenue_to_cost_ratio'] = df['revenue'] / (df['cost'] + 1e-6)
-        if 'conversions' in df.columns and 'clicks' in df.columns:
-            df['conversion_rate'] = df['conversions'] / (df['clicks'] + 1e-6)
-        if 'profit' in df.columns and 'cost' in df.columns:
-            df['profit_margin'] = df['profit'] / (df['cost'] + 1e-6)
-        return df
-    def extract_features(self, df):
-        feature_data = {}
-        for feature in self.features:
-            if feature in df.columns:
-                feature_data[feature] = df[feature]
-            else:
-                print(f":warning: Feature '{feature}' not found, using zeros")
-                feature_data[feature] = np.zeros(len(df))
-        X = pd.DataFrame(feature_data)
-        return X
-    def predict_clusters(self, X):
-        X_scaled = self.scaler.transform(X)
+        self.builder = FeatureBuilder(self.features, self.scaler)
+        self.assigner = bundle_assigner(self.model_path, self.model_bundle)
+
+    def build_features(self, df):
+        """
+        The typed report frame with the derived ratio columns, and its scaled
+        feature matrix (FeatureBuilder, no intermediate feature frame).
+        """
+        df = prepare_report(df)
+        X, ratios = self.builder.build(df)
+        for name, values in ratios.items():
+            df[name] = values
+        return df, X
+
+    def predict_clusters(self, X_scaled):
         labels = self.dbscan.fit_predict(X_scaled)
         return labels
-    def generate_recommendations(self, df, labels):
-        df_result = df.copy()
+    def generate_recommendations(self, df, labels, recommendations=None):
+        # build_features() already returned a frame of our own
+        df_result = df
         df_result['cluster'] = labels
+        if recommendations is None:
+            recommendations = self.recommend(self.rule_inputs(df_result).assign(cluster=labels))
+
+        # Unpack returned values into separate columns
+        df_result['recommendation'] = [rec[0] for rec in recommendations]
+        df_result['reason'] = [rec[1] for rec in recommendations]
+        df_result['suggestion'] = [rec[2] for rec in recommendations]
+        df_result['budget_change_pct'] = [round(rec[3]) if rec[3] is not None else 0 for rec in recommendations]  # Default to 0
+
+        # Priority map and sorting
+        priority_map = {
+            'PAUSE': 1,
+            'INCREASE_BUDGET': 2,
+            'REDUCE_BUDGET': 3,
+            'OPTIMIZE': 4,
+            'RESTRUCTURE': 5,
+            'KEEP_RUNNING': 6,
+            'MONITOR_CLOSELY': 7,
+            'REVIEW': 8
+        }
+
+        df_result['priority'] = df_result['recommendation'].map(priority_map).fillna(99)
+        apply_report_schema(df_result)
+        df_result = df_result.sort_values(['priority', 'roi_confirmed'], ascending=[True, False])
+
+        return df_result
+
+    @staticmethod
+    def rule_inputs(df):
+        return pd.DataFrame({
+            col: df[col].to_numpy(dtype=np.float64) for col in ('roi_confirmed', 'cost') if col in df.columns
+        }, index=df.index)
+
+    def recommend(self, rule_inputs):
+        """The recommendation fields of every row of ``rule_inputs`` (roi_confirmed, cost, cluster)."""
         def get_recommendation(row):
             cluster = row['cluster']
             roi = row.get('roi_confirmed', 0)
@@ -99,31 +134,19 @@ class DBSCANCampaignInference:
             # Fallback
             return "REVIEW", "Unknown cluster", "Manual review required", None
 
-        # Apply recommendations
-        recommendations = df_result.apply(get_recommendation, axis=1)
+        if rule_inputs.empty:
+            return []
+        return list(rule_inputs.apply(get_recommendation, axis=1))
 
-        # Unpack returned values into separate columns
-        df_result['recommendation'] = [rec[0] for rec in recommendations]
-        df_result['reason'] = [rec[1] for rec in recommendations]
-        df_result['suggestion'] = [rec[2] for rec in recommendations]
-        df_result['budget_change_pct'] = [round(rec[3]) if rec[3] is not None else 0 for rec in recommendations]  # Default to 0
-
-        # Priority map and sorting
-        priority_map = {
-            'PAUSE': 1,
-            'INCREASE_BUDGET': 2,
-            'REDUCE_BUDGET': 3,
-            'OPTIMIZE': 4,
-            'RESTRUCTURE': 5,
-            'KEEP_RUNNING': 6,
-            'MONITOR_CLOSELY': 7,
-            'REVIEW': 8
-        }
-
-        df_result['priority'] = df_result['recommendation'].map(priority_map).fillna(99)
-        df_result = df_result.sort_values(['priority', 'roi_confirmed'], ascending=[True, False])
-
-        return df_result
+    def assign_clusters(self, df, X):
+        """
+        Labels of the rows of X, with their recommendation fields when they
+        come from the cluster assignment cache (api/utills/assignment.py);
+        None for the fields means generate_recommendations() computes them.
+        """
+        if self.assigner is None:
+            return self.predict_clusters(X), None
+        return assign_cached(self.assigner, 'live', X, self.rule_inputs(df), self.recommend)
 
     def add_cpc_level(self, df, cpc_col='cpc', geo_col='geo'):
         # Normalize columns to lowercase for safety
@@ -132,48 +155,24 @@ class DBSCANCampaignInference:
         geo_col = geo_col.lower()
         if cpc_col not in df.columns or geo_col not in df.columns:
             raise ValueError(f"Columns '{cpc_col}' and '{geo_col}' must be present in dataframe")
-        geo_stats = df.groupby(geo_col)[cpc_col].agg(['mean', 'std']).rename(columns={'mean': 'mean_cpc', 'std': 'std_cpc'})
-        df = df.merge(geo_stats, left_on=geo_col, right_index=True, how='left')
-        df['std_cpc'] = df['std_cpc'].replace(0, 1e-6)
-        df['z_score'] = (df[cpc_col] - df['mean_cpc']) / df['std_cpc']
-        def label_cpc(z):
-            if pd.isna(z):
-                return 'INSUFFICIENT_DATA'  # Optional: can also be 'STANDARD' or another label
-            elif z < -1:
-                return 'LOW'
-            elif z > 1:
-                return 'HIGH'
-            else:
-                return 'STANDARD'
-
-        df['cpc_rate'] = df['z_score'].apply(label_cpc)
-        df.drop(columns=['mean_cpc', 'std_cpc', 'z_score'], inplace=True)
+        # z-score band against the geo's CPC mean/std: of this batch, or of the
+        # persisted reference with CPC_REFERENCE='geo' (api/utills/geo_cpc.py)
+        df['cpc_rate'] = cpc_levels(df[cpc_col], df[geo_col])
         return df
-    def analyze_recommendations(self, df_result):
-        rec_summary = df_result['recommendation'].value_counts()
-        # Uncomment prints if needed
-        # for rec_type, count in rec_summary.items():
-        #     percentage = (count / len(df_result)) * 100
-        #     print(f"   {rec_type}: {count:,} campaigns ({percentage:.1f}%)")
-        cluster_summary = df_result.groupby('cluster').agg({
-            'roi_confirmed': ['mean', 'count'],
-            'cost': 'sum',
-            'revenue': 'sum'
-        }).round(2)
-        # print(cluster_summary)
-        high_priority = df_result[df_result['priority'] <= 2]
-        if not high_priority.empty:
-            # print(f"\n:rotating_light: High Priority Actions ({len(high_priority)} campaigns):")
-            for _, row in high_priority.head(10).iterrows():
-                campaign_name = row.get('campaign', f"Campaign {row.get('campaign_id', 'Unknown')}")
-                # print(f"   • {row['recommendation']}: {campaign_name[:50]}...")
-                # print(f"     ROI: {row.get('roi_confirmed', 0):.1f}%, Cost: ${row.get('cost', 0):.2f}")
+
+    def add_trend_features(self, df, adset_col='sub_id_2'):
+        """Rolling ROI, spend/CR slopes and the last two days' ROI of every adset (api/utills/trends.py)."""
+        if not settings.ADSET_TRENDS or adset_col not in df.columns:
+            return df
+        return join_trends(df, adset_col)
+
     def save_results(self, df_result, output_prefix='inference_results'):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        df_output = output_frame(df_result)
         csv_path = f"{output_prefix}.csv"
-        df_result.to_csv(csv_path, index=False)
+        df_output.to_csv(csv_path, index=False)
         json_path = f"{output_prefix}.json"
-        df_result.to_json(json_path, orient='records', indent=2)
+        df_output.to_json(json_path, orient='records', indent=2)
         return csv_path, json_path
     def run_inference(self, data_source, save_results=True):
         if isinstance(data_source, str):
@@ -190,20 +189,43 @@ class DBSCANCampaignInference:
                 raise ValueError("Unsupported file format. Use .json or .csv")
         else:
             df = data_source.copy()
-        df_processed = self.preprocess_data(df)
-        X = self.extract_features(df_processed)
-        labels = self.predict_clusters(X)
-        df_result = self.generate_recommendations(df_processed, labels)
+        df_processed, X = self.build_features(df)
+        labels, recommendations = self.assign_clusters(df_processed, X)
+        df_result = self.generate_recommendations(df_processed, labels, recommendations)
         # Add CPC level here, assuming 'cpc' and 'geo' columns present
         df_result = self.add_cpc_level(df_result, cpc_col='cpc', geo_col='geo')
-        self.analyze_recommendations(df_result)
+        df_result = self.add_trend_features(df_result)
         if save_results:
             return self.save_results(df_result)
         else:
             return None, None
+def infer_frame(df, model_path=None):
+    """
+    run_inference() on an in-memory report frame, skipping the JSON file round
+    trip of main(). Returns the typed result frame.
+    """
+    if model_path is None:
+        model_path = active_model_path()
+    if not os.path.exists(model_path):
+        return
+    inference = DBSCANCampaignInference(model_path)
+    df_processed, X = inference.build_features(df.copy())
+    labels, recommendations = inference.assign_clusters(df_processed, X)
+    df_result = inference.generate_recommendations(df_processed, labels, recommendations)
+    df_result = inference.add_cpc_level(df_result, cpc_col='cpc', geo_col='geo')
+    df_result = inference.add_trend_features(df_result)
+    return df_result
+
+
+def infer_records(df, model_path=None):
+    """infer_frame() as the records main() returns."""
+    df_result = infer_frame(df, model_path)
+    return None if df_result is None else to_records(df_result)
+
+
 def main(data_path):
     """Main function to run inference"""
-    model_path = os.path.join(settings.MEDIA_ROOT, 'dbscan_model_bundle_latest.pkl')
+    model_path = active_model_path()
     if not os.path.exists(model_path):
         return
     # data_path = os.path.join(settings.MEDIA_ROOT, 'preprocess_data.json')
@@ -0,0 +1,373 @@
+import atexit
+import bisect
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+
+PIPELINE_STAGES = (
+    'fetch', 'clean', 'geo', 'inference', 'grouping', 'enrichment', 'persistence', 'render',
+)
+
+# Seconds; covers a cached render (ms) up to a slow tracker call (30s timeout)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# With METRICS_DIR set, a process that recorded something writes its
+# snapshot there at most this often
+FLUSH_SECONDS = 1.0
+SNAPSHOT_PREFIX = 'metrics-'
+
+current_view = ContextVar('metrics_view', default='unknown')
+# Per-request list collecting (stage, seconds, rows, bytes); set by the profiler
+stage_listener = ContextVar('stage_listener', default=None)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics store rendered in the Prometheus text format.
+    Recording is a dict lookup and a couple of additions under a lock; nothing
+    is formatted until /metrics is scraped.
+
+    Every process (gunicorn worker) keeps its own registry. With METRICS_DIR
+    set (gunicorn.conf.py does), each one also writes a snapshot of it to that
+    directory, from a background thread at most every FLUSH_SECONDS after it
+    recorded something, and a scrape renders the snapshots of all of them:
+    counters and histograms summed (those of exited workers included, so they
+    never go backwards), gauges per live process with a ``pid`` label. A
+    snapshot is named after the pid and the process's start time, so a worker
+    that gets the pid of an exited one does not overwrite its snapshot.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._help = {}
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._collectors = []
+        self._pid = os.getpid()
+        self._started = time.monotonic_ns()
+        self._dirty = False
+        self._flusher_pid = None
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def _claim(self):
+        """Call under the lock before recording."""
+        pid = os.getpid()
+        if pid != self._pid:
+            # A forked worker starts from zero; what the parent recorded is
+            # in the parent's snapshot
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+            self._pid = pid
+            self._started = time.monotonic_ns()
+        self._dirty = True
+        if self._flusher_pid != pid and metrics_dir():
+            self._flusher_pid = pid
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+            # What an exiting worker recorded since its last flush
+            atexit.register(self._flush_at_exit, pid)
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._claim()
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._claim()
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._claim()
+            self._gauges[key] = value
+
+    def register_collector(self, func):
+        """``func()`` is called at scrape time and may call set()/inc()."""
+        self._collectors.append(func)
+
+    def collect(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"[ERROR] Metrics collector failed: {e}")
+
+    def snapshot(self):
+        """(histograms, counters, gauges) of this process."""
+        with self._lock:
+            if os.getpid() != self._pid:
+                return {}, {}, {}
+            histograms = {k: (list(h.counts), h.sum, h.count, h.buckets) for k, h in self._histograms.items()}
+            return histograms, dict(self._counters), dict(self._gauges)
+
+    def write_snapshot(self, directory):
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._claim()
+            name = snapshot_name(self._pid, self._started)
+        path = os.path.join(directory, name)
+        tmp_path = f'{path}.tmp'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(self.snapshot(), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[ERROR] Writing the metrics snapshot failed: {e}")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            with self._lock:
+                dirty, self._dirty = self._dirty, False
+            if dirty:
+                # Refresh this process's gauges too; other workers only run
+                # their collectors here
+                self.collect()
+                self.write_snapshot(metrics_dir())
+
+    def _flush_at_exit(self, pid):
+        if os.getpid() == pid and self._dirty:
+            self.write_snapshot(metrics_dir())
+
+    def render(self):
+        self.collect()
+        directory = metrics_dir()
+        if directory:
+            self.write_snapshot(directory)
+            histograms, counters, gauges = merge_snapshots(directory)
+        else:
+            histograms, counters, gauges = self.snapshot()
+
+        lines = []
+        described = set()
+
+        def header(name, default_kind):
+            if name in described:
+                return
+            described.add(name)
+            kind, help_text = self._help.get(name, (default_kind, ''))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append(f"{name}_bucket{_labels(labels, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, 'gauge')
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def metrics_dir():
+    """settings.METRICS_DIR, None outside a configured Django process."""
+    try:
+        from django.conf import settings
+        return getattr(settings, 'METRICS_DIR', None)
+    except Exception:
+        return None
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def snapshot_name(pid, started):
+    return f'{SNAPSHOT_PREFIX}{pid}-{started}.pkl'
+
+
+def parse_snapshot_name(name):
+    """(pid, start time) of a snapshot file name, None for other files."""
+    if not (name.startswith(SNAPSHOT_PREFIX) and name.endswith('.pkl')):
+        return None
+    pid, _, started = name[len(SNAPSHOT_PREFIX):-len('.pkl')].partition('-')
+    try:
+        return int(pid), int(started or 0)
+    except ValueError:
+        return None
+
+
+def merge_snapshots(directory):
+    """The snapshots of every process in ``directory`` as one (histograms, counters, gauges)."""
+    histograms, counters, gauges = {}, {}, {}
+    snapshots = []
+    for entry in os.scandir(directory):
+        parsed = parse_snapshot_name(entry.name)
+        if parsed is not None:
+            snapshots.append((parsed, entry))
+    # Gauges of a live pid come from its latest process only
+    latest = {}
+    for (pid, started), _ in snapshots:
+        latest[pid] = max(latest.get(pid, started), started)
+    for (pid, started), entry in snapshots:
+        try:
+            with open(entry.path, 'rb') as f:
+                process_histograms, process_counters, process_gauges = pickle.load(f)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError) as e:
+            print(f"[ERROR] Reading metrics snapshot {entry.name} failed: {e}")
+            continue
+        for key, (counts, total, count, buckets) in process_histograms.items():
+            merged = histograms.get(key)
+            if merged is None or merged[3] != buckets:
+                histograms[key] = (list(counts), total, count, buckets)
+            else:
+                histograms[key] = ([a + b for a, b in zip(merged[0], counts)], merged[1] + total, merged[2] + count, buckets)
+        for key, value in process_counters.items():
+            counters[key] = counters.get(key, 0) + value
+        if latest[pid] == started and process_alive(pid):
+            for (name, labels), value in process_gauges.items():
+                gauges[(name, labels + (('pid', str(pid)),))] = value
+    return histograms, counters, gauges
+
+
+def clear_metrics_dir(directory):
+    """Drop the snapshots of an earlier server run (counters restart from zero)."""
+    if not directory or not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        if entry.name.startswith(SNAPSHOT_PREFIX):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+registry = MetricsRegistry()
+registry.describe('pipeline_stage_seconds', 'histogram', 'Wall time of a prediction pipeline stage.')
+registry.describe('pipeline_stage_rows_total', 'counter', 'Rows handled by a pipeline stage.')
+registry.describe('pipeline_stage_bytes_total', 'counter', 'Bytes handled by a pipeline stage.')
+
+
+class StageRecord:
+    __slots__ = ('rows', 'bytes')
+
+    def __init__(self):
+        self.rows = None
+        self.bytes = None
+
+
+@contextmanager
+def stage(name, view=None):
+    """
+    Time one pipeline stage. The yielded record takes optional ``rows`` and
+    ``bytes`` counts::
+
+        with stage('fetch') as s:
+            ...
+            s.rows = len(rows)
+    """
+    record = StageRecord()
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - started
+        labels = {'view': view or current_view.get(), 'stage': name}
+        registry.observe('pipeline_stage_seconds', labels, elapsed)
+        if record.rows is not None:
+            registry.inc('pipeline_stage_rows_total', labels, record.rows)
+        if record.bytes is not None:
+            registry.inc('pipeline_stage_bytes_total', labels, record.bytes)
+        listener = stage_listener.get()
+        if listener is not None:
+            listener.append((name, elapsed, record.rows, record.bytes))
+
+
+@contextmanager
+def collect_stages():
+    """Collect every stage recorded inside the block (including executor threads)."""
+    stages = []
+    token = stage_listener.set(stages)
+    try:
+        yield stages
+    finally:
+        stage_listener.reset(token)
+
+
+@contextmanager
+def metrics_view(name):
+    """Label every stage recorded inside the block with ``name``."""
+    token = current_view.set(name)
+    try:
+        yield
+    finally:
+        current_view.reset(token)
+
+
+class StageMetricsMixin:
+    """
+    APIView mixin: labels pipeline stages with the view class name and records
+    the response render as the 'render' stage.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with metrics_view(type(self).__name__):
+            return super().dispatch(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+            with stage('render') as s:
+                response.render()
+                s.bytes = len(response.content)
+        return response
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from api.utills.assignment import assignment_cache
+from api.utills.metrics import registry
+from api.utills.warmup import evict_bundles, load_bundle
+
+
+# Model bundles are immutable files MODEL_DIR/dbscan-<version>.pkl (written by
+# `manage.py train_model`, tmp file + rename) and MODEL_DIR/CURRENT names the
+# version to serve; it is only ever replaced with a rename, so readers see the
+# old or the new pointer, never a partial one. Each worker notices a new
+# pointer within MODEL_CHECK_INTERVAL, loads the bundle and runs a warmup
+# inference in the background, and only then serves it. Without a CURRENT
+# file the legacy media/dbscan_model_bundle_latest.pkl is served.
+CURRENT_FILE = 'CURRENT'
+LEGACY_BUNDLE = 'dbscan_model_bundle_latest.pkl'
+LEGACY_VERSION = 'legacy'
+
+registry.describe('pipeline_model_swaps_total', 'counter', 'Model hot-swaps attempted by this process, by result.')
+
+_active = {'version': None, 'path': None, 'loaded_at': None, 'warmup_seconds': None}
+_active_lock = threading.Lock()
+_swap_lock = threading.Lock()
+_state = {'checked_at': float('-inf'), 'failed': None, 'error': None}
+_canned = []
+
+
+class ModelStoreError(Exception):
+    pass
+
+
+def bundle_path(version):
+    if version == LEGACY_VERSION:
+        return os.path.join(settings.MEDIA_ROOT, LEGACY_BUNDLE)
+    return os.path.join(settings.MODEL_DIR, f"dbscan-{version}.pkl")
+
+
+def list_versions():
+    """Stored versions, oldest first."""
+    if not os.path.isdir(settings.MODEL_DIR):
+        return []
+    return sorted(
+        name[len('dbscan-'):-len('.pkl')] for name in os.listdir(settings.MODEL_DIR)
+        if name.startswith('dbscan-') and name.endswith('.pkl')
+    )
+
+
+def current_version():
+    """Version CURRENT points at (LEGACY_VERSION when there is none)."""
+    try:
+        with open(os.path.join(settings.MODEL_DIR, CURRENT_FILE)) as f:
+            return f.read().strip() or LEGACY_VERSION
+    except FileNotFoundError:
+        return LEGACY_VERSION
+
+
+def set_current(version):
+    """Point CURRENT at ``version`` (atomic rename)."""
+    if not os.path.exists(bundle_path(version)):
+        raise ModelStoreError(f"Model version '{version}' not found")
+    os.makedirs(settings.MODEL_DIR, exist_ok=True)
+    tmp_path = os.path.join(settings.MODEL_DIR, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(version + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(settings.MODEL_DIR, CURRENT_FILE))
+
+
+def canned_batch():
+    """Small synthetic report frame the warmup inference runs on (built once)."""
+    if not _canned:
+        from api.utills.pipeline import clean_report
+        from api.utills.synthetic import synthetic_report
+        _canned.append(clean_report(synthetic_report(200, seed=0)['rows']))
+    return _canned[0]
+
+
+def warm_model(path):
+    """Load a bundle and run an inference with it; raises if it is unusable. Returns seconds."""
+    from api.utills.live_inference import infer_frame
+    started = time.perf_counter()
+    try:
+        load_bundle(path)
+        df_result = infer_frame(canned_batch(), model_path=path)
+    except Exception as e:
+        raise ModelStoreError(f"Warmup of {os.path.basename(path)} failed: {e}")
+    if df_result is None or df_result.empty or 'recommendation' not in df_result.columns:
+        raise ModelStoreError(f"Warmup of {os.path.basename(path)} returned no recommendations")
+    return round(time.perf_counter() - started, 3)
+
+
+def publish(version):
+    """Warm ``version`` up in this process, then make it the current version of every worker."""
+    if not os.path.exists(bundle_path(version)):
+        raise ModelStoreError(f"Model version '{version}' not found")
+    seconds = warm_model(bundle_path(version))
+    set_current(version)
+    return seconds
+
+
+def _swap(version):
+    path = bundle_path(version)
+    try:
+        seconds = warm_model(path)
+    except ModelStoreError as e:
+        print(f"[ERROR] Model {version} not served: {e}")
+        # Keep serving the old version until CURRENT changes again
+        _state.update(failed=version, error=str(e))
+        registry.inc('pipeline_model_swaps_total', {'result': 'failed'})
+        return False
+    with _active_lock:
+        previous = _active['path']
+        _active.update(version=version, path=path, loaded_at=time.time(), warmup_seconds=seconds)
+    _state.update(failed=None, error=None)
+    registry.inc('pipeline_model_swaps_total', {'result': 'ok'})
+    # In-flight requests may still enrich with the previous bundle
+    evict_bundles(keep={path, previous})
+    return True
+
+
+def _swap_in_background(version):
+    try:
+        _swap(version)
+    finally:
+        _swap_lock.release()
+
+
+def refresh(wait=False):
+    """
+    Serve the version CURRENT points at. The first call (and ``wait=True``)
+    swaps synchronously; later swaps run in a background thread while the
+    old version keeps serving.
+    """
+    _state['checked_at'] = time.monotonic()
+    version = current_version()
+    if version == _active['version'] or (version == _state['failed'] and _active['version'] is not None):
+        return _active['version']
+    if _active['version'] is None or wait:
+        with _swap_lock:
+            if version != _active['version']:
+                _swap(version)
+    elif _swap_lock.acquire(blocking=False):
+        threading.Thread(target=_swap_in_background, args=(version,), name='model-swap', daemon=True).start()
+    return _active['version']
+
+
+def active_model_path():
+    """Path of the bundle this process serves; checks CURRENT at most every MODEL_CHECK_INTERVAL."""
+    if time.monotonic() - _state['checked_at'] >= settings.MODEL_CHECK_INTERVAL:
+        refresh()
+    # Nothing warmed up yet (e.g. the bundle is missing): callers report it as before
+    return _active['path'] or bundle_path(current_version())
+
+
+def active_model_version():
+    active_model_path()
+    return _active['version'] or current_version()
+
+
+def model_info():
+    """What this process serves, for the model-version endpoint."""
+    path = active_model_path()
+    bundle = load_bundle(path) if os.path.exists(path) else {}
+    with _active_lock:
+        active = dict(_active)
+    return {
+        'pid': os.getpid(),
+        'version': active['version'],
+        'current': current_version(),
+        'bundle': os.path.basename(path),
+        'training_timestamp': bundle.get('training_timestamp'),
+        'features': bundle.get('features'),
+        'best_params': bundle.get('best_params'),
+        'loaded_at': active['loaded_at'],
+        'warmup_seconds': active['warmup_seconds'],
+        'failed_version': _state['failed'],
+        'error': _state['error'],
+        'cluster_assignment': settings.CLUSTER_ASSIGNMENT,
+        'assignment_cache': assignment_cache().stats(),
+        'cpc_reference': settings.CPC_REFERENCE,
+    }
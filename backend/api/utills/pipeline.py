@@ -0,0 +1,473 @@
+import hashlib
+import json
+import os
+import re
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import requests
+from django.conf import settings
+from django.utils.timezone import make_aware
+
+from api.models import AdsetStatus
+from api.utills.country import extract_country_name
+from api.utills.live_inference import infer_frame
+from api.utills.combine_inference import enrich_campaign_data
+from api.utills.diagnostics import keep_result
+from api.utills.enrich_pool import enrich_campaigns
+from api.utills.metrics import stage
+from api.utills.model_store import active_model_path
+from api.utills.result_cache import bump_status_generation
+from api.utills.schema import apply_report_schema, map_unique, to_records
+from api.utills.snapshots import new_run_id, write_snapshot
+
+
+TRACKER_TIMEOUT = 30
+AMSTERDAM_TZ = ZoneInfo("Europe/Amsterdam")
+
+
+def extract_geo(sub_id_6):
+    if not isinstance(sub_id_6, str):
+        return None
+    # Pattern 1: URL-style
+    parts = re.split(r"\+-\+|\s-\s", sub_id_6)
+    if len(parts) >= 2:
+        return parts[1].strip()
+    return None
+
+
+def today_amsterdam():
+    return datetime.now(AMSTERDAM_TZ)
+
+
+def finished_day():
+    """Yesterday in Amsterdam: the last day whose tracker report no longer changes."""
+    return today_amsterdam() - timedelta(days=1)
+
+
+def parse_date_range(params):
+    """
+    Read ``start_date``/``end_date`` (YYYY-MM-DD) from query params, falling
+    back to now in Amsterdam. Raises ValueError on a malformed date.
+    """
+    def parse(value):
+        if value:
+            return make_aware(datetime.strptime(value, "%Y-%m-%d"), AMSTERDAM_TZ)
+        return today_amsterdam()
+
+    return parse(params.get('start_date')), parse(params.get('end_date'))
+
+
+def build_report_payload(start_date, end_date, filters=None):
+    return {
+        "range": {
+            "from": start_date.strftime("%Y-%m-%d"),
+            "to": end_date.strftime("%Y-%m-%d"),
+            "timezone": "Europe/Amsterdam"
+        },
+        "columns": ["clicks", "day", "lp_clicks", "lp_ctr", "cr", "cpc"],
+        "metrics": [
+            "clicks", "cost", "campaign_unique_clicks", "conversions",
+            "roi_confirmed", "revenue", "profit"
+        ],
+        "grouping": ["sub_id_6", "sub_id_5", "sub_id_2", "sub_id_3"],
+        "filters": filters or [],
+        "summary": False,
+        "limit": settings.TRACKER_PAGE_SIZE,
+        "offset": 0,
+        "extended": True
+    }
+
+
+def report_filters(exclude_adsets=(), min_cost=None, min_clicks=None):
+    """
+    Tracker side filters for build_report_payload(), so only rows that can
+    be shown are transferred, parsed and clustered. Geo and campaign filters
+    stay in CampaignQuery: DBSCAN is refit per batch and cpc_levels() uses
+    batch moments, so narrowing the batch would change the results.
+    """
+    filters = []
+    if exclude_adsets:
+        filters.append({"name": "sub_id_2", "operator": "NOT_IN_LIST", "expression": sorted(exclude_adsets)})
+    if min_cost is not None:
+        filters.append({"name": "cost", "operator": "EQUALS_OR_GREATER_THAN", "expression": min_cost})
+    if min_clicks is not None:
+        filters.append({"name": "clicks", "operator": "EQUALS_OR_GREATER_THAN", "expression": min_clicks})
+    return filters
+
+
+def load_paused_adsets(limit=None):
+    """
+    Ids of the paused adsets; empty when there are more than ``limit``, as the
+    NOT_IN_LIST filter would then outgrow the rows it saves (keep_active()
+    drops paused rows either way).
+    """
+    paused = AdsetStatus.objects.filter(is_active=False).order_by().values_list('adset_id', flat=True)
+    if limit is not None:
+        paused = paused[:limit + 1]
+    paused = set(paused)
+    if limit is not None and len(paused) > limit:
+        return set()
+    return paused
+
+
+def daily_report_payload(day):
+    """
+    build_report_payload() for the daily views: known-paused adsets and the
+    TRACKER_MIN_COST/TRACKER_MIN_CLICKS thresholds are applied by the tracker.
+    """
+    paused = load_paused_adsets(settings.TRACKER_EXCLUDE_PAUSED_MAX) if settings.TRACKER_EXCLUDE_PAUSED else ()
+    return build_report_payload(day, day, filters=report_filters(
+        exclude_adsets=paused,
+        min_cost=settings.TRACKER_MIN_COST,
+        min_clicks=settings.TRACKER_MIN_CLICKS,
+    ))
+
+
+def tracker_headers():
+    return {
+        "Api-Key": os.getenv("API_KEY") or getattr(settings, "API_KEY", None),
+        "Content-Type": "application/json"
+    }
+
+
+def report_url():
+    return f"{settings.TRACKER_BASE_URL}/report/build"
+
+
+def next_page(payload, data, page_rows):
+    """
+    The payload for the page after ``page_rows``, or None when the report is
+    complete (a short page, or ``total`` rows collected).
+    """
+    limit = payload.get("limit")
+    if not limit or len(page_rows) < limit:
+        return None
+    offset = payload.get("offset", 0) + len(page_rows)
+    total = data.get("total")
+    if total is not None and offset >= total:
+        return None
+    return {**payload, "offset": offset}
+
+
+def fetch_report(payload):
+    """
+    POST the report payload to the tracker and return the decoded body. A
+    report larger than ``limit`` rows is fetched page by page (offset) and
+    returned as one body, with the SHA-1 of the raw pages as 'fingerprint'.
+    """
+    with stage('fetch') as s:
+        data, rows, size = None, [], 0
+        digest = hashlib.sha1()
+        while payload is not None:
+            response = requests.post(
+                report_url(),
+                headers=tracker_headers(),
+                json=payload,
+                timeout=TRACKER_TIMEOUT
+            )
+            response.raise_for_status()
+            page = response.json()
+            size += len(response.content)
+            digest.update(response.content)
+            page_rows = page.get('rows', [])
+            rows.extend(page_rows)
+            data = data or page
+            payload = next_page(payload, page, page_rows)
+        data['rows'] = rows
+        data['fingerprint'] = digest.hexdigest()
+        s.bytes = size
+        s.rows = len(rows)
+    return data
+
+
+async def fetch_report_async(payload):
+    """Async counterpart of fetch_report() for the ASGI views."""
+    import httpx
+
+    with stage('fetch') as s:
+        data, rows, size = None, [], 0
+        digest = hashlib.sha1()
+        async with httpx.AsyncClient(timeout=TRACKER_TIMEOUT) as client:
+            while payload is not None:
+                response = await client.post(
+                    report_url(),
+                    headers=tracker_headers(),
+                    json=payload
+                )
+                response.raise_for_status()
+                page = response.json()
+                size += len(response.content)
+                digest.update(response.content)
+                page_rows = page.get('rows', [])
+                rows.extend(page_rows)
+                data = data or page
+                payload = next_page(payload, page, page_rows)
+        data['rows'] = rows
+        data['fingerprint'] = digest.hexdigest()
+        s.bytes = size
+        s.rows = len(rows)
+    return data
+
+
+def fetch_day_frame(day):
+    """clean_report() of the full tracker report of ``day``, None when it has no rows."""
+    rows = fetch_report(build_report_payload(day, day)).get('rows', [])
+    return clean_report(rows) if rows else None
+
+
+def save_raw_report(data, run_id):
+    """Snapshot the raw tracker rows (written off the request thread)."""
+    with stage('persistence'):
+        return write_snapshot('report', run_id, data.get('rows', []))
+
+
+def is_empty_or_placeholder(val):
+    if pd.isna(val):
+        return True
+    if isinstance(val, str) and (val.strip() == "" or val.strip().startswith("{{")):
+        return True
+    return False
+
+
+def clean_report(rows, dedupe=True):
+    """
+    Turn tracker rows into a DataFrame: blank/placeholder sub ids become NA,
+    rows without any sub id are dropped and geo/country are extracted.
+    """
+    with stage('clean') as s:
+        df = pd.DataFrame(rows)
+
+        df = df.applymap(lambda x: pd.NA if is_empty_or_placeholder(x) else x)
+
+        for col in ['sub_id_2', 'sub_id_3']:
+            if col in df.columns and df[col].isna().all():
+                df.drop(columns=col, inplace=True)
+
+        cols_to_check = ['sub_id_6', 'sub_id_5', 'sub_id_3', 'sub_id_2']
+        cols_existing = [col for col in cols_to_check if col in df.columns]
+        df = df.dropna(subset=cols_existing, how='all')
+
+        if dedupe and 'sub_id_2' in df.columns:
+            df = df.drop_duplicates(subset='sub_id_2', keep='first')
+        s.rows = len(df)
+
+    with stage('geo') as s:
+        # A few hundred campaigns (sub_id_6) per report: parse each name once
+        df["geo"] = map_unique(df["sub_id_6"], extract_geo)
+        df["country"] = map_unique(df["geo"], extract_country_name)
+        apply_report_schema(df)
+        s.rows = len(df)
+    return df
+
+
+def aggregate_date_range(df):
+    """Collapse a multi-day report to one row per adset with recomputed ratios."""
+    with stage('clean') as s:
+        df = apply_report_schema(_aggregate_date_range(df))
+        s.rows = len(df)
+    return df
+
+
+def _aggregate_date_range(df):
+    df = df.groupby('sub_id_2').agg({
+        'cost': 'sum',
+        'revenue': 'sum',
+        'clicks': 'sum',
+        'lp_clicks': 'sum',
+        'conversions': 'sum',
+        'campaign_unique_clicks': 'sum',
+        'sub_id_6': 'first',
+        'sub_id_5': 'first',
+        'sub_id_3': 'first',
+        'day': 'first',
+        'geo': 'first',
+        'country': 'first'
+    }).reset_index()
+
+    df['profit'] = df['revenue'] - df['cost']
+    df['cpc'] = df.apply(lambda x: x['cost'] / x['clicks'] if x['clicks'] > 0 else 0, axis=1)
+    df['roi_confirmed'] = df.apply(lambda x: (x['profit'] / x['cost']) * 100 if x['cost'] > 0 else 0, axis=1)
+
+    df['lp_ctr'] = df.apply(lambda x: (x['lp_clicks'] / x['clicks']) * 100 if x['clicks'] > 0 else 0, axis=1)
+    df['cr'] = df.apply(lambda x: (x['conversions'] / x['clicks']) * 100 if x['clicks'] > 0 else 0, axis=1)
+    return df
+
+
+def run_live_inference(df, name, run_id, model_path=None):
+    """
+    Run the live DBSCAN inference on the typed report frame and snapshot the
+    result. ``name`` ('preprocess_data' for the daily views,
+    'preprocess_data_time_range' for the range views) is kept as snapshot
+    metadata, with the model bundle used.
+    """
+    model_path = model_path or enrich_model_path()
+    with stage('inference') as s:
+        df_result = infer_frame(df, model_path)
+        s.rows = len(df)
+    if df_result is None:
+        return None
+    keep_result(df_result, name, run_id)
+    with stage('persistence'):
+        write_snapshot('result', run_id, df_result, {'source': name, 'model': os.path.basename(model_path)})
+    return to_records(df_result)
+
+
+def register_new_adsets(rows):
+    """Create AdsetStatus rows (active) for adsets seen for the first time."""
+    adset_ids = {row.get("sub_id_2") for row in rows if row.get("sub_id_2")}
+    if not adset_ids:
+        return
+    with stage('persistence') as s:
+        existing_ids = set(
+            AdsetStatus.objects.filter(adset_id__in=adset_ids).values_list("adset_id", flat=True)
+        )
+        new_ids = adset_ids - existing_ids
+        new_records = [AdsetStatus(adset_id=adset_id, is_active=True) for adset_id in new_ids]
+        AdsetStatus.objects.bulk_create(new_records, ignore_conflicts=True)
+        s.rows = len(new_records)
+    if new_records:
+        # bulk_create() sends no post_save: unknown adsets were filtered out
+        # of the cached responses and are active now
+        try:
+            bump_status_generation()
+        except Exception as e:
+            print(f"[ERROR] Could not invalidate cached results: {e}")
+
+
+def load_status_map(adset_ids=None):
+    """{adset_id: 'active' | 'paused'}; all known adsets when no ids are given."""
+    qs = AdsetStatus.objects.all()
+    if adset_ids is not None:
+        qs = qs.filter(adset_id__in=adset_ids)
+    return {
+        adset_id: 'active' if is_active else 'paused'
+        for adset_id, is_active in qs.values_list('adset_id', 'is_active')
+    }
+
+
+def keep_active(data, status_map):
+    """Tag every row with its status and keep the active ones."""
+    for row in data:
+        row['status'] = status_map.get(row.get('sub_id_2'), 'unknown')  # 'unknown' if not in DB
+    return [row for row in data if row.get('status') == 'active']
+
+
+def enrich_model_path():
+    # Resolve once per request so a hot-swap never mixes two versions in one response
+    return active_model_path()
+
+
+def enrich_group(group, model_path, view=None):
+    """
+    enrich_campaign_data() for one campaign, timed as the 'enrichment' stage;
+    ``model_path`` is the request's enrich_model_path().
+    """
+    with stage('enrichment', view=view) as s:
+        enriched = enrich_campaign_data(group, model_path=model_path)
+        s.rows = len(group.get('adset') or [])
+    return enriched
+
+
+def enrich_results(query, output, enrich=None, model_path=None):
+    """
+    Apply the CampaignQuery to grouped campaigns, enriching only what it
+    needs, on the enrichment pool for large reports. ``enrich`` replaces
+    enrich_campaign_data() (e.g. a cached variant) and runs in process.
+    """
+    model_path = model_path or enrich_model_path()
+    enrich_many = None
+    if enrich is None:
+        enrich_many = lambda groups: enrich_campaigns(groups, model_path)
+    with stage('enrichment') as s:
+        final_results, pagination = query.run(output, enrich, enrich_many)
+        s.rows = sum(len(c.get('adset') or []) for c in final_results)
+    return final_results, pagination
+
+
+def group_processed_data(data):
+    """
+    Group inference rows by campaign (sub_id_6, sub_id_3) and attach the
+    campaign level totals used by the dashboard.
+    """
+    with stage('grouping') as s:
+        output = _group_processed_data(data)
+        s.rows = len(data)
+    return output
+
+
+def _group_processed_data(data):
+    grouped = defaultdict(list)
+    for item in data:
+        key = (item['sub_id_6'], item['sub_id_3'])
+        grouped[key].append(item)
+
+    output = []
+    for (sub_id_6, sub_id_3), items in grouped.items():
+        df_group = pd.DataFrame(items)
+
+        total_cost = round(df_group['cost'].sum(), 2)
+        total_revenue = round(df_group['revenue'].sum(), 2)
+        total_profit = round(total_revenue - total_cost, 2)
+        total_clicks = int(round(df_group['clicks'].sum()))
+        total_conversions = int(round(df_group['conversions'].sum()))
+
+        total_roi = round(((total_revenue - total_cost) / total_cost) * 100, 2) if total_cost > 0 else 0
+        total_conversion_rate = round((total_conversions / total_clicks) * 100, 2) if total_clicks > 0 else 0
+        total_cpc = round((total_cost / total_clicks), 2) if total_clicks > 0 else 0
+
+        # Pick geo and country from first item in the group
+        geo = items[0].get("geo")
+        country = items[0].get("country")
+
+        output.append({
+            "id": str(uuid.uuid4()),
+            "sub_id_6": sub_id_6,
+            "sub_id_3": sub_id_3,
+            "total_cost": total_cost,
+            "total_revenue": total_revenue,
+            "total_profit": total_profit,
+            "total_clicks": total_clicks,
+            "total_cpc": total_cpc,
+            "total_roi": total_roi,
+            "geo": geo,
+            "country": country,
+            "total_conversion_rate": total_conversion_rate,
+            "adset": items
+        })
+    return output
+
+
+def build_summary(items):
+    """Overall summary block returned next to the campaign list."""
+    if not items:
+        return {}
+    summary_df = pd.DataFrame(items)
+    if summary_df.empty:
+        return {}
+
+    total_cost = round(summary_df['cost'].sum(), 2)
+    total_revenue = round(summary_df['revenue'].sum(), 2)
+    total_roi = round(((total_revenue - total_cost) / total_cost) * 100, 2) if total_cost > 0 else 0
+
+    return {
+        "total_adset": len(summary_df),
+        "total_cost": total_cost,
+        "total_revenue": total_revenue,
+        "total_profit": round(summary_df['profit'].sum(), 2),
+        "total_clicks": int(summary_df['clicks'].sum()),
+        "total_conversions": int(summary_df['conversions'].sum()),
+        "total_roi": total_roi,
+        "average_conversion_rate": round(summary_df['conversion_rate'].mean(), 4),
+        "priority_distribution": summary_df['priority'].astype(str).value_counts().to_dict()
+    }
+
+
+def campaign_body(final_results, summary, pagination=None):
+    body = {'success': True, 'data': final_results, 'summary': summary}
+    if pagination is not None:
+        body['pagination'] = pagination
+    return body
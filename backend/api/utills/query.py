@@ -0,0 +1,239 @@
+import math
+
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 500
+
+# Campaign level keys that exist before enrichment and can be used to
+# filter/sort/paginate the grouped output without enriching every group.
+PRE_ENRICH_SORT_FIELDS = {
+    'sub_id_6', 'sub_id_3', 'geo', 'country',
+    'total_cost', 'total_revenue', 'total_profit', 'total_clicks',
+    'total_cpc', 'total_roi', 'total_conversion_rate',
+}
+# Keys produced by enrich_campaign_data()
+POST_ENRICH_SORT_FIELDS = {
+    'recommendation', 'recommendation_percentage', 'total_budget_change_pct_sum',
+}
+
+
+class QueryParamError(ValueError):
+    pass
+
+
+def _split(value):
+    if value is None:
+        return []
+    return [v.strip() for v in str(value).split(',') if v.strip()]
+
+
+def _positive_int(params, name, default=None):
+    raw = params.get(name)
+    if raw in (None, ''):
+        return default
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise QueryParamError(f"'{name}' must be an integer.")
+    if value < 1:
+        raise QueryParamError(f"'{name}' must be >= 1.")
+    return value
+
+
+def _group_cost(group):
+    if group.get('total_cost') is not None:
+        return group['total_cost']
+    return sum((a.get('cost') or 0) for a in _iter_adsets(group))
+
+
+def _iter_adsets(group):
+    """Yield adset rows of a group, flat ('adset') or grouped by day ('day')."""
+    for adset in group.get('adset') or []:
+        yield adset
+    day = group.get('day')
+    if isinstance(day, dict):
+        for bucket in day.values():
+            for adset in bucket.get('adset', []):
+                yield adset
+
+
+class CampaignQuery:
+    """
+    Filtering, sorting, pagination and adset column projection for the grouped
+    campaign output of the prediction views.
+
+    Supported query params:
+        page, page_size            1-based pagination (no params -> everything)
+        recommendation             comma list, campaign recommendation
+        country, geo               comma lists, case-insensitive
+        campaign_id                comma list of campaign ids (sub_id_3)
+        priority                   comma list, keep campaigns with an adset at that priority
+        min_cost                   minimum campaign total_cost
+        ordering                   comma list of fields, '-' prefix for descending
+        fields                     comma list of adset columns to return
+    """
+
+    def __init__(self, params):
+        self.page = _positive_int(params, 'page')
+        self.page_size = _positive_int(params, 'page_size')
+        if self.page_size is not None:
+            self.page_size = min(self.page_size, MAX_PAGE_SIZE)
+        self.paginate = self.page is not None or self.page_size is not None
+        if self.paginate:
+            self.page = self.page or 1
+            self.page_size = self.page_size or DEFAULT_PAGE_SIZE
+
+        self.recommendations = {v.upper() for v in _split(params.get('recommendation'))}
+        self.countries = {v.lower() for v in _split(params.get('country'))}
+        self.geos = {v.lower() for v in _split(params.get('geo'))}
+        self.campaign_ids = set(_split(params.get('campaign_id')))
+
+        try:
+            self.priorities = {int(float(v)) for v in _split(params.get('priority'))}
+        except ValueError:
+            raise QueryParamError("'priority' must be a comma separated list of integers.")
+
+        raw_min_cost = params.get('min_cost')
+        try:
+            self.min_cost = float(raw_min_cost) if raw_min_cost not in (None, '') else None
+        except ValueError:
+            raise QueryParamError("'min_cost' must be a number.")
+
+        self.ordering = []
+        for field in _split(params.get('ordering')):
+            name = field.lstrip('-')
+            if name not in PRE_ENRICH_SORT_FIELDS | POST_ENRICH_SORT_FIELDS:
+                raise QueryParamError(f"Cannot order by '{name}'.")
+            self.ordering.append((name, field.startswith('-')))
+
+        self.fields = _split(params.get('fields'))
+
+    def key(self):
+        """Normalized parameters; equal for queries that select the same response."""
+        return (
+            self.page, self.page_size,
+            tuple(sorted(self.recommendations)), tuple(sorted(self.countries)), tuple(sorted(self.geos)),
+            tuple(sorted(self.campaign_ids)),
+            tuple(sorted(self.priorities)), self.min_cost, tuple(self.ordering), tuple(sorted(set(self.fields))),
+        )
+
+    @property
+    def needs_enriched_results(self):
+        """True when filtering/sorting depends on enrich_campaign_data() output."""
+        return bool(
+            self.recommendations
+            or self.priorities
+            or any(name in POST_ENRICH_SORT_FIELDS for name, _ in self.ordering)
+        )
+
+    def filter_groups(self, groups):
+        """Filters that only need the grouped (not yet enriched) campaigns."""
+        if self.countries:
+            groups = [g for g in groups if str(g.get('country') or '').lower() in self.countries]
+        if self.geos:
+            groups = [g for g in groups if str(g.get('geo') or '').lower() in self.geos]
+        if self.campaign_ids:
+            groups = [g for g in groups if str(g.get('sub_id_3') or '') in self.campaign_ids]
+        if self.min_cost is not None:
+            groups = [g for g in groups if _group_cost(g) >= self.min_cost]
+        return groups
+
+    def filter_results(self, results):
+        """Filters that need the enriched campaigns."""
+        if self.recommendations:
+            results = [r for r in results if str(r.get('recommendation') or '').upper() in self.recommendations]
+        if self.priorities:
+            results = [
+                r for r in results
+                if any(int(a.get('priority') or 0) in self.priorities for a in _iter_adsets(r))
+            ]
+        return results
+
+    def sort(self, items):
+        # Stable multi-key sort: apply keys from last to first
+        for name, descending in reversed(self.ordering):
+            present = [i for i in items if i.get(name) is not None]
+            missing = [i for i in items if i.get(name) is None]
+            present.sort(key=lambda i: i[name], reverse=descending)
+            items = present + missing
+        return items
+
+    def page_slice(self, items):
+        if not self.paginate:
+            return items, None
+        total = len(items)
+        start = (self.page - 1) * self.page_size
+        meta = {
+            'page': self.page,
+            'page_size': self.page_size,
+            'total': total,
+            'total_pages': math.ceil(total / self.page_size) if total else 0,
+        }
+        return items[start:start + self.page_size], meta
+
+    def project(self, campaign):
+        """Keep only the requested adset columns (sub_id_2 is always kept)."""
+        if not self.fields:
+            return campaign
+        keep = set(self.fields) | {'sub_id_2'}
+
+        def pick(adsets):
+            return [{k: v for k, v in a.items() if k in keep} for a in adsets]
+
+        campaign = dict(campaign)
+        if 'adset' in campaign:
+            campaign['adset'] = pick(campaign['adset'])
+        if isinstance(campaign.get('day'), dict):
+            campaign['day'] = {d: {**bucket, 'adset': pick(bucket.get('adset', []))}
+                               for d, bucket in campaign['day'].items()}
+        return campaign
+
+    def run(self, groups, enrich=None, enrich_many=None):
+        """
+        Apply the query to grouped campaigns and return (results, pagination).
+        When nothing depends on enrichment, only the requested page is enriched.
+        ``enrich_many`` enriches a list of groups at once (e.g. in parallel).
+        """
+        enrich = enrich or (lambda group: group)
+        enrich_many = enrich_many or (lambda items: [enrich(g) for g in items])
+        groups = self.filter_groups(groups)
+
+        if self.needs_enriched_results:
+            results = self.filter_results(enrich_many(groups))
+            page, meta = self.page_slice(self.sort(results))
+        else:
+            page, meta = self.page_slice(self.sort(groups))
+            page = enrich_many(page)
+
+        return [self.project(c) for c in page], meta
+
+    def stream(self, groups, enrich=None):
+        """
+        Lazy variant of run(): yields projected campaigns one at a time, enriching
+        each group only when it is about to be emitted. Ordering by an enriched
+        field needs every result up front, so that case falls back to run().
+        """
+        enrich = enrich or (lambda group: group)
+        if any(name in POST_ENRICH_SORT_FIELDS for name, _ in self.ordering):
+            results, _ = self.run(groups, enrich)
+            yield from results
+            return
+
+        start, stop = 0, None
+        if self.paginate:
+            start = (self.page - 1) * self.page_size
+            stop = start + self.page_size
+
+        matched = 0
+        for group in self.sort(self.filter_groups(groups)):
+            if stop is not None and matched >= stop:
+                return
+            if not self.needs_enriched_results and matched < start:
+                matched += 1
+                continue
+            result = enrich(group)
+            if not self.filter_results([result]):
+                continue
+            matched += 1
+            if matched > start:
+                yield self.project(result)
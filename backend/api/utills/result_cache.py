@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from api.utills.metrics import registry
+from api.utills.model_store import active_model_path
+
+
+# Response bodies of the prediction views, keyed by the view, the days it
+# covers, the normalized query, the fingerprint of the tracker report, the
+# model version and, for views that filter on AdsetStatus, the status
+# generation. New tracker data changes the fingerprint, a model hot-swap the
+# version and a changed AdsetStatus row bumps the generation (api/signals.py),
+# so stale entries are never looked up again and simply age out of the cache.
+STATUS_GENERATION_KEY = 'adset-status:generation'
+
+registry.describe('pipeline_result_cache_requests_total', 'counter', 'Result cache lookups by outcome (hit/miss).')
+registry.describe('pipeline_result_cache_hit_ratio', 'gauge', 'Share of result cache lookups answered from the cache.')
+registry.describe('pipeline_result_cache_entries', 'gauge', 'Entries held by the result cache of this process.')
+registry.describe('pipeline_result_cache_bytes', 'gauge', 'Memory (locmem) or disk (file) used by the result cache.')
+
+_lookups = {'hit': 0, 'miss': 0}
+_lookups_lock = threading.Lock()
+
+
+def result_cache():
+    return caches[settings.RESULT_CACHE]
+
+
+def status_generation():
+    """Counter bumped on every AdsetStatus change, shared by all workers."""
+    cache = caches[settings.SINGLEFLIGHT_CACHE]
+    generation = cache.get(STATUS_GENERATION_KEY)
+    if generation is None:
+        seed_status_generation(cache)
+        generation = cache.get(STATUS_GENERATION_KEY)
+    return generation
+
+
+def seed_status_generation(cache):
+    # The first use, or the key was culled: start above every generation
+    # handed out so far (a counter seeded from an earlier clock reading), so
+    # responses cached under them are never looked up again
+    cache.add(STATUS_GENERATION_KEY, time.time_ns(), None)
+
+
+def bump_status_generation():
+    cache = caches[settings.SINGLEFLIGHT_CACHE]
+    try:
+        cache.incr(STATUS_GENERATION_KEY)
+    except ValueError:
+        seed_status_generation(cache)
+
+
+def result_key(endpoint, start_date, end_date, filters, fingerprint, generation=None, model_path=None):
+    # Every model version is its own bundle file
+    model = os.path.basename(model_path or active_model_path())
+    raw = repr((
+        endpoint, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'),
+        tuple(filters), fingerprint, generation, model,
+    ))
+    return f"results:{endpoint}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def _count(view, outcome):
+    registry.inc('pipeline_result_cache_requests_total', {'view': view or '', 'result': outcome})
+    with _lookups_lock:
+        _lookups[outcome] += 1
+
+
+def get_result(key, view=None):
+    """The cached body for ``key``, or None."""
+    try:
+        body = result_cache().get(key)
+    except Exception as e:
+        print(f"[ERROR] Result cache lookup failed: {e}")
+        body = None
+    _count(view, 'miss' if body is None else 'hit')
+    return body
+
+
+def put_result(key, body):
+    try:
+        result_cache().set(key, body, settings.RESULT_CACHE_TTL)
+    except Exception as e:
+        print(f"[ERROR] Result cache store failed: {e}")
+
+
+def cache_usage(cache):
+    """(entries, bytes) of a locmem or file cache, None for other backends."""
+    if isinstance(cache, LocMemCache):
+        # Values are stored pickled
+        with cache._lock:
+            values = list(cache._cache.values())
+        return len(values), sum(len(value) for value in values)
+    if isinstance(cache, FileBasedCache):
+        entries = size = 0
+        if os.path.isdir(cache._dir):
+            for entry in os.scandir(cache._dir):
+                if entry.name.endswith(cache.cache_suffix):
+                    entries += 1
+                    size += entry.stat().st_size
+        return entries, size
+    return None
+
+
+def collect_result_cache_metrics():
+    with _lookups_lock:
+        lookups = _lookups['hit'] + _lookups['miss']
+        ratio = _lookups['hit'] / lookups if lookups else 0.0
+    registry.set('pipeline_result_cache_hit_ratio', {}, round(ratio, 4))
+    usage = cache_usage(result_cache())
+    if usage is not None:
+        registry.set('pipeline_result_cache_entries', {}, usage[0])
+        registry.set('pipeline_result_cache_bytes', {}, usage[1])
+
+
+registry.register_collector(collect_result_cache_metrics)
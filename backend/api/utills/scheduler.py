@@ -5,15 +5,18 @@ import random
 import atexit
 import requests
 from apscheduler.schedulers.background import BackgroundScheduler
+from django.conf import settings
 from django.db import transaction
 
 # ---------------- CONFIG ---------------- #
-API_BASE = "http://app.wijte.me/api/adset/status/"
+API_BASE = settings.ADSET_STATUS_API_BASE
 MAX_RETRIES = 5
 BASE_DELAY = 2
 THROTTLE_DELAY = 0.5  # seconds between API calls
 INTERVAL_SECONDS = 600  # scheduler interval (10 minutes)
+HISTORY_INTERVAL_SECONDS = 3600  # geo CPC reference / adset trend check (a finished day is fetched once)
 LOG_FILE = "/tmp/apscheduler_output.txt"
+SCHEDULER_LOCK_FILE = "/tmp/adset_scheduler.lock"
 # --------------------------------------- #
 
 # ---------------- Logging Helper ---------------- #
@@ -83,14 +86,67 @@ def my_job():
     log("INFO: Adset status check job finished")
 
 
+def history_job():
+    """Scheduler job: fold the last finished tracker day into the geo CPC reference and adset trends"""
+    from api.utills.history import fold_finished_day
+
+    try:
+        updated = fold_finished_day()
+    except Exception as e:
+        log(f"ERROR: Tracker history update failed: {e}")
+        return
+    for store, count in updated.items():
+        log(f"INFO: {store} updated for {count} rows")
+
+
 # ---------------- Scheduler Setup ---------------- #
-RUN_MAIN = os.environ.get("RUN_MAIN") == "true"
-if "runserver" in sys.argv and RUN_MAIN:
+scheduler = None
+_scheduler_lock_file = None
+
+
+def start_scheduler(run_now=True):
+    """Start the background adset status sync (once per process)."""
+    global scheduler
+    if scheduler is not None:
+        return scheduler
     scheduler = BackgroundScheduler()
     scheduler.add_job(my_job, "interval", seconds=INTERVAL_SECONDS)
+    from api.utills.history import enabled_stores
+    if enabled_stores():
+        scheduler.add_job(history_job, "interval", seconds=HISTORY_INTERVAL_SECONDS)
+        if run_now:
+            scheduler.add_job(history_job)
+    if run_now:
+        # Run the job once immediately on start
+        scheduler.add_job(my_job)
     scheduler.start()
     atexit.register(lambda: scheduler.shutdown())
     log("INFO: Adset scheduler started successfully")
+    return scheduler
+
+
+def start_scheduler_once(lock_path=SCHEDULER_LOCK_FILE):
+    """
+    Start the scheduler in exactly one process on this host (e.g. one gunicorn
+    worker). The flock is released when that process exits, so a respawned
+    worker takes over.
+    """
+    global _scheduler_lock_file
+    import fcntl
+
+    lock_file = open(lock_path, "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    _scheduler_lock_file = lock_file
+    return start_scheduler()
+
+
+RUN_MAIN = os.environ.get("RUN_MAIN") == "true"
+if "runserver" in sys.argv and RUN_MAIN:
+    start_scheduler(run_now=False)
 
     # Run the job once immediately on server start
     my_job()
@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+
+# Typed report frame. Money and ratio columns stay float64, so the values
+# the tracker sent and everything derived from them (date-range sums, ROI,
+# the feature ratios) reach the API exactly as before; the counters fit in
+# int32. Sub ids, geo/country and the recommendation texts repeat across rows
+# and are stored once as categories. sub_id_2 is unique per adset and stays
+# a plain string.
+FLOAT_COLUMNS = [
+    'cost', 'revenue', 'profit', 'roi_confirmed', 'cr', 'lp_ctr', 'cpc',
+    'revenue_to_cost_ratio', 'conversion_rate', 'profit_margin',
+]
+INT_COLUMNS = ['clicks', 'lp_clicks', 'campaign_unique_clicks', 'conversions']
+CATEGORY_COLUMNS = [
+    'sub_id_6', 'sub_id_5', 'sub_id_3', 'day', 'geo', 'country',
+    'recommendation', 'reason', 'suggestion', 'cpc_rate',
+]
+
+
+def apply_report_schema(df):
+    """Cast the known report columns to their compact dtypes (in place)."""
+    for col in FLOAT_COLUMNS:
+        if col in df.columns and df[col].dtype != np.float64:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float64)
+    for col in INT_COLUMNS:
+        if col in df.columns and df[col].dtype != np.int32:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(np.int32)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def fill_missing(df, value=0):
+    """
+    ``df.fillna(value)`` that keeps categorical columns categorical (the fill
+    value becomes a category) and leaves complete columns untouched.
+    """
+    for col in df.columns:
+        series = df[col]
+        if not series.hasnans:
+            continue
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            if value not in series.cat.categories:
+                series = series.cat.add_categories([value])
+            df[col] = series.fillna(value)
+        else:
+            df[col] = series.fillna(value)
+    return df
+
+
+def map_unique(series, func):
+    """``series.apply(func)`` evaluated once per distinct value (NA included)."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    mapped = np.empty(len(uniques) + 1, dtype=object)
+    mapped[:len(uniques)] = [func(value) for value in uniques]
+    mapped[-1] = func(None)  # code -1 is NA
+    return pd.Series(mapped[codes], index=series.index)
+
+
+def output_frame(df):
+    """Plain objects for categories, for CSV/JSON output."""
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(object)
+        columns[col] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def to_records(df):
+    """JSON-ready list of row dicts (NaN as None), as the dashboard receives them."""
+    return json.loads(output_frame(df).to_json(orient='records'))
+
+
+def to_exact_records(df):
+    """
+    Row dicts with the full float64 values, as DataFrame.to_dict() gives them
+    (to_json() keeps 10 digits), NaN as None. The enriched adsets are returned
+    this way.
+    """
+    frame = output_frame(df).astype(object)
+    return frame.where(frame.notna(), None).to_dict(orient='records')
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from api.utills.metrics import registry
+
+
+# Identical prediction requests that arrive while one of them is being
+# computed wait for it instead of running their own tracker fetch and
+# pipeline. Inside a worker the followers wait on the leader's call; across
+# workers the leader holds a lock in the SINGLEFLIGHT_CACHE alias and
+# publishes its result there under its lock token:
+#
+#     <key>:lock            token of the worker computing the result
+#     <key>:result:<token>  the result, kept SINGLEFLIGHT_RESULT_TTL seconds
+#
+# Results are only handed to requests that were already waiting, so a
+# request arriving after the leader finished computes fresh data.
+_MISSING = object()
+_LEAD = object()
+
+registry.describe(
+    'pipeline_singleflight_total', 'counter',
+    'Prediction requests by single-flight role (leader computes, the others share its result).',
+)
+
+
+class Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+# Per event loop (one per ASGI worker): key -> asyncio.Future
+_async_calls = {}
+
+
+def flight_key(endpoint, start_date, end_date, filters=()):
+    """Key of a request: endpoint, the days it covers and its normalized filters."""
+    raw = repr((endpoint, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), tuple(filters)))
+    return f"singleflight:{endpoint}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def pipeline_cache():
+    return caches[settings.SINGLEFLIGHT_CACHE]
+
+
+def _count(view, role):
+    registry.inc('pipeline_singleflight_total', {'view': view or '', 'role': role})
+
+
+def _result_key(key, token):
+    return f"{key}:result:{token}"
+
+
+def _step(cache, key, token, leader):
+    """
+    One attempt at the cross-worker lock. Returns (_LEAD, token) once the lock
+    is ours, (result, leader) when the worker we wait on published its result,
+    else (_MISSING, current lock holder).
+    """
+    if leader is not None:
+        result = cache.get(_result_key(key, leader), _MISSING)
+        if result is not _MISSING:
+            return result, leader
+    if cache.add(f"{key}:lock", token, settings.SINGLEFLIGHT_LOCK_TTL):
+        return _LEAD, token
+    return _MISSING, cache.get(f"{key}:lock")
+
+
+def _publish(cache, key, token, result):
+    """Share the result with the waiting workers and drop the lock if still ours."""
+    if result is not _MISSING:
+        cache.set(_result_key(key, token), result, settings.SINGLEFLIGHT_RESULT_TTL)
+    # Not atomic; the lock only outlives its TTL if the leader hung
+    if cache.get(f"{key}:lock") == token:
+        cache.delete(f"{key}:lock")
+
+
+def _across_workers(key, func, view):
+    cache = pipeline_cache()
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT
+    leader = None
+    try:
+        while True:
+            outcome, leader = _step(cache, key, token, leader)
+            if outcome is not _MISSING:
+                break
+            if time.monotonic() >= deadline:
+                _count(view, 'timeout')
+                return func()
+            time.sleep(settings.SINGLEFLIGHT_POLL)
+    except Exception as e:
+        print(f"[ERROR] Single-flight cache unavailable, computing alone: {e}")
+        _count(view, 'leader')
+        return func()
+
+    if outcome is not _LEAD:
+        _count(view, 'remote_follower')
+        return outcome
+
+    _count(view, 'leader')
+    result = _MISSING
+    try:
+        result = func()
+        return result
+    finally:
+        try:
+            _publish(cache, key, token, result)
+        except Exception as e:
+            print(f"[ERROR] Single-flight publish failed: {e}")
+
+
+def coalesce(key, func, view=None):
+    """
+    Return ``func()``, computed once for all concurrent callers with the same
+    ``key`` in this process and, through the pipeline cache, in the other
+    workers. An exception of the leader is re-raised in its local followers;
+    followers in other workers take over instead. Results must be picklable.
+    """
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = Call()
+
+    if not leader:
+        _count(view, 'follower')
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _across_workers(key, func, view)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+async def _across_workers_async(key, func, view):
+    cache = pipeline_cache()
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT
+    leader = None
+    try:
+        while True:
+            outcome, leader = await sync_to_async(_step)(cache, key, token, leader)
+            if outcome is not _MISSING:
+                break
+            if time.monotonic() >= deadline:
+                _count(view, 'timeout')
+                return await func()
+            await asyncio.sleep(settings.SINGLEFLIGHT_POLL)
+    except Exception as e:
+        print(f"[ERROR] Single-flight cache unavailable, computing alone: {e}")
+        _count(view, 'leader')
+        return await func()
+
+    if outcome is not _LEAD:
+        _count(view, 'remote_follower')
+        return outcome
+
+    _count(view, 'leader')
+    result = _MISSING
+    try:
+        result = await func()
+        return result
+    finally:
+        try:
+            await sync_to_async(_publish)(cache, key, token, result)
+        except Exception as e:
+            print(f"[ERROR] Single-flight publish failed: {e}")
+
+
+async def coalesce_async(key, func, view=None):
+    """coalesce() for the async views; ``func`` is a coroutine function."""
+    future = _async_calls.get(key)
+    if future is not None:
+        _count(view, 'follower')
+        # shield: a follower that disconnects must not cancel the leader
+        return await asyncio.shield(future)
+
+    future = _async_calls[key] = asyncio.get_running_loop().create_future()
+    try:
+        result = await _across_workers_async(key, func, view)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        # Retrieved here so an unobserved failure is not logged by asyncio
+        future.exception()
+        raise
+    finally:
+        _async_calls.pop(key, None)
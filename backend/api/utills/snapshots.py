@@ -0,0 +1,158 @@
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from django.conf import settings
+from pandas.api.types import infer_dtype
+
+from api.utills.metrics import registry
+
+
+# Snapshots are zstd Parquet files laid out for pyarrow.dataset / DuckDB:
+#
+#     <SNAPSHOT_DIR>/<kind>/date=YYYY-MM-DD/<run_id>.parquet
+#
+# 'report' holds the raw tracker rows, 'result' the inference output. Both
+# files of one request share the run id, which is also stored as a column.
+SNAPSHOT_KINDS = ('report', 'result')
+SNAPSHOT_COMPRESSION = 'zstd'
+
+# One writer thread: requests only pay for handing the frame over. Every
+# queued write holds a whole report or result frame, so at most
+# SNAPSHOT_QUEUE_SIZE are pending; when the writer falls further behind,
+# snapshots are dropped (and counted) rather than piling up in memory
+snapshot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot')
+_queue_slots = threading.BoundedSemaphore(settings.SNAPSHOT_QUEUE_SIZE)
+
+registry.describe('pipeline_snapshots_dropped_total', 'counter', 'Snapshots not written because the writer queue was full.')
+
+
+def new_run_id():
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def run_day(run_id):
+    return datetime.strptime(run_id[:8], '%Y%m%d').date()
+
+
+def snapshot_path(kind, run_id):
+    return os.path.join(settings.SNAPSHOT_DIR, kind, f"date={run_day(run_id).isoformat()}", f"{run_id}.parquet")
+
+
+def write_snapshot(kind, run_id, data, metadata=None):
+    """
+    Queue ``data`` (a DataFrame or a list of row dicts) to be written as the
+    ``kind`` snapshot of ``run_id``. Returns the Future of the written path
+    (None for a snapshot dropped because the queue was full).
+    """
+    if kind not in SNAPSHOT_KINDS:
+        raise ValueError(f"Unknown snapshot kind '{kind}'")
+    if not _queue_slots.acquire(blocking=False):
+        registry.inc('pipeline_snapshots_dropped_total', {'kind': kind})
+        dropped = Future()
+        dropped.set_result(None)
+        return dropped
+    try:
+        return snapshot_executor.submit(_write_queued, kind, run_id, data, metadata or {})
+    except Exception:
+        _queue_slots.release()
+        raise
+
+
+def _write_queued(kind, run_id, data, metadata):
+    try:
+        return _write_snapshot(kind, run_id, data, metadata)
+    finally:
+        # Before the Future completes, so a caller that waited can queue again
+        _queue_slots.release()
+
+
+def arrow_compatible(df):
+    """
+    Text columns holding the odd non-string (fillna(0) puts 0 next to the sub
+    ids) become pandas strings; Arrow needs one type per column.
+    """
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            if infer_dtype(series.cat.categories, skipna=True) not in ('string', 'empty'):
+                series = series.astype('string').astype('category')
+        elif series.dtype == object and infer_dtype(series, skipna=True) not in ('string', 'empty'):
+            series = series.astype('string')
+        columns[col] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def _write_snapshot(kind, run_id, data, metadata):
+    try:
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        table = pa.Table.from_pandas(arrow_compatible(df), preserve_index=False)
+        table = table.append_column('run_id', pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(table.num_rows, dtype=np.int32)), pa.array([run_id])
+        ))
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b'run_id': run_id.encode(),
+            b'created_at': datetime.now().isoformat(timespec='seconds').encode(),
+            **{str(k).encode(): str(v).encode() for k, v in metadata.items()},
+        })
+
+        path = snapshot_path(kind, run_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers never see a half written file; pyarrow.dataset skips dot files
+        tmp_path = os.path.join(os.path.dirname(path), f".{run_id}.parquet.tmp")
+        pq.write_table(table, tmp_path, compression=SNAPSHOT_COMPRESSION)
+        os.replace(tmp_path, path)
+
+        prune_snapshots(kind)
+        return path
+    except Exception as e:
+        print(f"[ERROR] Snapshot {kind}/{run_id} failed: {e}")
+        raise
+
+
+def prune_snapshots(kind, keep_days=None):
+    """Drop day partitions older than SNAPSHOT_KEEP_DAYS."""
+    keep_days = settings.SNAPSHOT_KEEP_DAYS if keep_days is None else keep_days
+    root = os.path.join(settings.SNAPSHOT_DIR, kind)
+    oldest = (datetime.now() - timedelta(days=keep_days)).date().isoformat()
+    for entry in os.scandir(root):
+        if entry.is_dir() and entry.name.startswith('date=') and entry.name[5:] < oldest:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def list_snapshots(kind, day=None):
+    """Run ids with a ``kind`` snapshot, oldest first, optionally for one day."""
+    root = os.path.join(settings.SNAPSHOT_DIR, kind)
+    if not os.path.isdir(root):
+        return []
+    days = [f"date={day.isoformat()}"] if day else sorted(os.listdir(root))
+    run_ids = []
+    for partition in days:
+        directory = os.path.join(root, partition)
+        if os.path.isdir(directory):
+            run_ids.extend(sorted(name[:-len('.parquet')] for name in os.listdir(directory) if name.endswith('.parquet')))
+    return run_ids
+
+
+def read_snapshot(kind, run_id, columns=None, filters=None):
+    """
+    One snapshot as an Arrow table, memory-mapped. ``filters`` use the
+    pyarrow syntax, e.g. ``[('cost', '>', 5)]``; use ``.to_pandas()`` for a
+    DataFrame.
+    """
+    return pq.read_table(snapshot_path(kind, run_id), columns=columns, filters=filters, memory_map=True)
+
+
+def snapshot_dataset(kind):
+    """All ``kind`` snapshots as one pyarrow dataset (``date`` is a partition column)."""
+    return ds.dataset(os.path.join(settings.SNAPSHOT_DIR, kind), format='parquet', partitioning='hive')
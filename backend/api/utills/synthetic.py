@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+# Shape of the real tracker report (api_response.json): ~4.5 adsets per
+# campaign, a handful of GEOs and the odd unresolved '{{sub_id}}' row.
+GEOS = ['DE', 'US', 'SE', 'IT', 'NL', 'UK', 'FR', 'ES']
+GEO_WEIGHTS = [0.41, 0.23, 0.13, 0.12, 0.08, 0.01, 0.01, 0.01]
+BRANDS = ['Kroger', 'Rusta', 'Action', 'Lidl', 'Aldi', 'Jumbo', 'Coop', 'Tesco']
+AUDIENCES = ['M35-45', 'M45-55', 'M55+', 'F35-45', 'F45-55', 'F55+']
+ADSETS_PER_CAMPAIGN = 4.5
+PLACEHOLDER_SHARE = 0.002
+
+
+def synthetic_report(n_rows, days=1, end_day=None, seed=0):
+    """
+    A tracker ``report/build`` body with ``n_rows`` rows spread over ``days``
+    days, using the same columns and value ranges as the live report.
+    """
+    rng = np.random.default_rng(seed)
+    end_day = end_day or date.today()
+    n_adsets = max(1, n_rows // days)
+    n_campaigns = max(1, int(n_adsets / ADSETS_PER_CAMPAIGN))
+
+    campaign = rng.integers(0, n_campaigns, n_rows)
+    adset = np.arange(n_rows) % n_adsets
+    day_offset = np.arange(n_rows) // n_adsets
+
+    campaign_geo = rng.choice(GEOS, n_campaigns, p=GEO_WEIGHTS)
+    campaign_brand = rng.choice(BRANDS, n_campaigns)
+    campaign_started = rng.integers(0, 30, n_campaigns)
+    campaign_names = np.array([
+        f"{(end_day - timedelta(days=int(started))).strftime('%d-%m-%Y')} - {geo} - {brand} - Creative {i % 5 + 1}"
+        for i, (started, geo, brand) in enumerate(zip(campaign_started, campaign_geo, campaign_brand))
+    ], dtype=object)
+
+    clicks = rng.gamma(1.2, 120, n_rows).round().astype(int)
+    lp_clicks = (clicks * rng.uniform(0.2, 0.7, n_rows)).round().astype(int)
+    conversions = rng.binomial(lp_clicks, rng.uniform(0.0, 0.25, n_rows))
+    cpc = rng.lognormal(-1.6, 0.5, n_rows).round(4)
+    cost = (clicks * cpc).round(2)
+    revenue = (conversions * rng.uniform(1.5, 4.0, n_rows)).round(2)
+    profit = (revenue - cost).round(2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lp_ctr = np.where(clicks > 0, lp_clicks / clicks * 100, 0).round(2)
+        cr = np.where(clicks > 0, conversions / clicks * 100, 0).round(2)
+        roi = np.where(cost > 0, profit / cost * 100, 0).round(2)
+
+    df = pd.DataFrame({
+        'sub_id_6': campaign_names[campaign],
+        'sub_id_5': rng.choice(AUDIENCES, n_rows),
+        'sub_id_2': (120200000000000000 + adset * 7919).astype(str),
+        'sub_id_3': (120300000000000000 + campaign * 104729).astype(str),
+        'day': [(end_day - timedelta(days=int(offset))).isoformat() for offset in (days - 1 - day_offset)],
+        'clicks': clicks,
+        'lp_clicks': lp_clicks,
+        'lp_ctr': lp_ctr,
+        'cr': cr,
+        'cpc': cpc,
+        'cost': cost,
+        'campaign_unique_clicks': (clicks * rng.uniform(0.6, 0.95, n_rows)).round().astype(int),
+        'conversions': conversions,
+        'roi_confirmed': roi,
+        'revenue': revenue,
+        'profit': profit,
+    })
+
+    # Unresolved tracker macros, which clean_report() has to drop
+    placeholders = rng.random(n_rows) < PLACEHOLDER_SHARE
+    df.loc[placeholders, ['sub_id_6', 'sub_id_5', 'sub_id_2', 'sub_id_3']] = ['', '', '{{sub_id_2}}', '']
+
+    return {'rows': df.to_dict(orient='records'), 'total': n_rows}
+
+
+def synthetic_history(n_rows, chunk_size, days_per_chunk=1, seed=0):
+    """
+    ``n_rows`` of adset history as DataFrames of at most ``chunk_size`` rows,
+    each chunk a synthetic report of earlier days than the one before.
+    """
+    end_day = date.today()
+    for i, start in enumerate(range(0, n_rows, chunk_size)):
+        size = min(chunk_size, n_rows - start)
+        report = synthetic_report(size, days=days_per_chunk, end_day=end_day, seed=seed + i)
+        end_day -= timedelta(days=days_per_chunk)
+        yield pd.DataFrame(report['rows'])
@@ -0,0 +1,370 @@
+import json
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import scipy.sparse as sp
+import sklearn
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy.sparse.csgraph import connected_components
+from django.conf import settings
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import KDTree
+from sklearn.preprocessing import StandardScaler
+
+from api.models import CampaignAdSet
+from api.utills.assignment import CoreAssigner
+from api.utills.features import FeatureBuilder, missing_features
+from api.utills.pipeline import clean_report
+from api.utills.snapshots import list_snapshots, run_day, snapshot_path
+
+
+# Tracker columns a training row needs; the features (ratios included) are
+# built by the inference FeatureBuilder, exactly as at inference time
+RAW_COLUMNS = [
+    'sub_id_6', 'sub_id_5', 'sub_id_2', 'sub_id_3', 'day',
+    'clicks', 'lp_clicks', 'lp_ctr', 'cr', 'cost', 'campaign_unique_clicks',
+    'conversions', 'roi_confirmed', 'revenue', 'profit',
+]
+DEFAULT_FEATURES = [
+    'cost', 'revenue', 'campaign_unique_clicks', 'roi_confirmed', 'lp_clicks', 'revenue_to_cost_ratio',
+]
+TRAINING_SOURCES = ('adsets', 'snapshots')
+STRATA = ('geo', 'day')
+# Neighbor pairs per block of the sparse radius-neighbors graph (scalable mode)
+GRAPH_BLOCK_EDGES = 2_000_000
+
+
+def new_model_version():
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def adset_history_chunks(chunk_size, since=None, until=None):
+    """Stored CampaignAdSet rows as DataFrames of at most ``chunk_size`` rows."""
+    qs = CampaignAdSet.objects.order_by('pk')
+    if since:
+        qs = qs.filter(day__gte=since)
+    if until:
+        qs = qs.filter(day__lte=until)
+    rows = qs.values_list(*RAW_COLUMNS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield pd.DataFrame.from_records(chunk, columns=RAW_COLUMNS)
+
+
+def snapshot_history_chunks(chunk_size, since=None, until=None):
+    """
+    Raw tracker rows from the report snapshots, the last snapshot of every
+    day only (earlier ones of the same day are partial versions of it).
+    """
+    latest = {}
+    for run_id in list_snapshots('report'):
+        day = run_day(run_id)
+        if (since and day < since) or (until and day > until):
+            continue
+        latest[day] = run_id
+    if not latest:
+        return
+    dataset = ds.dataset([snapshot_path('report', run_id) for _, run_id in sorted(latest.items())], format='parquet')
+    columns = [col for col in RAW_COLUMNS if col in dataset.schema.names]
+    for batch in dataset.to_batches(columns=columns, batch_size=chunk_size):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def feature_chunks(chunks, features, stratify=None):
+    """
+    Unscaled feature matrices (float32) of cleaned training chunks, built by
+    the inference FeatureBuilder. Yields (X, rows, strata): ``strata`` holds the
+    ``stratify`` column ('geo', 'day') of every row of X, or None.
+    """
+    builder = FeatureBuilder(features)
+    for df in chunks:
+        df = clean_report(df, dedupe=False)
+        if 'sub_id_2' in df.columns and 'day' in df.columns:
+            df = df.drop_duplicates(subset=['sub_id_2', 'day'], keep='last')
+        if df.empty:
+            continue
+        missing = missing_features(df, features)
+        if missing:
+            raise ValueError(f"Training rows have no feature(s): {', '.join(missing)}")
+        X, _ = builder.build(df, dtype=np.float32)
+        keep = np.isfinite(X).all(axis=1)
+        strata = df[stratify].astype(str).to_numpy()[keep] if stratify else None
+        yield X[keep], len(df), strata
+
+
+class Reservoir:
+    """Uniform sample of at most ``size`` rows from a stream of matrices (algorithm R)."""
+
+    def __init__(self, size, n_features, rng):
+        self.size = size
+        self.rows = np.empty((0, n_features), dtype=np.float32)
+        self.seen = 0
+        self.rng = rng
+
+    def add(self, X):
+        fill = min(max(self.size - self.seen, 0), len(X))
+        if fill:
+            # Grow on demand: with many strata most reservoirs stay small
+            rows = np.empty((self.seen + fill, self.rows.shape[1]), dtype=np.float32)
+            rows[:self.seen] = self.rows
+            rows[self.seen:] = X[:fill]
+            self.rows = rows
+        rest = X[fill:]
+        if len(rest):
+            positions = self.seen + fill + np.arange(len(rest))
+            slots = self.rng.integers(0, positions + 1)
+            keep = slots < self.size
+            # Fancy assignment keeps the last write per slot, like the sequential algorithm
+            self.rows[slots[keep]] = rest[keep]
+        self.seen += len(X)
+
+
+class StratifiedSample:
+    """
+    One reservoir per stratum; sample() draws from each in proportion to the
+    rows it has seen, so rare strata keep their share.
+    """
+
+    def __init__(self, size, n_features, seed=0):
+        self.size = size
+        self.n_features = n_features
+        self.rng = np.random.default_rng(seed)
+        self.reservoirs = {}
+
+    def add(self, X, strata=None):
+        if strata is None:
+            groups = [('', X)]
+        else:
+            keys, inverse = np.unique(strata, return_inverse=True)
+            groups = [(key, X[inverse == i]) for i, key in enumerate(keys)]
+        for key, rows in groups:
+            reservoir = self.reservoirs.get(key)
+            if reservoir is None:
+                reservoir = self.reservoirs[key] = Reservoir(self.size, self.n_features, self.rng)
+            reservoir.add(rows)
+
+    @property
+    def seen(self):
+        return sum(reservoir.seen for reservoir in self.reservoirs.values())
+
+    def sample(self):
+        total = self.seen
+        if total <= self.size:
+            return np.concatenate([r.rows for r in self.reservoirs.values()]) if self.reservoirs \
+                else np.empty((0, self.n_features), dtype=np.float32)
+        # Largest remainder allocation of the sample over the strata
+        shares = np.array([r.seen for r in self.reservoirs.values()]) * self.size / total
+        quotas = np.floor(shares).astype(int)
+        quotas[np.argsort(quotas - shares)[:self.size - quotas.sum()]] += 1
+        return np.concatenate([
+            r.rows[self.rng.permutation(len(r.rows))[:quota]]
+            for r, quota in zip(self.reservoirs.values(), quotas)
+        ])
+
+
+def _query_radius(tree, X, eps, n_jobs=None, **kwargs):
+    """KDTree.query_radius() split over ``n_jobs`` threads (the tree releases the GIL)."""
+    n_jobs = effective_n_jobs(n_jobs)
+    if n_jobs == 1 or len(X) < 2 * n_jobs:
+        return tree.query_radius(X, eps, **kwargs)
+    parts = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(tree.query_radius)(part, eps, **kwargs) for part in np.array_split(X, n_jobs)
+    )
+    return np.concatenate(parts)
+
+
+def fit_dbscan(X, eps, min_samples, n_jobs=None, block_edges=GRAPH_BLOCK_EDGES):
+    """
+    DBSCAN that never holds more than ``block_edges`` neighbor pairs. sklearn
+    keeps every neighborhood (and a precomputed graph every edge) at once,
+    which on dense data is far bigger than the points themselves. Here:
+
+    - identical rows (all-zero adset-days are common) become one weighted point;
+    - core points come from neighbor counts, which need no neighbor lists;
+    - the radius-neighbors graph between core points is built in sparse
+      blocks of at most ``block_edges`` edges, each folded into the connected
+      components found so far;
+    - other points join the cluster of a core point within eps, or are noise.
+
+    Same core points, noise and clusters of core points as sklearn's DBSCAN,
+    numbered differently; a border point within eps of two clusters may land
+    in the other one, so the labels are not identical. Returns (labels per row of X, core points, core
+    labels, graph edges).
+    """
+    unique, inverse, weights = np.unique(X, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    n = len(unique)
+    tree = KDTree(unique)
+
+    counts = _query_radius(tree, unique, eps, n_jobs, count_only=True)
+    # A point with min_samples distinct neighbors is core whatever the weights;
+    # the others have small neighborhoods, so listing them is cheap
+    is_core = counts >= min_samples
+    small = np.flatnonzero(~is_core)
+    small_neighbors = _query_radius(tree, unique[small], eps, n_jobs) if len(small) else []
+    for i, neighbors in zip(small, small_neighbors):
+        is_core[i] = weights[neighbors].sum() >= min_samples
+
+    core = np.flatnonzero(is_core)
+    position = np.full(n, -1)
+    position[core] = np.arange(len(core))
+    root = np.arange(len(core))  # core point -> a core point of its component so far
+    edges = 0
+    # Blocks of core rows whose neighborhoods add up to about block_edges
+    block = np.cumsum(counts[core]) // block_edges
+    for rows in np.split(core, np.flatnonzero(np.diff(block)) + 1):
+        if not len(rows):
+            continue
+        neighbors = _query_radius(tree, unique[rows], eps, n_jobs)
+        cols = position[np.concatenate(neighbors)]
+        src = np.repeat(position[rows], [len(a) for a in neighbors])
+        keep = cols >= 0
+        edges += int(keep.sum())
+        # Only edges between components found so far change anything; on
+        # dense data that drops almost all of them after the first blocks
+        src, cols = root[src[keep]], root[cols[keep]]
+        keep = src != cols
+        # Those edges plus one edge per core point to its component so far
+        graph = sp.coo_matrix(
+            (np.ones(keep.sum() + len(core), dtype=np.int8),
+             (np.concatenate([src[keep], np.arange(len(core))]), np.concatenate([cols[keep], root]))),
+            shape=(len(core), len(core)),
+        ).tocsr()
+        n_components, components = connected_components(graph, directed=False)
+        first = np.empty(n_components, dtype=np.int64)
+        first[components[::-1]] = np.arange(len(core))[::-1]
+        root = first[components]
+
+    labels = np.full(n, -1)
+    labels[core] = np.unique(root, return_inverse=True)[1]
+    for i, neighbors in zip(small, small_neighbors):
+        if not is_core[i]:
+            core_neighbors = neighbors[is_core[neighbors]]
+            if len(core_neighbors):
+                labels[i] = labels[core_neighbors.min()]
+    return labels[inverse], unique[core], labels[core], edges
+
+
+def cluster_stats(labels):
+    labels = np.asarray(labels)
+    if not len(labels):
+        return 0, 0.0
+    return int(len(set(labels.tolist()) - {-1})), round(float(np.mean(labels == -1)), 4)
+
+
+def train_bundle(read, features, eps, min_samples, sample_size=20_000, seed=0,
+                 scalable=False, stratify=None, n_jobs=None, block_edges=GRAPH_BLOCK_EDGES):
+    """
+    Fit the scaler on every training row (streamed, partial_fit) and DBSCAN
+    on a (stratified) sample of them. ``read()`` returns a fresh iterator of
+    raw row chunks. The sample fit records eps/min_samples, the cluster
+    structure and the core points (inference labels from them with
+    CLUSTER_ASSIGNMENT='core', otherwise it refits DBSCAN per batch).
+
+    sklearn's DBSCAN keeps every neighborhood in memory, which grows quickly
+    with the sample; ``scalable`` fits on a chunked sparse graph instead and
+    labels every training row from the core points of the sample fit (a
+    second pass over ``read()``). Returns (bundle, stats).
+    """
+    timings = {}
+    started = time.perf_counter()
+    scaler = StandardScaler()
+    sampler = StratifiedSample(sample_size, len(features), seed=seed)
+    rows = n_chunks = 0
+    for X, chunk_rows, strata in feature_chunks(read(), features, stratify):
+        rows += chunk_rows
+        n_chunks += 1
+        if not len(X):
+            continue
+        scaler.partial_fit(pd.DataFrame(X, columns=features))
+        sampler.add(X, strata)
+    used = sampler.seen
+    if not used:
+        raise ValueError("No training rows")
+    timings['scan'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sample = scaler.transform(pd.DataFrame(sampler.sample(), columns=features))
+    graph_edges = None
+    if scalable:
+        labels, core, core_labels, graph_edges = fit_dbscan(
+            sample, eps, min_samples, n_jobs=n_jobs, block_edges=block_edges,
+        )
+    else:
+        dbscan = DBSCAN(eps=eps, min_samples=min_samples, n_jobs=n_jobs).fit(sample)
+        labels = dbscan.labels_
+        core, core_labels = dbscan.components_, labels[dbscan.core_sample_indices_]
+    timings['dbscan'] = time.perf_counter() - started
+    sample_clusters, sample_noise = cluster_stats(labels)
+    clusters, noise_share = sample_clusters, sample_noise
+
+    if scalable and len(sample) < used:
+        started = time.perf_counter()
+        assigner = CoreAssigner(core, core_labels, eps, n_jobs=n_jobs)
+        sizes = Counter()
+        for X, _, _ in feature_chunks(read(), features):
+            if len(X):
+                sizes.update(assigner.predict(scaler.transform(pd.DataFrame(X, columns=features))).tolist())
+        clusters = len(set(sizes) - {-1})
+        noise_share = round(sizes[-1] / max(sum(sizes.values()), 1), 4)
+        timings['propagate'] = time.perf_counter() - started
+
+    bundle = {
+        'scaler': scaler,
+        'dbscan': DBSCAN(eps=eps, min_samples=min_samples),
+        'features': list(features),
+        'best_params': {'eps': eps, 'min_samples': min_samples},
+        'training_timestamp': datetime.now().strftime('%Y%m%d_%H%M%S'),
+        'data_shape': (used, len(features)),
+        'n_features': len(features),
+        # For CLUSTER_ASSIGNMENT='core' (api/utills/assignment.py)
+        'core_points': core,
+        'core_labels': core_labels,
+    }
+    stats = {
+        'rows': rows,
+        'training_rows': used,
+        'chunks': n_chunks,
+        'sample_rows': len(sample),
+        'scalable': scalable,
+        'stratify': stratify,
+        'graph_edges': graph_edges,
+        'clusters': clusters,
+        'noise_share': noise_share,
+        'sample_clusters': sample_clusters,
+        'sample_noise_share': sample_noise,
+        'feature_mean': dict(zip(features, np.round(scaler.mean_, 6).tolist())),
+        'feature_scale': dict(zip(features, np.round(scaler.scale_, 6).tolist())),
+        'seconds': {name: round(seconds, 3) for name, seconds in timings.items()},
+    }
+    return bundle, stats
+
+
+def write_bundle(bundle, metadata, directory=None, version=None):
+    """
+    Write ``<MODEL_DIR>/dbscan-<version>.pkl`` (the metadata included) and a
+    ``.json`` sidecar; returns the bundle path.
+    """
+    directory = directory or settings.MODEL_DIR
+    version = version or new_model_version()
+    os.makedirs(directory, exist_ok=True)
+    bundle = {**bundle, 'version': version, 'metadata': metadata}
+    path = os.path.join(directory, f"dbscan-{version}.pkl")
+    tmp_path = os.path.join(directory, f".dbscan-{version}.pkl.tmp")
+    joblib.dump(bundle, tmp_path)
+    os.replace(tmp_path, path)
+    with open(os.path.join(directory, f"dbscan-{version}.json"), 'w') as f:
+        json.dump({'version': version, 'features': bundle['features'],
+                   'best_params': bundle['best_params'], 'sklearn': sklearn.__version__, **metadata}, f, indent=2, default=str)
+    return path
@@ -0,0 +1,162 @@
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+
+# Per-adset trends over the last ADSET_TREND_DAYS days an adset was reported,
+# kept in AdsetTrend as running sums over (x = day number, y) points: adding
+# a finished day and dropping the one that left the window are O(1) updates,
+# and the least-squares slope is (n·Σxy − Σx·Σy) / (n·Σx² − (Σx)²), no
+# regression over the history. Each inference joins the derived features by
+# adset from a per-process frame reloaded every ADSET_TREND_REFRESH seconds.
+TREND_FEATURES = ('rolling_roi', 'spend_slope', 'cr_slope', 'roi_day1', 'roi_day2')
+SUM_FIELDS = ('sum_x', 'sum_xx', 'sum_cost', 'sum_x_cost', 'sum_profit', 'sum_cr', 'sum_x_cr')
+# Day numbers count from here, small enough to keep Σx² exact
+EPOCH = date(2020, 1, 1)
+BULK_BATCH_SIZE = 500
+
+_trends = {'loaded_at': None, 'frame': None}
+_trends_lock = threading.Lock()
+
+
+def point_sums(x, cost, profit, cr):
+    """What one day adds to each of SUM_FIELDS."""
+    return (x, x * x, cost, x * cost, profit, cr, x * cr)
+
+
+def day_values(df):
+    """(adset ids, cost, profit, cr) of every adset of a one-day report frame, as the tracker sent them."""
+    df = df[df['sub_id_2'].notna()] if 'sub_id_2' in df.columns else df.iloc[:0]
+
+    def column(col):
+        if col not in df.columns:
+            return np.zeros(len(df))
+        return np.nan_to_num(pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64))
+
+    cost, profit = column('cost'), column('profit')
+    if 'cr' in df.columns:
+        cr = column('cr')
+    else:
+        clicks = column('clicks')
+        cr = np.divide(column('conversions') * 100, clicks, out=np.zeros(len(df)), where=clicks > 0)
+    return df['sub_id_2'].astype(str).tolist(), cost, profit, cr
+
+
+def fold_day(df, day):
+    """
+    Add the adsets of one tracker day to AdsetTrend and drop the days that
+    left their window. An adset already folded up to ``day`` is left alone,
+    and trends last reported before the window are deleted. An adset's old
+    days are only dropped when it is reported again: one that skipped fewer
+    than ADSET_TREND_DAYS days keeps days in its sums that are outside the
+    calendar window until then. Returns the number of adsets updated.
+    """
+    from api.models import AdsetTrend
+    adset_ids, costs, profits, crs = day_values(df)
+    x = (day - EPOCH).days
+    start = x - settings.ADSET_TREND_DAYS + 1
+    with transaction.atomic():
+        AdsetTrend.objects.filter(last_day__lt=day - timedelta(days=settings.ADSET_TREND_DAYS)).delete()
+        existing = AdsetTrend.objects.select_for_update().in_bulk(adset_ids, field_name='adset_id')
+        created, updated = [], []
+        for adset_id, cost, profit, cr in zip(adset_ids, costs.tolist(), profits.tolist(), crs.tolist()):
+            trend = existing.get(adset_id)
+            if trend is None:
+                trend = AdsetTrend(adset_id=adset_id, points=[])
+                created.append(trend)
+            elif trend.last_day is not None and trend.last_day >= day:
+                continue
+            else:
+                updated.append(trend)
+            sums = [getattr(trend, field) for field in SUM_FIELDS]
+            while trend.points and trend.points[0][0] < start:
+                sums = [total - value for total, value in zip(sums, point_sums(*trend.points.pop(0)))]
+            if not trend.points:
+                # Nothing left to subtract from: start again from exact zeros
+                sums = [0.0] * len(SUM_FIELDS)
+            sums = [total + value for total, value in zip(sums, point_sums(x, cost, profit, cr))]
+            trend.points.append([x, cost, profit, cr])
+            for field, total in zip(SUM_FIELDS, sums):
+                setattr(trend, field, total)
+            trend.days = len(trend.points)
+            trend.last_day = day
+        # bulk_update() writes a CASE per field over the whole batch, far
+        # slower than replacing the rows (nothing references them)
+        for start_at in range(0, len(updated), BULK_BATCH_SIZE):
+            AdsetTrend.objects.filter(pk__in=[trend.pk for trend in updated[start_at:start_at + BULK_BATCH_SIZE]]).delete()
+        for trend in updated:
+            trend.pk = None
+        AdsetTrend.objects.bulk_create(created + updated, batch_size=BULK_BATCH_SIZE)
+    return len(created) + len(updated)
+
+
+def trends_pending(day):
+    """Whether ``day`` (a date) still has to be folded into AdsetTrend."""
+    from api.models import AdsetTrend
+    return not AdsetTrend.objects.filter(last_day__gte=day).exists()
+
+
+def slope(n, sum_x, sum_xx, sum_y, sum_xy):
+    """Least-squares slope per row from running sums, NaN with fewer than two distinct days."""
+    denominator = n * sum_xx - sum_x * sum_x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, (n * sum_xy - sum_x * sum_y) / denominator, np.nan)
+
+
+def last_day_rois(points):
+    """ROI of the adset's last reported day, and of the day before when that was reported too."""
+    def roi(point):
+        return point[2] / point[1] * 100 if point[1] > 0 else 0.0
+
+    if not points:
+        return np.nan, np.nan
+    last = points[-1]
+    before = points[-2] if len(points) > 1 and points[-2][0] == last[0] - 1 else None
+    return (roi(before) if before else np.nan), roi(last)
+
+
+def trend_frame():
+    """TREND_FEATURES of every AdsetTrend, indexed by adset id (reloaded every ADSET_TREND_REFRESH seconds)."""
+    with _trends_lock:
+        loaded_at = _trends['loaded_at']
+        if loaded_at is not None and time.monotonic() - loaded_at < settings.ADSET_TREND_REFRESH:
+            return _trends['frame']
+        from api.models import AdsetTrend
+        try:
+            rows = list(AdsetTrend.objects.values_list('adset_id', 'days', *SUM_FIELDS, 'points'))
+        except Exception as e:
+            print(f"[ERROR] Loading the adset trends failed: {e}")
+            rows = []
+        columns = ['adset_id', 'days', *SUM_FIELDS, 'points']
+        trends = pd.DataFrame(rows, columns=columns).set_index('adset_id')
+        n = trends['days'].to_numpy(dtype=np.float64)
+        sums = {field: trends[field].to_numpy(dtype=np.float64) for field in SUM_FIELDS}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rolling_roi = np.where(sums['sum_cost'] > 0, sums['sum_profit'] / sums['sum_cost'] * 100, 0.0)
+        rois = [last_day_rois(points) for points in trends['points']]
+        frame = pd.DataFrame({
+            'rolling_roi': rolling_roi,
+            'spend_slope': slope(n, sums['sum_x'], sums['sum_xx'], sums['sum_cost'], sums['sum_x_cost']),
+            'cr_slope': slope(n, sums['sum_x'], sums['sum_xx'], sums['sum_cr'], sums['sum_x_cr']),
+            'roi_day1': [day1 for day1, _ in rois],
+            'roi_day2': [day2 for _, day2 in rois],
+        }, index=trends.index)
+        _trends.update(loaded_at=time.monotonic(), frame=frame)
+        return frame
+
+
+def join_trends(df, adset_col='sub_id_2'):
+    """Add TREND_FEATURES (NaN for adsets without a trend) to ``df`` in place."""
+    trends = trend_frame()
+    positions = trends.index.get_indexer(df[adset_col]) if len(trends) else np.full(len(df), -1)
+    found = positions >= 0
+    for col in TREND_FEATURES:
+        values = np.full(len(df), np.nan)
+        values[found] = trends[col].to_numpy()[positions[found]]
+        df[col] = values
+    return df
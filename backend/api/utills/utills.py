@@ -3,13 +3,14 @@ import joblib
 import numpy as np
 import pandas as pd
 from django.conf import settings
+from api.utills.warmup import load_bundle
 
 
 MODEL_BUNDLE_PATH = os.path.join(settings.MEDIA_ROOT, 'dbscan_model.pkl')
 
 
 def load_model():
-    bundle = joblib.load(MODEL_BUNDLE_PATH)
+    bundle = load_bundle(MODEL_BUNDLE_PATH)
     return bundle['scaler'], bundle['dbscan'], bundle['features']
 
 def feature_engineering(df):
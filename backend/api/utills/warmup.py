@@ -0,0 +1,88 @@
+import os
+import time
+from threading import Lock
+
+import joblib
+from django.conf import settings
+
+
+# Bundles every prediction view needs; loaded once per process (or once in the
+# gunicorn master with preload_app, then shared copy-on-write by the workers).
+# The clustering bundle comes from the model store (api/utills/model_store.py).
+MODEL_BUNDLES = [
+    'dbscan_model.pkl',
+]
+
+_bundles = {}
+_bundles_lock = Lock()
+
+warm_state = {
+    'ready': False,
+    'pid': None,
+    'warmed_at': None,
+    'warmup_seconds': None,
+    'bundles': [],
+    'model_version': None,
+}
+
+
+def load_bundle(path):
+    """
+    joblib.load() a model bundle once per process. The file mtime is part of the
+    key so a replaced bundle is picked up without a restart.
+    """
+    mtime = os.path.getmtime(path)
+    key = (os.path.abspath(path), mtime)
+    bundle = _bundles.get(key)
+    if bundle is not None:
+        return bundle
+    with _bundles_lock:
+        bundle = _bundles.get(key)
+        if bundle is None:
+            bundle = joblib.load(path)
+            # Drop older versions of the same file
+            for old_key in [k for k in _bundles if k[0] == key[0]]:
+                del _bundles[old_key]
+            _bundles[key] = bundle
+    return bundle
+
+
+def evict_bundles(keep):
+    """Forget cached bundles of the model store other than the paths in ``keep``."""
+    model_dir = os.path.abspath(settings.MODEL_DIR)
+    keep = {os.path.abspath(path) for path in keep if path}
+    with _bundles_lock:
+        for key in [k for k in _bundles if os.path.dirname(k[0]) == model_dir and k[0] not in keep]:
+            del _bundles[key]
+
+
+def warm_up():
+    """
+    Import the URLconf (views, pandas, sklearn, country.json), load the
+    model bundles and run one inference so the first request does not pay
+    for it.
+    """
+    started = time.perf_counter()
+
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+
+    # Loads the current model bundle and runs the warmup inference on it
+    from api.utills.model_store import active_model_path, refresh
+    model_version = refresh(wait=True)
+    loaded = [os.path.basename(active_model_path())] if model_version else []
+    for name in MODEL_BUNDLES:
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        if os.path.exists(path):
+            load_bundle(path)
+            loaded.append(name)
+
+    warm_state.update({
+        'ready': True,
+        'pid': os.getpid(),
+        'warmed_at': time.time(),
+        'warmup_seconds': round(time.perf_counter() - started, 3),
+        'bundles': loaded,
+        'model_version': model_version,
+    })
+    return warm_state
@@ -1,19 +1,17 @@
 import requests
 from datetime import datetime, timedelta
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 import pandas as pd
 import numpy as np
 from django.utils import timezone
-from scipy.stats import linregress
 from api.models import  CampaignAdSet, AdSetTimeRange
 from api.utills.utills import load_model, preprocess, map_clusters_to_recommendations
 from django.conf import settings
 from threading import Lock
 from api.serializers import CampaignSerializer
-from api.utills.live_inference import main
 import json
 from django.utils.timezone import make_aware
 from collections import defaultdict
@@ -27,6 +25,37 @@ import uuid
 from api.utills.combine_inference import enrich_campaign_data
 from .models import AdsetStatus
 from .serializers import AdsetStatusSerializer
+from api.utills.query import CampaignQuery, QueryParamError
+from api.utills.pipeline import (
+    extract_geo,
+    today_amsterdam,
+    parse_date_range,
+    build_report_payload,
+    daily_report_payload,
+    new_run_id,
+    fetch_report,
+    save_raw_report,
+    clean_report,
+    aggregate_date_range,
+    run_live_inference,
+    register_new_adsets,
+    load_status_map,
+    enrich_model_path,
+    enrich_group,
+    enrich_results,
+    group_processed_data,
+    build_summary,
+    campaign_body,
+)
+from api.utills.singleflight import flight_key, coalesce
+from api.utills.result_cache import result_key, status_generation, get_result, put_result
+from api.utills.incremental import SummaryTotals, get_state, keep_state, state_results
+from api.utills.metrics import StageMetricsMixin, registry
+from api.renderers import NDJSONRenderer, ndjson_line
+from api.utills.warmup import warm_state, warm_up
+from api.utills.model_store import model_info
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.settings import api_settings
 
 
 # Global state tracker for cycling state 0-7
@@ -34,102 +63,33 @@ if not hasattr(settings, 'CAMPAIGN_STATE'):  # Only add if not present
     settings.CAMPAIGN_STATE = 0
     settings.CAMPAIGN_STATE_LOCK = Lock()
 
-def extract_geo(sub_id_6):
-    if not isinstance(sub_id_6, str):
-        return None
-    # Pattern 1: URL-style
-    parts = re.split(r"\+-\+|\s-\s", sub_id_6)
-    if len(parts) >= 2:
-        return parts[1].strip()
-    return None
+def campaign_response(data, summary, pagination=None):
+    return Response(campaign_body(data, summary, pagination), status=status.HTTP_200_OK)
 
-class PredictCampaignsView(APIView):
+class PredictCampaignsView(StageMetricsMixin, APIView):
     def get(self, request):
         try:
-            # API config
-            api_key = os.getenv("API_KEY")
-            base_url = "https://tracktheweb.online/admin_api/v1"
+            query = CampaignQuery(request.query_params)
+        except QueryParamError as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
             all_data_items = []
 
             # Use current Amsterdam time for both start and end date
-            now_amsterdam = datetime.now(ZoneInfo("Europe/Amsterdam"))
-            start_date = now_amsterdam
-            end_date = now_amsterdam
-
-            payload = {
-                "range": {
-                    "from": start_date.strftime("%Y-%m-%d"),
-                    "to": end_date.strftime("%Y-%m-%d"),
-                    "timezone": "Europe/Amsterdam"
-                },
-                "columns": ["clicks", "day", "lp_clicks", "lp_ctr", "cr", "cpc"],
-                "metrics": [
-                    "clicks", "cost", "campaign_unique_clicks", "conversions",
-                    "roi_confirmed", "revenue", "profit"
-                ],
-                "grouping": ["sub_id_6", "sub_id_5", "sub_id_2", "sub_id_3"],
-                "filters": [],
-                "summary": False,
-                "limit": 100000,
-                "offset": 0,
-                "extended": True
-            }
-
-            headers = {
-                "Api-Key": api_key,
-                "Content-Type": "application/json"
-            }
-
-            response = requests.post(
-                f"{base_url}/report/build",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            data = response.json()
+            now_amsterdam = today_amsterdam()
+            data = fetch_report(build_report_payload(now_amsterdam, now_amsterdam))
 
             # Save raw API response
-            with open('api_response.json', 'w') as f:
-                json.dump(data, f, indent=4)
+            run_id = new_run_id()
+            save_raw_report(data, run_id)
 
             rows = data.get('rows', [])
             if not rows:
                 return Response({'success': True, 'data': [], 'summary': {}}, status=status.HTTP_200_OK)
 
-            df = pd.DataFrame(rows)
-
-            df.to_csv("media/row_data.csv", index=False)
-
-            def is_empty_or_placeholder(val):
-                if pd.isna(val):
-                    return True
-                if isinstance(val, str) and (val.strip() == "" or val.strip().startswith("{{")):
-                    return True
-                return False
-
-            df = df.applymap(lambda x: pd.NA if is_empty_or_placeholder(x) else x)
-
-            for col in ['sub_id_2', 'sub_id_3']:
-                if col in df.columns and df[col].isna().all():
-                    df.drop(columns=col, inplace=True)
-
-            cols_to_check = ['sub_id_6', 'sub_id_5', 'sub_id_3', 'sub_id_2']
-            cols_existing = [col for col in cols_to_check if col in df.columns]
-            df = df.dropna(subset=cols_existing, how='all')
-
-            if 'sub_id_2' in df.columns:
-                df = df.drop_duplicates(subset='sub_id_2', keep='first')
-
-            df["geo"] = df["sub_id_6"].apply(extract_geo)
-            df["country"] = df["geo"].apply(extract_country_name)
-
-            df.to_csv("media/row_data.csv", index=False)
-            df.to_json("media/preprocess_data.json", orient='records', indent=2)
-
-            data_path =os.path.join(settings.MEDIA_ROOT, 'preprocess_data.json')
-
-            data = main(data_path)
+            df = clean_report(rows)
+            data = run_live_inference(df, 'preprocess_data', run_id)
 
             for item in data:
 
@@ -207,79 +167,39 @@ class PredictCampaignsView(APIView):
             else:
                 summary = {}
 
-            return Response({'success': True, 'data': output, 'summary': summary}, status=status.HTTP_200_OK)
+            output, pagination = query.run(output)
+            return campaign_response(output, summary, pagination)
 
         except Exception as e:
             return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-class PredictTimeRangeView(APIView):
+class PredictTimeRangeView(StageMetricsMixin, APIView):
     """
     API endpoint to get ad set campaign data within a date range,
     process, save in DB and return grouped result and summary.
     """
 
     def get(self, request):
+        try:
+            query = CampaignQuery(request.query_params)
+        except QueryParamError as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             api_key = os.getenv("API_KEY") or getattr(settings, "API_KEY", None)
             if not api_key:
                 return Response({"success": False, "error": "API_KEY not set."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            base_url = "https://tracktheweb.online/admin_api/v1"
-
-            # Get date range params
-            start_str = request.query_params.get('start_date')
-            end_str = request.query_params.get('end_date')
-
-            amsterdam_tz = ZoneInfo("Europe/Amsterdam")
-
             try:
-                # Parse dates or fallback to now
-                if start_str:
-                    start_date = datetime.strptime(start_str, "%Y-%m-%d")
-                    start_date = make_aware(start_date, amsterdam_tz)
-                else:
-                    start_date = datetime.now(amsterdam_tz)
-
-                if end_str:
-                    end_date = datetime.strptime(end_str, "%Y-%m-%d")
-                    end_date = make_aware(end_date, amsterdam_tz)
-                else:
-                    end_date = datetime.now(amsterdam_tz)
+                start_date, end_date = parse_date_range(request.query_params)
             except ValueError:
                 return Response({"success": False, "error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
 
-            payload = {
-                "range": {
-                    "from": start_date.strftime("%Y-%m-%d"),
-                    "to": end_date.strftime("%Y-%m-%d"),
-                    "timezone": "Europe/Amsterdam"
-                },
-                "columns": ["clicks", "day", "lp_clicks", "lp_ctr", "cr", "cpc"],
-                "metrics": [
-                    "clicks", "cost", "campaign_unique_clicks", "conversions",
-                    "roi_confirmed", "revenue", "profit"
-                ],
-                "grouping": ["sub_id_6", "sub_id_5", "sub_id_2", "sub_id_3"],
-                "filters": [],
-                "summary": False,
-                "limit": 100000,
-                "offset": 0,
-                "extended": True
-            }
-
-            headers = {
-                "Api-Key": api_key,
-                "Content-Type": "application/json"
-            }
-
-            response = requests.post(f"{base_url}/report/build", headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-
-            data = response.json()
+            data = fetch_report(build_report_payload(start_date, end_date))
 
             # Save raw API response for debugging
-            with open('api_response.json', 'w') as f:
-                json.dump(data, f, indent=4)
+            run_id = new_run_id()
+            save_raw_report(data, run_id)
 
             rows = data.get('rows', [])
             if not rows:
@@ -318,14 +238,7 @@ class PredictTimeRangeView(APIView):
             df["geo"] = df["sub_id_6"].apply(extract_geo)
             df["country"] = df["geo"].apply(extract_country_name)
 
-            # Save preprocessed data to file (optional)
-            df.to_csv("media/row_data_time_range.csv", index=False)
-            df.to_json("media/preprocess_data_time_range.json", orient='records', indent=2)
-
-            data_path = os.path.join(settings.MEDIA_ROOT, 'preprocess_data_time_range.json')
-
-            # Your processing function (you must define it)
-            processed_data = main(data_path)
+            processed_data = run_live_inference(df, 'preprocess_data_time_range', run_id)
 
             # Save all processed items
             all_data_items = []
@@ -432,12 +345,11 @@ class PredictTimeRangeView(APIView):
 
             output.sort(key=most_recent_day, reverse=True)
 
-            model_path = os.path.join(settings.MEDIA_ROOT, 'dbscan_model_bundle_latest.pkl')
+            model_path = enrich_model_path()
 
-            final_results = []
-            for group in output:  # Your grouped campaign list
-                enriched = enrich_campaign_data(group, model_path=model_path)
-                final_results.append(enriched)
+            final_results, pagination = query.run(
+                output, lambda group: enrich_campaign_data(group, model_path=model_path)
+            )
 
 
             # Generate overall summary (optional)
@@ -457,7 +369,7 @@ class PredictTimeRangeView(APIView):
                         "priority_distribution": summary_df['priority'].astype(str).value_counts().to_dict()
                     }
 
-            return Response({'success': True, 'data': final_results, 'summary': summary}, status=status.HTTP_200_OK)
+            return campaign_response(final_results, summary, pagination)
 
         except requests.RequestException as e:
             return Response({'success': False, 'error': f'API request failed: {str(e)}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -465,93 +377,30 @@ class PredictTimeRangeView(APIView):
         except Exception as e:
             return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class PredictCampaignsUpdateView(APIView):
+class PredictCampaignsUpdateView(StageMetricsMixin, APIView):
    def get(self, request):
         try:
-            # API config
-            api_key = os.getenv("API_KEY")
-            base_url = "https://tracktheweb.online/admin_api/v1"
+            query = CampaignQuery(request.query_params)
+        except QueryParamError as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
             all_data_items = []
 
             # Use current Amsterdam time for both start and end date
-            now_amsterdam = datetime.now(ZoneInfo("Europe/Amsterdam"))
-            start_date = now_amsterdam
-            end_date = now_amsterdam
-
-            payload = {
-                "range": {
-                    "from": start_date.strftime("%Y-%m-%d"),
-                    "to": end_date.strftime("%Y-%m-%d"),
-                    "timezone": "Europe/Amsterdam"
-                },
-                "columns": ["clicks", "day", "lp_clicks", "lp_ctr", "cr", "cpc"],
-                "metrics": [
-                    "clicks", "cost", "campaign_unique_clicks", "conversions",
-                    "roi_confirmed", "revenue", "profit"
-                ],
-                "grouping": ["sub_id_6", "sub_id_5", "sub_id_2", "sub_id_3"],
-                "filters": [],
-                "summary": False,
-                "limit": 100000,
-                "offset": 0,
-                "extended": True
-            }
-
-            headers = {
-                "Api-Key": api_key,
-                "Content-Type": "application/json"
-            }
-
-            response = requests.post(
-                f"{base_url}/report/build",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            data = response.json()
+            now_amsterdam = today_amsterdam()
+            data = fetch_report(build_report_payload(now_amsterdam, now_amsterdam))
 
             # Save raw API response
-            with open('api_response.json', 'w') as f:
-                json.dump(data, f, indent=4)
+            run_id = new_run_id()
+            save_raw_report(data, run_id)
 
             rows = data.get('rows', [])
             if not rows:
                 return Response({'success': True, 'data': [], 'summary': {}}, status=status.HTTP_200_OK)
 
-            df = pd.DataFrame(rows)
-
-            df.to_csv("media/row_data.csv", index=False)
-
-            def is_empty_or_placeholder(val):
-                if pd.isna(val):
-                    return True
-                if isinstance(val, str) and (val.strip() == "" or val.strip().startswith("{{")):
-                    return True
-                return False
-
-            df = df.applymap(lambda x: pd.NA if is_empty_or_placeholder(x) else x)
-
-            for col in ['sub_id_2', 'sub_id_3']:
-                if col in df.columns and df[col].isna().all():
-                    df.drop(columns=col, inplace=True)
-
-            cols_to_check = ['sub_id_6', 'sub_id_5', 'sub_id_3', 'sub_id_2']
-            cols_existing = [col for col in cols_to_check if col in df.columns]
-            df = df.dropna(subset=cols_existing, how='all')
-
-            if 'sub_id_2' in df.columns:
-                df = df.drop_duplicates(subset='sub_id_2', keep='first')
-
-            df["geo"] = df["sub_id_6"].apply(extract_geo)
-            df["country"] = df["geo"].apply(extract_country_name)
-
-            df.to_csv("media/row_data.csv", index=False)
-            df.to_json("media/preprocess_data.json", orient='records', indent=2)
-
-            data_path =os.path.join(settings.MEDIA_ROOT, 'preprocess_data.json')
-
-            data = main(data_path)
+            df = clean_report(rows)
+            data = run_live_inference(df, 'preprocess_data', run_id)
 
             
             all_data_items.extend(data)
@@ -594,12 +443,11 @@ class PredictCampaignsUpdateView(APIView):
                     "day": dict(day_dict)  # note key changed from 'adset' list to grouped by day
                 })
 
-            model_path = os.path.join(settings.MEDIA_ROOT, 'dbscan_model_bundle_latest.pkl')
+            model_path = enrich_model_path()
 
-            final_results = []
-            for group in output:  # Your grouped campaign list
-                enriched = enrich_campaign_data(group, model_path=model_path)
-                final_results.append(enriched)
+            final_results, pagination = query.run(
+                output, lambda group: enrich_campaign_data(group, model_path=model_path)
+            )
 
             summary = {}
             if all_data_items:
@@ -622,407 +470,167 @@ class PredictCampaignsUpdateView(APIView):
             else:
                 summary = {}
 
-            return Response({'success': True, 'data': final_results, 'summary': summary}, status=status.HTTP_200_OK)
+            return campaign_response(final_results, summary, pagination)
 
         except Exception as e:
             return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class PredictCampaignsDailyView(APIView):
+class PredictCampaignsDailyView(StageMetricsMixin, APIView):
     permission_classes = [IsAuthenticated]
-    def get(self, request):
-        try:
-            # API config
-            api_key = os.getenv("API_KEY")
-            base_url = "https://tracktheweb.online/admin_api/v1"
-            all_data_items = []
-
-            # Use current Amsterdam time for both start and end date
-            now_amsterdam = datetime.now(ZoneInfo("Europe/Amsterdam"))
-            start_date = now_amsterdam
-            end_date = now_amsterdam
-
-            payload = {
-                "range": {
-                    "from": start_date.strftime("%Y-%m-%d"),
-                    "to": end_date.strftime("%Y-%m-%d"),
-                    "timezone": "Europe/Amsterdam"
-                },
-                "columns": ["clicks", "day", "lp_clicks", "lp_ctr", "cr", "cpc"],
-                "metrics": [
-                    "clicks", "cost", "campaign_unique_clicks", "conversions",
-                    "roi_confirmed", "revenue", "profit"
-                ],
-                "grouping": ["sub_id_6", "sub_id_5", "sub_id_2", "sub_id_3"],
-                "filters": [],
-                "summary": False,
-                "limit": 100000,
-                "offset": 0,
-                "extended": True
-            }
-
-            headers = {
-                "Api-Key": api_key,
-                "Content-Type": "application/json"
-            }
-
-            response = requests.post(
-                f"{base_url}/report/build",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            # Save raw API response
-            with open('api_response.json', 'w') as f:
-                json.dump(data, f, indent=4)
-
-            rows = data.get('rows', [])
-            if not rows:
-                return Response({'success': True, 'data': [], 'summary': {}}, status=status.HTTP_200_OK)
-
-            # ✅ Optimized insert
-            adset_ids = {row.get("sub_id_2") for row in rows if row.get("sub_id_2")}
-            if adset_ids:
-                existing_ids = set(
-                    AdsetStatus.objects.filter(adset_id__in=adset_ids).values_list("adset_id", flat=True)
-                )
-                new_ids = adset_ids - existing_ids
-                new_records = [AdsetStatus(adset_id=adset_id, is_active=True) for adset_id in new_ids]
-                AdsetStatus.objects.bulk_create(new_records, ignore_conflicts=True)
-
-            df = pd.DataFrame(rows)
-
-            df.to_csv("media/row_data.csv", index=False)
-
-            def is_empty_or_placeholder(val):
-                if pd.isna(val):
-                    return True
-                if isinstance(val, str) and (val.strip() == "" or val.strip().startswith("{{")):
-                    return True
-                return False
-
-            df = df.applymap(lambda x: pd.NA if is_empty_or_placeholder(x) else x)
-
-            for col in ['sub_id_2', 'sub_id_3']:
-                if col in df.columns and df[col].isna().all():
-                    df.drop(columns=col, inplace=True)
-
-            cols_to_check = ['sub_id_6', 'sub_id_5', 'sub_id_3', 'sub_id_2']
-            cols_existing = [col for col in cols_to_check if col in df.columns]
-            df = df.dropna(subset=cols_existing, how='all')
-
-            if 'sub_id_2' in df.columns:
-                df = df.drop_duplicates(subset='sub_id_2', keep='first')
-
-            df["geo"] = df["sub_id_6"].apply(extract_geo)
-            df["country"] = df["geo"].apply(extract_country_name)
-
-            df.to_csv("media/row_data.csv", index=False)
-            df.to_json("media/preprocess_data.json", orient='records', indent=2)
-
-            data_path =os.path.join(settings.MEDIA_ROOT, 'preprocess_data.json')
-
-            data = main(data_path)
-            # print("data:", data)
-
-            # 1. Extract all adset_ids from your data
-            adset_ids = {row['sub_id_2'] for row in data if row.get('sub_id_2')}
-
-            # 2. Query DB once and create a map
-            status_map = {
-                obj.adset_id: 'active' if obj.is_active else 'paused'
-                for obj in AdsetStatus.objects.filter(adset_id__in=adset_ids)
-            }
-
-            # 3. Enrich each row
-            for row in data:
-                adset_id = row.get('sub_id_2')
-                row['status'] = status_map.get(adset_id, 'unknown')  # 'unknown' if not in DB
-
-            data = [row for row in data if row.get('status') == 'active']
-
-            all_data_items.extend(data)
-            grouped = defaultdict(list)
+    """
+    Today's campaigns. Identical requests in flight at the same time share one
+    tracker fetch and pipeline run (api/utills/singleflight.py); an unchanged
+    report with unchanged statuses is answered from the result cache.
+    """
 
-            for item in data:
-                key = (item['sub_id_6'], item['sub_id_3'])
-                grouped[key].append(item)
+    def build(self, day, query):
+        # Read before the statuses, so a change in between misses next time
+        generation = status_generation()
+        # One model version for the whole response, even across a hot-swap
+        model_path = enrich_model_path()
+        payload = daily_report_payload(day)
 
-            output = []
-            for (sub_id_6, sub_id_3), items in grouped.items():
-                df_group = pd.DataFrame(items)
+        data = fetch_report(payload)
+        rows = data.get('rows', [])
+        if not rows:
+            return {'success': True, 'data': [], 'summary': {}}
 
-                total_cost = round(df_group['cost'].sum(), 2)
-                total_revenue = round(df_group['revenue'].sum(), 2)
-                total_profit = round(total_revenue - total_cost, 2)
-                total_clicks = int(round(df_group['clicks'].sum()))
-                total_conversions = int(round(df_group['conversions'].sum()))
+        key = result_key('prediction-daily', day, day, query.key(), data['fingerprint'], generation, model_path)
+        body = get_result(key, view=type(self).__name__)
+        if body is not None:
+            return body
 
-                total_roi = round(((total_revenue - total_cost) / total_cost) * 100, 2) if total_cost > 0 else 0
-                total_conversion_rate = round((total_conversions / total_clicks) * 100, 2) if total_clicks > 0 else 0
-                total_cpc = round((total_cost / total_clicks), 2) if total_clicks > 0 else 0
+        # Only the campaigns whose adset statuses changed since the last
+        # request for this report are re-grouped and re-enriched
+        state = get_state(data['fingerprint'], model_path)
+        if state is None:
+            run_id = new_run_id()
+            save_raw_report(data, run_id)
 
-                # ✅ Pick geo and country from first item in the group
-                geo = items[0].get("geo")
-                country = items[0].get("country")
+            register_new_adsets(rows)
 
-                output.append({
-                    "id": str(uuid.uuid4()),
-                    "sub_id_6": sub_id_6,
-                    "sub_id_3": sub_id_3,
-                    "total_cost": total_cost,
-                    "total_revenue": total_revenue,
-                    "total_profit": total_profit,
-                    "total_clicks": total_clicks,
-                    "total_cpc": total_cpc,
-                    "total_roi": total_roi,
-                    "geo": geo,
-                    "country": country,
-                    "total_conversion_rate": total_conversion_rate,
-                    "adset": items
-                })
+            df = clean_report(rows)
+            processed_data = run_live_inference(df, 'preprocess_data', run_id, model_path)
+            state = keep_state(data['fingerprint'], processed_data, model_path)
 
-            model_path = os.path.join(settings.MEDIA_ROOT, 'dbscan_model_bundle_latest.pkl')
+        status_map = load_status_map(state.adset_ids)
 
-            final_results = []
-            for group in output:  # Your grouped campaign list
-                enriched = enrich_campaign_data(group, model_path=model_path)
-                final_results.append(enriched)
+        final_results, summary, pagination = state_results(state, status_map, query)
 
-            summary = {}
-            if all_data_items:
-                summary_df = pd.DataFrame(all_data_items)
-                if not summary_df.empty:
-                    total_cost = round(summary_df['cost'].sum(), 2)
-                    total_revenue = round(summary_df['revenue'].sum(), 2)
-                    total_roi = round(((total_revenue - total_cost) / total_cost) * 100, 2) if total_cost > 0 else 0
+        body = campaign_body(final_results, summary, pagination)
+        put_result(key, body)
+        return body
 
-                    summary = {
-                        "total_adset" : len(summary_df),
-                        "total_cost": round(summary_df['cost'].sum(), 2),
-                        "total_revenue": round(summary_df['revenue'].sum(), 2),
-                        "total_profit": round(summary_df['profit'].sum(), 2),
-                        "total_clicks": int(summary_df['clicks'].sum()),
-                        "total_conversions": int(summary_df['conversions'].sum()),
-                        "total_roi": total_roi,
-                        "average_conversion_rate": round(summary_df['conversion_rate'].mean(), 4),
-                        "priority_distribution": summary_df['priority'].astype(str).value_counts().to_dict()
-                    }
-            else:
-                summary = {}
+    def get(self, request):
+        try:
+            query = CampaignQuery(request.query_params)
+        except QueryParamError as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response({'success': True, 'data': final_results, 'summary': summary}, status=status.HTTP_200_OK)
+        try:
+            # Use current Amsterdam time for both start and end date
+            now_amsterdam = today_amsterdam()
+            key = flight_key('prediction-daily', now_amsterdam, now_amsterdam, query.key())
+            body = coalesce(key, lambda: self.build(now_amsterdam, query), view=type(self).__name__)
+            return Response(body, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-class PredictDateRangeView(APIView):
+class PredictDateRangeView(StageMetricsMixin, APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [NDJSONRenderer]
     """
     API endpoint to get ad set campaign data within a date range,
     process, save in DB and return grouped result and summary.
-    """
 
-    def get(self, request):
-        try:
-            api_key = os.getenv("API_KEY") or getattr(settings, "API_KEY", None)
-            if not api_key:
-                return Response({"success": False, "error": "API_KEY not set."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            base_url = "https://tracktheweb.online/admin_api/v1"
-
-            # Get date range params
-            start_str = request.query_params.get('start_date')
-            end_str = request.query_params.get('end_date')
+    With ``?format=ndjson`` campaigns are streamed one per line as they are
+    enriched, followed by a trailing ``{"type": "summary"}`` record. Only
+    enrichment and rendering are incremental: DBSCAN is fitted on the whole
+    range, so its inference rows and their grouping are built before the
+    first line and bound the memory of the request.
+    """
 
-            amsterdam_tz = ZoneInfo("Europe/Amsterdam")
+    def stream_ndjson(self, query, output, all_data_items, model_path):
+        # The body is produced after dispatch() returns, so the view label is
+        # passed explicitly instead of coming from the metrics context
+        view = type(self).__name__
+        # Summed up front, without the DataFrame of every row build_summary() makes
+        totals = SummaryTotals()
+        for item in all_data_items:
+            totals.add(item)
 
+        def records():
             try:
-                # Parse dates or fallback to now
-                if start_str:
-                    start_date = datetime.strptime(start_str, "%Y-%m-%d")
-                    start_date = make_aware(start_date, amsterdam_tz)
-                else:
-                    start_date = datetime.now(amsterdam_tz)
-
-                if end_str:
-                    end_date = datetime.strptime(end_str, "%Y-%m-%d")
-                    end_date = make_aware(end_date, amsterdam_tz)
-                else:
-                    end_date = datetime.now(amsterdam_tz)
-            except ValueError:
-                return Response({"success": False, "error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
-
-            payload = {
-                "range": {
-                    "from": start_date.strftime("%Y-%m-%d"),
-                    "to": end_date.strftime("%Y-%m-%d"),
-                    "timezone": "Europe/Amsterdam"
-                },
-                "columns": ["clicks", "day", "lp_clicks", "lp_ctr", "cr", "cpc"],
-                "metrics": [
-                    "clicks", "cost", "campaign_unique_clicks", "conversions",
-                    "roi_confirmed", "revenue", "profit"
-                ],
-                "grouping": ["sub_id_6", "sub_id_5", "sub_id_2", "sub_id_3"],
-                "filters": [],
-                "summary": False,
-                "limit": 100000,
-                "offset": 0,
-                "extended": True
-            }
-
-            headers = {
-                "Api-Key": api_key,
-                "Content-Type": "application/json"
-            }
-
-            response = requests.post(f"{base_url}/report/build", headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-
-            data = response.json()
-
-            # Save raw API response for debugging
-            with open('api_response.json', 'w') as f:
-                json.dump(data, f, indent=4)
-
-            rows = data.get('rows', [])
-            if not rows:
-                return Response({'success': True, 'data': [], 'summary': {}}, status=status.HTTP_200_OK)
-
-            df = pd.DataFrame(rows)
-
-            def is_empty_or_placeholder(val):
-                if pd.isna(val):
-                    return True
-                if isinstance(val, str) and (val.strip() == "" or val.strip().startswith("{{")):
-                    return True
-                return False
-
-            df = df.applymap(lambda x: pd.NA if is_empty_or_placeholder(x) else x)
-
-            for col in ['sub_id_2', 'sub_id_3']:
-                if col in df.columns and df[col].isna().all():
-                    df.drop(columns=col, inplace=True)
-
-            cols_to_check = ['sub_id_6', 'sub_id_5', 'sub_id_3', 'sub_id_2']
-            cols_existing = [col for col in cols_to_check if col in df.columns]
-            df = df.dropna(subset=cols_existing, how='all')
-
-            def extract_geo(sub_id_6):
-                return sub_id_6.split(" - ")[1] if " - " in sub_id_6 else None
-
-            df["geo"] = df["sub_id_6"].apply(extract_geo)
-            df["country"] = df["geo"].apply(extract_country_name)
+                for campaign in query.stream(output, lambda group: enrich_group(group, model_path, view=view)):
+                    line = ndjson_line(campaign)
+                    registry.inc('pipeline_stage_bytes_total', {'view': view, 'stage': 'render'}, len(line))
+                    yield line
+                yield ndjson_line({'type': 'summary', 'success': True, 'summary': totals.summary()})
+            except Exception as e:
+                yield ndjson_line({'type': 'error', 'success': False, 'error': str(e)})
 
-            df = df.groupby('sub_id_2').agg({
-                'cost': 'sum',
-                'revenue': 'sum',
-                'clicks': 'sum',
-                'lp_clicks': 'sum',
-                'conversions': 'sum',
-                'campaign_unique_clicks': 'sum',
-                'sub_id_6': 'first',
-                'sub_id_5': 'first',
-                'sub_id_3': 'first',
-                'day': 'first',
-                'geo': 'first',
-                'country': 'first'
-            }).reset_index()
+        return StreamingHttpResponse(records(), content_type=NDJSONRenderer.media_type)
 
-            df['profit'] = df['revenue'] - df['cost']
-            df['cpc'] = df.apply(lambda x: x['cost'] / x['clicks'] if x['clicks'] > 0 else 0, axis=1)
-            df['roi_confirmed'] = df.apply(lambda x: (x['profit'] / x['cost']) * 100 if x['cost'] > 0 else 0, axis=1)
+    def process(self, data, model_path):
+        """Inference rows for a fetched (non-empty) range report."""
+        run_id = new_run_id()
+        save_raw_report(data, run_id)
 
-            df['lp_ctr'] = df.apply(lambda x: (x['lp_clicks'] / x['clicks']) * 100 if x['clicks'] > 0 else 0, axis=1)
-            df['cr'] = df.apply(lambda x: (x['conversions'] / x['clicks']) * 100 if x['clicks'] > 0 else 0, axis=1)
+        df = aggregate_date_range(clean_report(data['rows'], dedupe=False))
 
-            df.to_csv("media/row_data_time_range.csv", index=False)
-            df.to_json("media/preprocess_data_time_range.json", orient='records', indent=2)
+        return run_live_inference(df, 'preprocess_data_time_range', run_id, model_path)
 
-            data_path = os.path.join(settings.MEDIA_ROOT, 'preprocess_data_time_range.json')
+    def build(self, start_date, end_date, query, model_path):
+        data = fetch_report(build_report_payload(start_date, end_date))
+        if not data.get('rows'):
+            return {'success': True, 'data': [], 'summary': {}}
 
-            processed_data = main(data_path)
-
-            all_data_items = []
-            all_data_items.extend(processed_data)
+        # The range output does not depend on AdsetStatus
+        key = result_key('predict-date-range', start_date, end_date, query.key(), data['fingerprint'], model_path=model_path)
+        body = get_result(key, view=type(self).__name__)
+        if body is not None:
+            return body
 
-            # ----------- New grouping function -----------
-            def group_processed_data(data):
-                grouped = defaultdict(list)
-                for item in data:
-                    key = (item['sub_id_6'], item['sub_id_3'])
-                    grouped[key].append(item)
+        processed_data = self.process(data, model_path)
 
-                output = []
-                for (sub_id_6, sub_id_3), items in grouped.items():
-                    df_group = pd.DataFrame(items)
+        output = group_processed_data(processed_data)
 
-                    total_cost = round(df_group['cost'].sum(), 2)
-                    total_revenue = round(df_group['revenue'].sum(), 2)
-                    total_profit = round(total_revenue - total_cost, 2)
-                    total_clicks = int(round(df_group['clicks'].sum()))
-                    total_conversions = int(round(df_group['conversions'].sum()))
+        final_results, pagination = enrich_results(query, output, model_path=model_path)
 
-                    total_roi = round(((total_revenue - total_cost) / total_cost) * 100, 2) if total_cost > 0 else 0
-                    total_conversion_rate = round((total_conversions / total_clicks) * 100, 2) if total_clicks > 0 else 0
-                    total_cpc = round((total_cost / total_clicks), 2) if total_clicks > 0 else 0
-
-                    # ✅ Pick geo and country from first item in the group
-                    geo = items[0].get("geo")
-                    country = items[0].get("country")
-
-                    output.append({
-                        "id": str(uuid.uuid4()),
-                        "sub_id_6": sub_id_6,
-                        "sub_id_3": sub_id_3,
-                        "total_cost": total_cost,
-                        "total_revenue": total_revenue,
-                        "total_profit": total_profit,
-                        "total_clicks": total_clicks,
-                        "total_cpc": total_cpc,
-                        "geo": geo,
-                        "country": country,
-                        "total_roi": total_roi,
-                        "total_conversion_rate": total_conversion_rate,
-                        "adset": items
-                    })
-                return output
+        summary = build_summary(processed_data)
 
-            output = group_processed_data(processed_data)
+        body = campaign_body(final_results, summary, pagination)
+        put_result(key, body)
+        return body
 
-            model_path = os.path.join(settings.MEDIA_ROOT, 'dbscan_model_bundle_latest.pkl')
+    def get(self, request):
+        try:
+            query = CampaignQuery(request.query_params)
+        except QueryParamError as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            final_results = []
-            for group in output:  # Your grouped campaign list
-                enriched = enrich_campaign_data(group, model_path=model_path)
-                final_results.append(enriched)
+        try:
+            api_key = os.getenv("API_KEY") or getattr(settings, "API_KEY", None)
+            if not api_key:
+                return Response({"success": False, "error": "API_KEY not set."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            summary = {}
-            if all_data_items:
-                summary_df = pd.DataFrame(all_data_items)
-                if not summary_df.empty:
-                    total_cost = round(summary_df['cost'].sum(), 2)
-                    total_revenue = round(summary_df['revenue'].sum(), 2)
-                    total_roi = round(((total_revenue - total_cost) / total_cost) * 100, 2) if total_cost > 0 else 0
+            try:
+                start_date, end_date = parse_date_range(request.query_params)
+            except ValueError:
+                return Response({"success": False, "error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
 
-                    summary = {
-                        "total_adset" : len(summary_df),
-                        "total_cost": round(summary_df['cost'].sum(), 2),
-                        "total_revenue": round(summary_df['revenue'].sum(), 2),
-                        "total_profit": round(summary_df['profit'].sum(), 2),
-                        "total_clicks": int(summary_df['clicks'].sum()),
-                        "total_conversions": int(summary_df['conversions'].sum()),
-                        "total_roi": total_roi,
-                        "average_conversion_rate": round(summary_df['conversion_rate'].mean(), 4),
-                        "priority_distribution": summary_df['priority'].astype(str).value_counts().to_dict()
-                    }
-            else:
-                summary = {}
+            model_path = enrich_model_path()
+            if request.accepted_renderer.format == 'ndjson':
+                data = fetch_report(build_report_payload(start_date, end_date))
+                if not data.get('rows'):
+                    return Response({'success': True, 'data': [], 'summary': {}}, status=status.HTTP_200_OK)
+                processed_data = self.process(data, model_path)
+                return self.stream_ndjson(query, group_processed_data(processed_data), processed_data, model_path)
 
-            return Response({'success': True, 'data': final_results, 'summary': summary}, status=status.HTTP_200_OK)
+            key = flight_key('predict-date-range', start_date, end_date, query.key())
+            body = coalesce(key, lambda: self.build(start_date, end_date, query, model_path), view=type(self).__name__)
+            return Response(body, status=status.HTTP_200_OK)
 
         except requests.RequestException as e:
             return Response({'success': False, 'error': f'API request failed: {str(e)}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -1030,6 +638,52 @@ class PredictDateRangeView(APIView):
         except Exception as e:
             return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def prometheus_metrics(request):
+    """
+    Per-stage pipeline metrics in the Prometheus text format. Protected by
+    ``Authorization: Bearer <METRICS_TOKEN>`` when that setting is set.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class ReadinessView(APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    """
+    Readiness probe. Reports whether this process has the URLconf and model
+    bundles loaded; a process that was not preloaded warms up on first probe.
+    """
+
+    def get(self, request):
+        if not warm_state['ready']:
+            try:
+                warm_up()
+            except Exception as e:
+                return Response({'ready': False, 'pid': os.getpid(), 'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        return Response({
+            'ready': True,
+            'pid': os.getpid(),
+            # Warmed by another pid means it was inherited from the gunicorn master
+            'preloaded': warm_state['pid'] != os.getpid(),
+            'warmup_seconds': warm_state['warmup_seconds'],
+            'bundles': warm_state['bundles'],
+            'model_version': warm_state['model_version'],
+        }, status=status.HTTP_200_OK)
+
+class ModelVersionView(APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    """
+    Model version this process serves and the one MODEL_DIR/CURRENT points
+    at; they differ while a hot-swap is warming up (or after it failed).
+    """
+
+    def get(self, request):
+        return Response(model_info(), status=status.HTTP_200_OK)
+
 class UpdateAdsetStatusAPIView(APIView):
 
     permission_classes = [IsAuthenticated]
@@ -0,0 +1,79 @@
+"""
+Production gunicorn profile.
+
+    gunicorn -c gunicorn.conf.py recom.wsgi:application
+
+The app, the URLconf (pandas/scipy/sklearn, country.json) and the model bundles
+are loaded once in the master (``preload_app``) and inherited copy-on-write by
+the workers; ``gc.freeze()`` keeps the collector from touching (and thereby
+copying) those pages. Each worker limits BLAS/OpenMP pools to
+``WORKER_BLAS_THREADS`` so N workers do not start N x cores threads. The
+adset status scheduler runs in exactly one worker. ``GET /api/ready/`` reports
+the warm state of the worker that answers; ``/metrics`` the totals of all of
+them, shared through ``METRICS_DIR`` (api/utills/metrics.py).
+
+Environment: GUNICORN_BIND, GUNICORN_WORKERS, GUNICORN_TIMEOUT,
+GUNICORN_PRELOAD (1/0), WORKER_BLAS_THREADS, METRICS_DIR.
+
+Memory with 4 sync workers, measured after start-up and 20 ``/api/ready/``
+probes (Python 3.11, Linux x86_64, the bundles shipped in media/). RSS counts
+shared pages in every process; PSS splits them between the processes sharing
+them, so total PSS is what the box actually pays:
+
+    ==================  ==========  ==========  ==========  =============
+    profile             RSS/worker  PSS/worker  master PSS  total PSS
+    ==================  ==========  ==========  ==========  =============
+    GUNICORN_PRELOAD=0  188 MB      138 MB      14 MB       567 MB
+    GUNICORN_PRELOAD=1  135 MB      35 MB       89 MB       233 MB
+    ==================  ==========  ==========  ==========  =============
+
+Per-worker PSS drops ~4x and the total ~2.4x; the gap grows with the worker
+count. Workers are also ready as soon as they fork (0.7s warm-up once in the
+master instead of 3.2s in every worker).
+"""
+import gc
+import multiprocessing
+import os
+import tempfile
+
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# The tracker call alone may take up to 30s
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+accesslog = "-"
+
+WORKER_BLAS_THREADS = int(os.getenv("WORKER_BLAS_THREADS", 1))
+# Read by the settings, so set before the app is loaded
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "recom-metrics"))
+
+
+def on_starting(server):
+    from api.utills.metrics import clear_metrics_dir
+    clear_metrics_dir(os.environ["METRICS_DIR"])
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any fork
+    if not preload_app:
+        return
+    from api.utills.warmup import warm_up
+    state = warm_up()
+    gc.freeze()
+    server.log.info(f"Preloaded {state['bundles']} in {state['warmup_seconds']}s")
+
+
+def post_fork(server, worker):
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=WORKER_BLAS_THREADS)
+
+
+def post_worker_init(worker):
+    from api.utills.warmup import warm_state, warm_up
+    if not warm_state['ready']:
+        warm_up()
+
+    from api.utills.scheduler import start_scheduler_once
+    if start_scheduler_once():
+        worker.log.info("Adset status scheduler running in this worker")
@@ -3,6 +3,10 @@ ASGI config for recom project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run it with an ASGI server (``uvicorn recom.asgi:application``) to get the
+non-blocking ``api/async/...`` prediction endpoints, which await the tracker
+instead of holding a thread for the whole request.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
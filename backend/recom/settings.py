@@ -22,6 +22,114 @@ load_dotenv(os.path.join(BASE_DIR, '.env'))
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Threads used by the async views for the CPU bound clustering/enrichment
+PIPELINE_EXECUTOR_WORKERS = int(os.getenv('PIPELINE_EXECUTOR_WORKERS', 4))
+
+# Processes enriching the campaigns of large reports in parallel
+# (api/utills/enrich_pool.py), per web worker; below 2 enrichment stays in
+# the request's process, as it does for reports with fewer adsets than
+# ENRICH_PARALLEL_MIN_ADSETS
+ENRICH_PROCESSES = int(os.getenv('ENRICH_PROCESSES', 0))
+ENRICH_PARALLEL_MIN_ADSETS = int(os.getenv('ENRICH_PARALLEL_MIN_ADSETS', 5000))
+
+# Parquet snapshots of every raw report and inference result (api/utills/snapshots.py)
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(MEDIA_ROOT, 'snapshots'))
+SNAPSHOT_KEEP_DAYS = int(os.getenv('SNAPSHOT_KEEP_DAYS', 30))
+# Snapshots waiting for the writer thread; more are dropped (and counted)
+SNAPSHOT_QUEUE_SIZE = int(os.getenv('SNAPSHOT_QUEUE_SIZE', 4))
+
+# Versioned model bundles written by `manage.py train_model`; MODEL_DIR/CURRENT
+# names the one to serve (api/utills/model_store.py). Workers look for a new
+# CURRENT every MODEL_CHECK_INTERVAL seconds
+MODEL_DIR = os.getenv('MODEL_DIR', os.path.join(MEDIA_ROOT, 'models'))
+MODEL_CHECK_INTERVAL = float(os.getenv('MODEL_CHECK_INTERVAL', 5))
+# 'refit' clusters every batch from scratch; 'core' labels each adset from
+# the core points of the served bundle and caches its cluster and
+# recommendation per adset (api/utills/assignment.py), bounded by entries
+# and approximate bytes
+CLUSTER_ASSIGNMENT = os.getenv('CLUSTER_ASSIGNMENT', 'refit')
+CLUSTER_CACHE_MAX_ENTRIES = int(os.getenv('CLUSTER_CACHE_MAX_ENTRIES', 200000))
+CLUSTER_CACHE_MAX_BYTES = int(os.getenv('CLUSTER_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# add_cpc_level() bands each adset's CPC against the CPC mean/std of its geo:
+# 'batch' computes them from the same report, 'geo' reads the per-geo
+# reference the scheduler folds every finished day into (GeoCpcStats,
+# api/utills/geo_cpc.py), reloaded every CPC_REFERENCE_REFRESH seconds. Geos
+# with fewer than CPC_REFERENCE_MIN_COUNT reference rows use the batch
+CPC_REFERENCE = os.getenv('CPC_REFERENCE', 'batch')
+CPC_REFERENCE_MIN_COUNT = int(os.getenv('CPC_REFERENCE_MIN_COUNT', 30))
+CPC_REFERENCE_REFRESH = float(os.getenv('CPC_REFERENCE_REFRESH', 300))
+
+# Per-adset trends over the last ADSET_TREND_DAYS reported days (AdsetTrend,
+# api/utills/trends.py), folded in by the scheduler once a day: with
+# ADSET_TRENDS=1 every inference result gets rolling_roi, spend_slope,
+# cr_slope, roi_day1 and roi_day2, reloaded every ADSET_TREND_REFRESH seconds
+ADSET_TRENDS = os.getenv('ADSET_TRENDS', '0') == '1'
+ADSET_TREND_DAYS = int(os.getenv('ADSET_TREND_DAYS', 7))
+ADSET_TREND_REFRESH = float(os.getenv('ADSET_TREND_REFRESH', 300))
+
+# Upstream APIs; point both at `manage.py tracker_stub` for offline load tests
+TRACKER_BASE_URL = os.getenv('TRACKER_BASE_URL', 'https://tracktheweb.online/admin_api/v1')
+TRACKER_PAGE_SIZE = int(os.getenv('TRACKER_PAGE_SIZE', 100000))
+# Filters the daily views push into the tracker report: with
+# TRACKER_EXCLUDE_PAUSED=1 paused adsets are left out (at most
+# TRACKER_EXCLUDE_PAUSED_MAX of them, no exclusion at all above that). Off by
+# default: the rows DBSCAN is fitted on then depend on the status table, and
+# every status change alters the request, so the report is re-fetched and
+# re-clustered instead of patched in place. Rows below the optional
+# cost/clicks minimums are never sent (which, like the exclusion, changes
+# the batch DBSCAN and the CPC bands are computed on)
+TRACKER_EXCLUDE_PAUSED = os.getenv('TRACKER_EXCLUDE_PAUSED', '0') == '1'
+TRACKER_EXCLUDE_PAUSED_MAX = int(os.getenv('TRACKER_EXCLUDE_PAUSED_MAX', 1000))
+TRACKER_MIN_COST = float(os.environ['TRACKER_MIN_COST']) if os.getenv('TRACKER_MIN_COST') else None
+TRACKER_MIN_CLICKS = int(os.environ['TRACKER_MIN_CLICKS']) if os.getenv('TRACKER_MIN_CLICKS') else None
+ADSET_STATUS_API_BASE = os.getenv('ADSET_STATUS_API_BASE', 'http://app.wijte.me/api/adset/status/')
+
+# Bearer token required by /metrics; leave unset to expose it unauthenticated
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Directory the worker processes share their metrics through, so a scrape of
+# any worker returns the totals of all of them; unset, /metrics only covers
+# the process that answers (fine for runserver or a single worker)
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+
+# ?profile=save keeps raw cProfile dumps here, newest PROFILE_KEEP only
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 20))
+
+# The 'pipeline' cache coordinates identical concurrent prediction requests
+# across workers (api/utills/singleflight.py), so it must be shared by all of
+# them: the database cache (table created by migrate) or e.g. Redis via
+# PIPELINE_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pipeline': {
+        'BACKEND': os.getenv('PIPELINE_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.getenv('PIPELINE_CACHE_LOCATION', 'pipeline_cache'),
+    },
+    # Enriched prediction responses (api/utills/result_cache.py): per process
+    # in memory, or shared on disk with
+    # RESULT_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+    'results': {
+        'BACKEND': os.getenv('RESULT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('RESULT_CACHE_LOCATION', 'prediction-results'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 100))},
+    },
+}
+RESULT_CACHE = 'results'
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', 24 * 60 * 60))
+# Daily reports whose per-campaign results each worker keeps for incremental
+# recomputes after a status change (api/utills/incremental.py)
+INCREMENTAL_STATES = int(os.getenv('INCREMENTAL_STATES', 2))
+SINGLEFLIGHT_CACHE = 'pipeline'
+# A leader that died releases its lock after this long (matches the gunicorn timeout)
+SINGLEFLIGHT_LOCK_TTL = int(os.getenv('SINGLEFLIGHT_LOCK_TTL', 120))
+# Followers give up waiting and compute themselves after this long
+SINGLEFLIGHT_WAIT = float(os.getenv('SINGLEFLIGHT_WAIT', SINGLEFLIGHT_LOCK_TTL))
+SINGLEFLIGHT_POLL = 0.1
+SINGLEFLIGHT_RESULT_TTL = 30
+
 
 
 
@@ -62,6 +170,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.DiagnosticsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -18,11 +18,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from api.views import prometheus_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('auth/', include('authapp.urls')),
+    path('metrics', prometheus_metrics, name='metrics'),
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 